@@ -0,0 +1,254 @@
+import array
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from vector_store import GrowableMatrix, top_k_indices
+
+
+class ExactIndex:
+    """Brute-force inner product search over every row; the reference for recall"""
+
+    name = 'exact'
+
+    def is_ready(self, count: int) -> bool:
+        return False
+
+    def load(self, embeddings: np.ndarray) -> None:
+        pass
+
+    def add(self, embeddings: np.ndarray, rows: range) -> None:
+        pass
+
+    def refresh(self) -> None:
+        pass
+
+    def maybe_train(self, embeddings: np.ndarray) -> bool:
+        return False
+
+    def search(self, embeddings: np.ndarray, query_vector: np.ndarray, k: int,
+               nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        scores = embeddings @ query_vector
+        rows = top_k_indices(scores, k)
+        return rows, scores[rows]
+
+    def stats(self) -> Dict:
+        return {'backend': self.name}
+
+
+class IVFIndex(ExactIndex):
+    """Inverted-file ANN index over unit vectors, CPU-only and dependency-free
+
+    A spherical k-means coarse quantizer splits the corpus into ``nlist`` lists.
+    A query scores the centroids, then scans only the ``nprobe`` closest lists.
+    New rows are assigned to their nearest centroid on insert. The quantizer is
+    retrained once the corpus has grown ``retrain_factor`` times since the last
+    training. Centroids and row assignments are persisted so a restart does not
+    retrain.
+    """
+
+    name = 'ivf'
+    CENTROIDS_FILE = 'ivf_centroids.npy'
+    ASSIGNMENTS_FILE = 'ivf_assignments.i32'
+    META_FILE = 'ivf.json'
+
+    def __init__(self, path: str, min_documents: int = 20000, nprobe: int = 8,
+                 retrain_factor: float = 4.0, kmeans_iterations: int = 10, seed: int = 0):
+        self.path = path
+        self.min_documents = min_documents
+        self.nprobe = nprobe
+        self.retrain_factor = retrain_factor
+        self.kmeans_iterations = kmeans_iterations
+        self.seed = seed
+        self._lock = threading.Lock()
+        # (centroids, inverted lists, trained row count) swapped as one reference
+        self._state = None
+        self._assignments: Optional[GrowableMatrix] = None
+        # Why the last training failed; searches then scan exactly
+        self._training_error: Optional[str] = None
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def is_ready(self, count: int) -> bool:
+        return self._state is not None and count >= self.min_documents
+
+    def load(self, embeddings: np.ndarray) -> None:
+        """Restore a persisted quantizer and assign any rows added since it was saved"""
+        try:
+            with open(self._file(self.META_FILE)) as f:
+                meta = json.load(f)
+            centroids = np.load(self._file(self.CENTROIDS_FILE))
+        except (FileNotFoundError, ValueError):
+            self.maybe_train(embeddings)
+            return
+
+        if centroids.shape[1] != embeddings.shape[1]:
+            self.maybe_train(embeddings)
+            return
+
+        stored = min(meta['count'], len(embeddings))
+        self._assignments = GrowableMatrix(1, dtype=np.int32, path=self._file(self.ASSIGNMENTS_FILE), count=stored)
+        lists = self._build_lists(self._assignments.view()[:, 0], len(centroids))
+        self._state = (centroids, lists, meta['trained_on'])
+        if stored < len(embeddings):
+            self.add(embeddings, range(stored, len(embeddings)))
+        self.maybe_train(embeddings)
+
+    @staticmethod
+    def _build_lists(assignments: np.ndarray, nlist: int) -> List[array.array]:
+        order = np.argsort(assignments, kind='stable')
+        bounds = np.searchsorted(assignments[order], np.arange(nlist + 1))
+        return [array.array('q', order[bounds[i]:bounds[i + 1]].tolist()) for i in range(nlist)]
+
+    @staticmethod
+    def _assign(centroids: np.ndarray, vectors: np.ndarray, batch_size: int = 65536) -> np.ndarray:
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), batch_size):
+            block = vectors[start:start + batch_size] @ centroids.T
+            assignments[start:start + batch_size] = np.argmax(block, axis=1)
+        return assignments
+
+    def _kmeans(self, embeddings: np.ndarray, nlist: int) -> np.ndarray:
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(len(embeddings), nlist * 64)
+        sample = np.asarray(embeddings[np.sort(rng.choice(len(embeddings), sample_size, replace=False))],
+                            dtype=np.float32)
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(self.kmeans_iterations):
+            labels = self._assign(centroids, sample)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            empty = np.bincount(labels, minlength=nlist) == 0
+            # Re-seed empty lists with random points so every list stays usable
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = sums / norms
+
+        return centroids.astype(np.float32)
+
+    def maybe_train(self, embeddings: np.ndarray) -> bool:
+        """(Re)train the quantizer when the corpus crossed the size thresholds"""
+        count = len(embeddings)
+        state = self._state
+        if count < self.min_documents:
+            return False
+        if state is not None and count < state[2] * self.retrain_factor:
+            return False
+
+        # At least 39 training points per list, as faiss recommends, and never more lists than rows
+        nlist = max(1, min(int(np.clip(4 * np.sqrt(count), 16, 65536)), count // 39))
+        try:
+            centroids = self._kmeans(embeddings, nlist)
+            assignments = self._assign(centroids, embeddings)
+        except Exception as exc:
+            # Keep serving: without a quantizer (or with the previous one) searches still work
+            self._training_error = f"{type(exc).__name__}: {exc}"
+            return False
+        self._training_error = None
+
+        with self._lock:
+            assignments_path = self._file(self.ASSIGNMENTS_FILE)
+            if os.path.exists(assignments_path):
+                os.remove(assignments_path)
+            self._assignments = GrowableMatrix(1, dtype=np.int32, path=assignments_path)
+            self._assignments.append(assignments.reshape(-1, 1))
+            self._state = (centroids, self._build_lists(assignments, nlist), count)
+            np.save(self._file(self.CENTROIDS_FILE), centroids)
+            self._commit()
+        return True
+
+    def _commit(self) -> None:
+        self._assignments.flush()
+        tmp_path = self._file(self.META_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'count': len(self._assignments), 'trained_on': self._state[2]}, f)
+        os.replace(tmp_path, self._file(self.META_FILE))
+
+    def add(self, embeddings: np.ndarray, rows: range) -> None:
+        """Assign newly appended rows to their nearest lists"""
+        state = self._state
+        if state is None or not len(rows):
+            return
+
+        centroids, lists, _ = state
+        assignments = self._assign(centroids, np.asarray(embeddings[rows.start:rows.stop]))
+        with self._lock:
+            for row, list_id in zip(rows, assignments):
+                lists[list_id].append(row)
+            self._assignments.append(assignments.reshape(-1, 1))
+            self._commit()
+
+    def refresh(self) -> None:
+        """Adopt row assignments, or a retrained quantizer, committed by another process"""
+        try:
+            with open(self._file(self.META_FILE)) as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+
+        state = self._state
+        with self._lock:
+            if state is None or meta['trained_on'] != state[2]:
+                centroids = np.load(self._file(self.CENTROIDS_FILE))
+                self._assignments = GrowableMatrix(1, dtype=np.int32, path=self._file(self.ASSIGNMENTS_FILE),
+                                                   count=meta['count'])
+                lists = self._build_lists(self._assignments.view()[:, 0], len(centroids))
+                self._state = (centroids, lists, meta['trained_on'])
+                return
+
+            start = len(self._assignments)
+            self._assignments.refresh(meta['count'])
+            for row, list_id in enumerate(self._assignments.view()[start:, 0], start=start):
+                state[1][list_id].append(row)
+
+    def search(self, embeddings: np.ndarray, query_vector: np.ndarray, k: int,
+               nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        state = self._state
+        if state is None:
+            return super().search(embeddings, query_vector, k)
+
+        centroids, lists, _ = state
+        probes = top_k_indices(centroids @ query_vector, nprobe or self.nprobe)
+        rows = np.concatenate([np.array(lists[p], dtype=np.int64) for p in probes])
+        # Lists may already hold rows that are newer than the caller's view
+        rows = rows[rows < len(embeddings)]
+
+        scores = embeddings[rows] @ query_vector
+        best = top_k_indices(scores, k)
+        return rows[best], scores[best]
+
+    def stats(self) -> Dict:
+        state = self._state
+        return {
+            'backend': self.name,
+            'trained': state is not None,
+            'nlist': len(state[0]) if state else 0,
+            'trained_on': state[2] if state else 0,
+            'nprobe': self.nprobe,
+            'min_documents': self.min_documents,
+            'training_error': self._training_error,
+        }
+
+
+def measure_recall(index: ExactIndex, embeddings: np.ndarray, k: int = 10, sample_size: int = 100,
+                   nprobe: Optional[int] = None, seed: int = 0) -> float:
+    """Recall@k of ``index`` against exact search, using stored vectors as queries"""
+    if not len(embeddings):
+        return 1.0
+
+    rng = np.random.default_rng(seed)
+    queries = rng.choice(len(embeddings), min(sample_size, len(embeddings)), replace=False)
+    exact = ExactIndex()
+    hits = 0
+    total = 0
+    for row in queries:
+        query_vector = np.asarray(embeddings[row])
+        expected = set(exact.search(embeddings, query_vector, k)[0].tolist())
+        found = set(index.search(embeddings, query_vector, k, nprobe=nprobe)[0].tolist())
+        hits += len(expected & found)
+        total += len(expected)
+    return hits / total if total else 1.0
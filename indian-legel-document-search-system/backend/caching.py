@@ -0,0 +1,307 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    """Cache key for a query: case-folded with whitespace collapsed
+
+    all-MiniLM-L6-v2 uses an uncased tokenizer, so case does not change the embedding.
+    """
+    return ' '.join(query.lower().split())
+
+
+def content_hash(text: str) -> bytes:
+    """SHA-256 of the text normalized like a query: texts that embed identically share a hash"""
+    return hashlib.sha256(normalize_query(text).encode('utf-8')).digest()
+
+
+def text_hash(text: str) -> bytes:
+    """SHA-256 of the exact text, for values that depend on every character"""
+    return hashlib.sha256(text.encode('utf-8')).digest()
+
+
+class ContentHasher:
+    """``content_hash`` of a text fed in pieces, without holding the text
+
+    A word cut by a piece boundary is held back until the next piece completes it.
+    """
+
+    def __init__(self):
+        self._sha256 = hashlib.sha256()
+        self._tail = ''
+        self._empty = True
+
+    def _write(self, words: List[str]) -> None:
+        if words:
+            self._sha256.update((('' if self._empty else ' ') + ' '.join(words).lower()).encode('utf-8'))
+            self._empty = False
+
+    def update(self, piece: str) -> None:
+        text = self._tail + piece
+        words = text.split()
+        self._tail = words.pop() if words and not text[-1].isspace() else ''
+        self._write(words)
+
+    def digest(self) -> bytes:
+        self._write([self._tail] if self._tail else [])
+        self._tail = ''
+        return self._sha256.digest()
+
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by entry count and/or bytes, with optional TTL"""
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 ttl: Optional[float] = None, sizeof: Callable[[Any], int] = lambda value: 1):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[1] > self.ttl:
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic(), size)
+            self.bytes += size
+
+            while self._entries and (
+                (self.max_entries is not None and len(self._entries) > self.max_entries)
+                or (self.max_bytes is not None and self.bytes > self.max_bytes)
+            ):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, size = self._entries.pop(key)
+        self.bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+
+
+class QueryEmbeddingCache:
+    """Query embeddings keyed on the normalized query text
+
+    A bounded in-process LRU tier sits in front of an optional SQLite tier that
+    can be shared by several processes and survives restarts. Entries are also
+    keyed by model name so switching models never serves stale vectors.
+    """
+
+    def __init__(self, model_name: str, max_bytes: int = 64 * 1024 * 1024, ttl: Optional[float] = None,
+                 disk_path: Optional[str] = None):
+        self.model_name = model_name
+        self.ttl = ttl
+        self.memory = LRUCache(max_bytes=max_bytes, ttl=ttl, sizeof=lambda vector: vector.nbytes)
+        self.disk_hits = 0
+        self._db = None
+        self._db_lock = threading.Lock()
+
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS query_embeddings ('
+                'model TEXT, query TEXT, vector BLOB, created REAL, PRIMARY KEY (model, query))'
+            )
+            self._db.commit()
+
+    def _disk_get(self, key: str) -> Optional[np.ndarray]:
+        with self._db_lock:
+            row = self._db.execute(
+                'SELECT vector, created FROM query_embeddings WHERE model = ? AND query = ?',
+                (self.model_name, key)
+            ).fetchone()
+        if row is None or (self.ttl and time.time() - row[1] > self.ttl):
+            return None
+        return np.frombuffer(row[0], dtype=np.float32)
+
+    def _disk_put(self, key: str, vector: np.ndarray) -> None:
+        with self._db_lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO query_embeddings VALUES (?, ?, ?, ?)',
+                (self.model_name, key, vector.astype(np.float32).tobytes(), time.time())
+            )
+            self._db.commit()
+
+    def get_or_encode(self, query: str, encode: Callable[[str], np.ndarray]) -> np.ndarray:
+        """Return the cached vector for ``query`` or compute it with ``encode`` and cache it"""
+        key = normalize_query(query)
+        vector = self.memory.get(key)
+        if vector is not None:
+            return vector
+
+        if self._db is not None:
+            vector = self._disk_get(key)
+            if vector is not None:
+                self.disk_hits += 1
+                self.memory.put(key, vector)
+                return vector
+
+        vector = np.asarray(encode(key), dtype=np.float32)
+        vector.flags.writeable = False
+        self.memory.put(key, vector)
+        if self._db is not None:
+            self._disk_put(key, vector)
+        return vector
+
+    def get_or_encode_many(self, queries: List[str], encode_batch: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Vectors for many queries; every miss is encoded in a single batched call"""
+        keys = [normalize_query(query) for query in queries]
+        vectors: Dict[str, np.ndarray] = {}
+        for key in keys:
+            if key not in vectors:
+                vector = self.memory.get(key)
+                if vector is None and self._db is not None:
+                    vector = self._disk_get(key)
+                    if vector is not None:
+                        self.disk_hits += 1
+                        self.memory.put(key, vector)
+                if vector is not None:
+                    vectors[key] = vector
+
+        misses = [key for key in dict.fromkeys(keys) if key not in vectors]
+        if misses:
+            for key, vector in zip(misses, np.asarray(encode_batch(misses), dtype=np.float32)):
+                vector.flags.writeable = False
+                vectors[key] = vector
+                self.memory.put(key, vector)
+                if self._db is not None:
+                    self._disk_put(key, vector)
+
+        return np.stack([vectors[key] for key in keys])
+
+    def stats(self) -> Dict[str, float]:
+        stats = self.memory.stats()
+        stats['disk_enabled'] = self._db is not None
+        stats['disk_hits'] = self.disk_hits
+        return stats
+
+
+class EmbeddingCache:
+    """Passage embeddings keyed by model name and the hash of the exact passage text, in SQLite
+
+    Survives restarts and rebuilds of the index and can be shared by several
+    processes, so text that was embedded once is never sent to the model again.
+    Vectors are stored exactly as the model returned them, so the key is the text
+    exactly as it was sent: a passage differing only in case or spacing is encoded
+    on its own.
+    """
+
+    # Keys per lookup query; SQLite allows 999 bound parameters by default
+    LOOKUP_CHUNK = 500
+    # Rows of the older passage_embeddings table were keyed by the normalized text
+    TABLE = 'passage_text_embeddings'
+
+    def __init__(self, path: str, model_name: str):
+        self.path = path
+        self.model_name = model_name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            f'CREATE TABLE IF NOT EXISTS {self.TABLE} ('
+            'model TEXT, hash BLOB, vector BLOB, PRIMARY KEY (model, hash)) WITHOUT ROWID'
+        )
+        self._db.commit()
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """Stored vectors for whichever of ``keys`` are cached"""
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), self.LOOKUP_CHUNK):
+                chunk = keys[start:start + self.LOOKUP_CHUNK]
+                rows = self._db.execute(
+                    f'SELECT hash, vector FROM {self.TABLE} WHERE model = ? AND hash IN ({",".join("?" * len(chunk))})',
+                    (self.model_name, *chunk)
+                )
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def put_many(self, items: Iterable[Tuple[bytes, np.ndarray]]) -> None:
+        with self._lock:
+            self._db.executemany(
+                f'INSERT OR IGNORE INTO {self.TABLE} VALUES (?, ?, ?)',
+                [(self.model_name, key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items]
+            )
+            self._db.commit()
+
+    def get_or_encode_many(self, texts: List[str], encode_batch: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Vectors for ``texts`` in order; distinct texts missing from the cache are encoded in one call"""
+        if not texts:
+            return encode_batch(texts)
+
+        keys = [text_hash(text) for text in texts]
+        vectors = self.get_many(list(dict.fromkeys(keys)))
+        misses: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                misses.setdefault(key, text)
+
+        if misses:
+            encoded = np.asarray(encode_batch(list(misses.values())), dtype=np.float32)
+            self.put_many(zip(misses, encoded))
+            vectors.update(zip(misses, encoded))
+
+        with self._lock:
+            self.hits += len(texts) - len(misses)
+            self.misses += len(misses)
+        return np.stack([vectors[key] for key in keys])
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            'path': self.path,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
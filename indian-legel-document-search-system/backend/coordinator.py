@@ -0,0 +1,399 @@
+"""Scatter-gather search over a corpus split into shards served by separate processes
+
+Usage (from ``backend/``)::
+
+    python coordinator.py --shards 4                  # start 4 shard processes and the coordinator
+    SHARD_URLS=http://127.0.0.1:8101,http://127.0.0.1:8102 uvicorn coordinator:app --port 8000
+
+Every shard is a regular ``main:app`` process (or several uvicorn workers) with its
+own ``INDEX_DIR``, so it holds its own vectors, entity counts and postings and
+scans them on its own cores. The coordinator encodes each ``/search/compare`` query
+once and fans it out in three rounds:
+
+1. ``/shard/stats``: corpus-wide BM25 statistics and the best entity match score,
+   so BM25 and hybrid scores compare across shards
+2. ``/shard/search``: every shard's top candidates per method, by row, without content
+3. ``/shard/documents``: the content of the results that survive the merge
+
+Cosine, hybrid and BM25 take the best top_k of the merged lists; Euclidean scores are
+rescaled to the largest distance of any shard; MMR selects from the best candidates
+of all shards together, as it would on one index. A shard that does not answer a
+round within ``SHARD_TIMEOUT`` seconds is left out of the rest of the search and
+reported under ``shards``, so a slow shard costs one timeout, not one per round.
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import requests
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from extraction import spool
+from lexical_index import merge_statistics
+from sharding import pack_vector, shard_for, unpack_vector
+import main
+
+
+class ShardedComparisonResult(main.ComparisonResult):
+    shards: Dict
+
+
+class ShardClient:
+    """JSON over HTTP to one shard; each thread keeps its own pooled connection"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip('/')
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def get(self, path: str, timeout: float):
+        response = self._session().get(self.url + path, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def post(self, path: str, body: Dict, timeout: float):
+        response = self._session().post(self.url + path, json=body, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+SHARD_URLS = [url for url in os.environ.get("SHARD_URLS", "").split(",") if url]
+# Seconds each round of a coordinated search waits for the shards still in it
+SHARD_TIMEOUT = float(os.environ.get("SHARD_TIMEOUT", "2"))
+# Parent of the shard_<i> index directories of shards started by ``python coordinator.py``
+SHARD_INDEX_DIR = os.environ.get("SHARD_INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "index_shards"))
+
+shards = [ShardClient(url) for url in SHARD_URLS]
+shard_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("SHARD_CONNECTIONS", "32")),
+                                    thread_name_prefix="shard")
+
+
+def scatter(requests_by_shard: Dict[int, Tuple[str, Dict]], missing: Dict[int, str]) -> Dict[int, object]:
+    """POST to several shards at once; shards that fail or time out go to ``missing``"""
+    futures = {
+        shard_executor.submit(shards[shard].post, path, body, SHARD_TIMEOUT): shard
+        for shard, (path, body) in requests_by_shard.items()
+    }
+    done, not_done = wait(futures, timeout=SHARD_TIMEOUT)
+    responses = {}
+    for future in done:
+        shard = futures[future]
+        try:
+            responses[shard] = future.result()
+        except Exception as e:
+            missing[shard] = str(e) or type(e).__name__
+    for future in not_done:
+        missing[futures[future]] = f"no answer within {SHARD_TIMEOUT:g}s"
+    return responses
+
+
+def merge_top_k(candidates: List[Tuple[int, Dict]], k: int) -> List[Tuple[int, Dict]]:
+    """The k best (shard, candidate) pairs by score; ties go to the lower shard and row"""
+    return sorted(candidates, key=lambda pair: (-pair[1]["score"], pair[0], pair[1]["row"]))[:k]
+
+
+def merge_mmr(candidates: List[Tuple[int, Dict]], top_k: int, candidate_pool: int,
+              lambda_param: float) -> List[Tuple[int, Dict]]:
+    """MMR over the ``candidate_pool`` most relevant candidates of all shards together"""
+    pool = merge_top_k(candidates, max(candidate_pool, top_k))
+    if not pool:
+        return []
+    relevance_scores = np.array([item["score"] for _, item in pool], dtype=np.float32)
+    embeddings = np.stack([unpack_vector(item["embedding"]) for _, item in pool])
+    return [pool[i] for i in main.mmr_select(relevance_scores, embeddings, top_k, lambda_param)]
+
+
+def rescale_euclidean(responses: Dict[int, Dict]) -> List[Tuple[int, Dict]]:
+    """Euclidean candidates rescored as 1 - distance / (largest distance of any shard)"""
+    max_distance = max(response["max_distance"] for response in responses.values()) or 1.0
+    candidates = []
+    for shard, response in responses.items():
+        for item in response["euclidean"]:
+            # Each shard scored 1 - distance / its own maximum distance
+            distance = (1.0 - item["score"]) * response["max_distance"]
+            candidates.append((shard, dict(item, score=1.0 - distance / max_distance)))
+    return candidates
+
+
+def coordinated_search(request: main.SearchRequest) -> ShardedComparisonResult:
+    """Fan one comparison out to every shard and merge the answers"""
+    require_shards()
+    missing: Dict[int, str] = {}
+
+    def shards_report() -> Dict:
+        return {
+            "queried": len(shards),
+            "answered": len(shards) - len(missing),
+            "missing": {shards[shard].url: error for shard, error in sorted(missing.items())},
+        }
+
+    # Round 1: statistics only; filters narrow the entity maximum to the partition
+    stats_body = {"query": request.query, "filters": jsonable_encoder(request.filters)}
+    stats = scatter({shard: ("/shard/stats", stats_body) for shard in range(len(shards))}, missing)
+    if not stats:
+        raise HTTPException(status_code=504, detail={"detail": "No shard answered", "shards": shards_report()})
+
+    cache_key = main.response_cache_key(request, tuple(sorted((shard, stats[shard]["version"]) for shard in stats)))
+    cached = main.response_cache.get(cache_key) if not missing else None
+    if cached is not None:
+        return cached
+
+    query_vector = main.encode_query(request.query)
+    body = jsonable_encoder(request)
+    body.update(
+        query_vector=pack_vector(query_vector),
+        max_entity_score=max(part["max_entity_score"] for part in stats.values()),
+        lexical_statistics=merge_statistics([part["lexical"] for part in stats.values()])
+    )
+
+    # Round 2: every shard's candidates
+    responses = scatter({shard: ("/shard/search", body) for shard in stats}, missing)
+    if not responses:
+        raise HTTPException(status_code=504, detail={"detail": "No shard answered", "shards": shards_report()})
+
+    def gathered(method: str) -> List[Tuple[int, Dict]]:
+        return [(shard, item) for shard, response in responses.items() for item in response[method]]
+
+    merged = {
+        "cosine": merge_top_k(gathered("cosine"), request.top_k),
+        "euclidean": merge_top_k(rescale_euclidean(responses), request.top_k),
+        "mmr": merge_mmr(gathered("mmr"), request.top_k, request.mmr_candidates, request.lambda_param),
+        "hybrid": merge_top_k(gathered("hybrid"), request.top_k),
+        "bm25": merge_top_k(gathered("bm25"), request.top_k),
+    }
+
+    # Round 3: content of the surviving results only
+    rows: Dict[int, List[int]] = {}
+    for results in merged.values():
+        for shard, item in results:
+            if item["row"] not in rows.setdefault(shard, []):
+                rows[shard].append(item["row"])
+    fetched = scatter({shard: ("/shard/documents", {"rows": shard_rows}) for shard, shard_rows in rows.items()},
+                      missing)
+    documents = {(shard, row): doc for shard, docs in fetched.items() for row, doc in zip(rows[shard], docs)}
+
+    results = {
+        method: [
+            main.SearchResult(
+                document_id=item["document_id"],
+                title=documents[shard, item["row"]]["title"],
+                content=documents[shard, item["row"]]["content"],
+                score=item["score"],
+                method=method,
+                passage=item.get("passage")
+            )
+            for shard, item in candidates if (shard, item["row"]) in documents
+        ]
+        for method, candidates in merged.items()
+    }
+
+    # Relevance is pooled over the returned results, as in main.calculate_metrics
+    relevant_docs = {item["document_id"] for candidates in merged.values() for _, item in candidates if item["relevant"]}
+    embeddings = {item["document_id"]: item["embedding"] for candidates in merged.values() for _, item in candidates}
+    metrics = main.result_metrics(
+        results,
+        relevant_docs,
+        len(relevant_docs),
+        lambda document_id: unpack_vector(embeddings[document_id])
+    )
+
+    result = ShardedComparisonResult(
+        query=request.query,
+        cosine_results=results["cosine"],
+        euclidean_results=results["euclidean"],
+        mmr_results=results["mmr"],
+        hybrid_results=results["hybrid"],
+        bm25_results=results["bm25"],
+        metrics=metrics,
+        shards=shards_report()
+    )
+    # A partial answer is not cached: the missing shards may be back for the next request
+    if not missing:
+        main.response_cache.put(cache_key, result)
+    return result
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The coordinator only needs the encoder; shards load their own indexes
+    if main.WARMUP_ON_STARTUP:
+        threading.Thread(target=main.encode_texts, args=(["warm up"],), name="warm-up", daemon=True).start()
+    yield
+
+
+app = FastAPI(title="Indian Legal Document Search System (coordinator)", lifespan=lifespan)
+
+
+@app.get("/")
+async def root():
+    return {"message": "Indian Legal Document Search System API (coordinator)", "shards": SHARD_URLS}
+
+
+@app.get("/health/live")
+async def liveness():
+    return {"status": "alive"}
+
+
+def shard_readiness() -> List[Dict]:
+    def probe(client: ShardClient) -> Dict:
+        try:
+            response = client._session().get(client.url + "/health/ready", timeout=SHARD_TIMEOUT)
+            return {"url": client.url, "ready": response.status_code == 200, "documents": response.json().get("documents")}
+        except Exception as e:
+            return {"url": client.url, "ready": False, "error": str(e)}
+    return list(shard_executor.map(probe, shards))
+
+
+@app.get("/health/ready")
+async def readiness():
+    """Ready when the encoder is loaded and every shard reports ready"""
+    shard_states = await main.run_in_pool(main.search_executor, shard_readiness)
+    ready = main.model is not None and bool(shards) and all(state["ready"] for state in shard_states)
+    body = {"ready": ready, "model": main.model is not None, "shards": shard_states}
+    return JSONResponse(status_code=200 if ready else 503, content=body)
+
+
+@app.post("/search/compare", response_model=ShardedComparisonResult)
+async def compare_search_methods(request: main.SearchRequest):
+    """Compare all similarity methods across every shard; missing shards are reported, not fatal"""
+    try:
+        return await asyncio.wait_for(
+            main.run_in_pool(main.search_executor, coordinated_search, request),
+            timeout=main.SEARCH_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Search exceeded {main.SEARCH_TIMEOUT:.0f}s")
+
+
+def require_shards() -> None:
+    if not shards:
+        raise HTTPException(status_code=503, detail="No shards configured; set SHARD_URLS")
+
+
+def file_digest(path: str) -> bytes:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def forward_upload(path: str, filename: str) -> Tuple[int, Dict]:
+    """Send a spooled upload to the shard its bytes hash to, which parses it
+
+    The coordinator never parses uploads. The receiving shard hashes the extracted
+    text and, if another shard owns it, forwards the text there, so the document
+    still meets its duplicates on the shard its content routes to.
+    """
+    shard = shard_for(file_digest(path), len(shards))
+    with open(path, 'rb') as f:
+        client = shards[shard]
+        response = client._session().post(client.url + "/upload", files={"file": (filename, f)},
+                                          timeout=main.UPLOAD_TIMEOUT)
+    if response.status_code >= 400:
+        raise HTTPException(status_code=response.status_code, detail=response.json().get("detail"))
+    return shard, response.json()
+
+
+@app.post("/upload", status_code=202)
+async def upload_document(file: UploadFile = File(...)):
+    """Queue a document for indexing on a shard; the job id names the shard"""
+    require_shards()
+    path = await main.run_in_pool(main.search_executor, spool, file.file, os.path.splitext(file.filename)[1],
+                                  main.UPLOAD_SPOOL_DIR)
+    try:
+        shard, job = await main.run_in_pool(main.search_executor, forward_upload, path, file.filename)
+    finally:
+        os.remove(path)
+    return {**job, "job_id": f"{shard}-{job['job_id']}"}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status of an ingestion job on the shard that runs it"""
+    require_shards()
+    shard, _, shard_job_id = job_id.partition("-")
+    if not shard.isdigit() or int(shard) >= len(shards):
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    shard = int(shard)
+    try:
+        job = await main.run_in_pool(main.search_executor, shards[shard].get, f"/jobs/{shard_job_id}", SHARD_TIMEOUT)
+        if job["status"] == "forwarded":
+            # The text went on to the shard that owns it; that job has the outcome
+            shard = job["shard"]
+            job = await main.run_in_pool(main.search_executor, shards[shard].get,
+                                         f"/jobs/{job['forwarded_job_id']}", SHARD_TIMEOUT)
+    except requests.HTTPError as e:
+        raise HTTPException(status_code=e.response.status_code, detail=f"Unknown job {job_id}")
+    return {**job, "id": job_id, "shard": shard}
+
+
+@app.get("/index/stats")
+async def get_index_stats():
+    """Documents per shard and in total"""
+    require_shards()
+    def collect() -> List[Dict]:
+        def stats(client: ShardClient) -> Dict:
+            try:
+                return {"url": client.url, **client.get("/index/stats", SHARD_TIMEOUT)}
+            except Exception as e:
+                return {"url": client.url, "error": str(e)}
+        return list(shard_executor.map(stats, shards))
+
+    shard_stats = await main.run_in_pool(main.search_executor, collect)
+    return {"documents": sum(stats.get("documents", 0) for stats in shard_stats), "shards": shard_stats}
+
+
+def start_shards(count: int, index_dir: str, first_port: int, workers: int) -> List[subprocess.Popen]:
+    """Start one ``main:app`` server per shard on consecutive local ports"""
+    backend = os.path.dirname(os.path.abspath(__file__))
+    # Every shard knows the others, to forward uploads whose text another shard owns
+    urls = ",".join(f"http://127.0.0.1:{first_port + shard}" for shard in range(count))
+    processes = []
+    for shard in range(count):
+        env = dict(os.environ, INDEX_DIR=os.path.join(index_dir, f"shard_{shard}"),
+                   SHARD_INDEX=str(shard), SHARD_COUNT=str(count), SHARD_URLS=urls)
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+             "--port", str(first_port + shard), "--workers", str(workers)],
+            cwd=backend, env=env
+        ))
+    return processes
+
+
+def main_cli(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run shard servers and a coordinator on this machine")
+    parser.add_argument('--shards', type=int, default=2, help="number of shards")
+    parser.add_argument('--index-dir', default=SHARD_INDEX_DIR, help="parent of the shard_<i> index directories")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000, help="coordinator port; shards use the next ones")
+    parser.add_argument('--shard-workers', type=int, default=1, help="uvicorn workers per shard")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+    processes = start_shards(args.shards, args.index_dir, args.port + 1, args.shard_workers)
+    shards[:] = [ShardClient(f"http://127.0.0.1:{args.port + 1 + shard}") for shard in range(args.shards)]
+    SHARD_URLS[:] = [client.url for client in shards]
+    try:
+        uvicorn.run(app, host=args.host, port=args.port)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == "__main__":
+    main_cli()
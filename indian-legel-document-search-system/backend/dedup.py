@@ -0,0 +1,74 @@
+import json
+import os
+from typing import Dict, List, Optional
+import numpy as np
+from caching import content_hash
+from vector_store import GrowableMatrix
+
+
+class ContentHashes:
+    """Content hash of every indexed document, one row per document, for spotting re-uploads
+
+    Persisted next to the vector index as ``content_hashes.u64`` (each SHA-256
+    digest as four uint64 words, memory-mapped) plus ``content_hashes.json`` with
+    the committed row count. Rows missing from an older index are hashed on open.
+    """
+
+    MATRIX_FILE = 'content_hashes.u64'
+    META_FILE = 'content_hashes.json'
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hashes: Optional[GrowableMatrix] = None
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _read_meta(self) -> Optional[Dict]:
+        try:
+            with open(self._file(self.META_FILE)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _commit(self) -> None:
+        self.hashes.flush()
+        tmp_path = self._file(self.META_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'count': len(self.hashes)}, f)
+        os.replace(tmp_path, self._file(self.META_FILE))
+
+    @staticmethod
+    def _rows(digests: List[bytes]) -> np.ndarray:
+        return np.frombuffer(b''.join(digests), dtype=np.uint64).reshape(-1, 4)
+
+    def sync(self, documents, block_rows: int = 4096) -> None:
+        """Load stored hashes and hash the documents beyond them"""
+        meta = self._read_meta() or {'count': 0}
+        stored_rows = min(meta['count'], len(documents))
+        self.hashes = GrowableMatrix(4, dtype=np.uint64, path=self._file(self.MATRIX_FILE), count=stored_rows)
+        for start in range(stored_rows, len(documents), block_rows):
+            self.hashes.append(self._rows([content_hash(doc['content']) for doc in documents[start:start + block_rows]]))
+        self._commit()
+
+    def refresh(self) -> None:
+        """Adopt hash rows committed by another process"""
+        meta = self._read_meta()
+        if meta is not None:
+            self.hashes.refresh(meta['count'])
+
+    def add(self, digests: List[bytes]) -> range:
+        """Append the ``content_hash`` digests of new documents"""
+        rows = self.hashes.append(self._rows(digests))
+        self._commit()
+        return rows
+
+    def find(self, digest: bytes, count: int) -> Optional[int]:
+        """Row of a document among the first ``count`` with this content hash, if any"""
+        key = np.frombuffer(digest, dtype=np.uint64)
+        hashes = self.hashes.view()[:count]
+        # One word is compared across every row; full digests only for the rare matches
+        for row in np.flatnonzero(hashes[:, 0] == key[0]):
+            if (hashes[row] == key).all():
+                return int(row)
+        return None
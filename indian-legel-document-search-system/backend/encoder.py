@@ -0,0 +1,373 @@
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+import numpy as np
+
+ENCODER_BACKENDS = ('torch', 'onnx', 'onnx-int8')
+ONNX_FILES = {'onnx': 'model.onnx', 'onnx-int8': 'model_int8.onnx'}
+# Written next to the graphs by export_onnx; everything OnnxEncoder needs besides tokenizer.json
+ONNX_CONFIG_FILE = 'encoder.json'
+# Texts the exported graphs are compared on against the PyTorch model
+VERIFY_TEXTS = [
+    "What is the punishment for murder under the Indian Penal Code?",
+    "Section 302 IPC",
+    "Right to equality before law and equal protection of laws under Article 14 of the Constitution",
+    "Bail provisions for non-bailable offences in the Code of Criminal Procedure",
+    "The tenant shall not sublet the premises without the written consent of the landlord.",
+    "Consumer complaint regarding deficiency in service",
+    "Anticipatory bail",
+    "A contract without consideration is void unless it is in writing and registered, "
+    "or is a promise to compensate for something done, or a promise to pay a time-barred debt.",
+]
+
+
+def encode_sorted(encode_batch: Callable[[List[str]], np.ndarray], texts: List[str],
+                  batch_size: int = 64, on_progress: Optional[Callable[[int], None]] = None) -> np.ndarray:
+    """Encode texts in batches of similar length and return vectors in input order
+
+    Sorting by length keeps padding inside each batch to a minimum.
+    ``on_progress(encoded)`` is called after every batch.
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    vectors = None
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        encoded = np.asarray(encode_batch([texts[i] for i in batch]), dtype=np.float32)
+        if vectors is None:
+            vectors = np.empty((len(texts), encoded.shape[1]), dtype=np.float32)
+        vectors[batch] = encoded
+        if on_progress:
+            on_progress(start + len(batch))
+    return vectors
+
+
+class ThroughputMeter:
+    """Thread-safe running count of items processed and the time spent on them"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.items = 0
+        self.seconds = 0.0
+        self.last_per_second = 0.0
+
+    def record(self, items: int, seconds: float) -> None:
+        with self._lock:
+            self.items += items
+            self.seconds += seconds
+            self.last_per_second = items / seconds if seconds > 0 else 0.0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'items': self.items,
+                'seconds': self.seconds,
+                'per_second': self.items / self.seconds if self.seconds > 0 else 0.0,
+                'last_per_second': self.last_per_second,
+            }
+
+
+class MicroBatchEncoder:
+    """Coalesces concurrent single-text encode calls into batched model calls
+
+    Callers block on a future while a background thread collects every request
+    that arrives within ``max_wait_ms`` of the first one (up to
+    ``max_batch_size``), runs one batched encode, and resolves each future.
+    Identical texts within a batch are encoded once.
+    """
+
+    def __init__(self, encode_batch: Callable[[List[str]], np.ndarray],
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.encode_batch = encode_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batch_sizes: Counter = Counter()
+        self.items = 0
+        self.total_queue_delay = 0.0
+        self.max_queue_delay = 0.0
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="encode-batcher", daemon=True)
+                    self._thread.start()
+
+    def encode(self, text: str, timeout: Optional[float] = None) -> np.ndarray:
+        """Encode one text, sharing a model call with concurrent callers"""
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((text, time.monotonic(), future))
+        return future.result(timeout)
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = batch[0][1] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    # Past the window: still take whatever is already waiting
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            started = time.monotonic()
+            unique_texts = list(dict.fromkeys(text for text, _, _ in batch))
+
+            try:
+                vectors = self.encode_batch(unique_texts)
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            by_text = dict(zip(unique_texts, vectors))
+            self._record(len(batch), [started - enqueued for _, enqueued, _ in batch])
+            for text, _, future in batch:
+                future.set_result(by_text[text])
+
+    def _record(self, size: int, delays: List[float]) -> None:
+        with self._stats_lock:
+            self.batch_sizes[size] += 1
+            self.items += size
+            self.total_queue_delay += sum(delays)
+            self.max_queue_delay = max(self.max_queue_delay, max(delays))
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            batches = sum(self.batch_sizes.values())
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'batches': batches,
+                'items': self.items,
+                'mean_batch_size': self.items / batches if batches else 0.0,
+                'batch_size_histogram': dict(sorted(self.batch_sizes.items())),
+                'mean_queue_delay_ms': 1000.0 * self.total_queue_delay / self.items if self.items else 0.0,
+                'max_queue_delay_ms': 1000.0 * self.max_queue_delay,
+                'pending': self._queue.qsize(),
+            }
+
+
+class OnnxEncoder:
+    """Sentence embeddings from an exported transformer graph on the onnxruntime CPU provider
+
+    ``model_dir`` holds what ``export_onnx`` writes: ``model.onnx`` (and
+    ``model_int8.onnx``), ``tokenizer.json`` and ``encoder.json``. Loading reads
+    only those files and never imports torch. Token embeddings are mean-pooled
+    over the attention mask, as in the SentenceTransformer pipeline.
+    """
+
+    def __init__(self, model_dir: str, file_name: str = ONNX_FILES['onnx'], threads: int = 0):
+        # Imported here: only this backend needs them
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, ONNX_CONFIG_FILE)) as f:
+            self.config = json.load(f)
+
+        options = onnxruntime.SessionOptions()
+        # 0 lets onnxruntime use one thread per physical core
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, file_name), options, providers=['CPUExecutionProvider']
+        )
+        self.input_names = {node.name for node in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, 'tokenizer.json'))
+        self.tokenizer.enable_truncation(max_length=self.config['max_seq_length'])
+        self.tokenizer.enable_padding(pad_id=self.config['pad_token_id'], pad_token=self.config['pad_token'])
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config['dim']
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """Mean-pooled (not normalized) embeddings, one row per text"""
+        vectors = np.empty((len(texts), self.config['dim']), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start:start + batch_size])
+            ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+            mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+            feeds = {'input_ids': ids, 'attention_mask': mask}
+            if 'token_type_ids' in self.input_names:
+                feeds['token_type_ids'] = np.zeros_like(ids)
+
+            tokens = self.session.run(None, feeds)[0]
+            weights = mask[:, :, None].astype(np.float32)
+            vectors[start:start + len(encodings)] = (tokens * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        return vectors
+
+
+def load_encoder(backend: str, model_name: str, model_dir: Optional[str] = None, threads: int = 0):
+    """A model with SentenceTransformer's ``encode`` and ``get_sentence_embedding_dimension``
+
+    ``torch`` loads ``model_dir`` if set, else ``model_name`` (from the Hugging Face
+    cache or hub); the ONNX backends need a ``model_dir`` written by ``export_onnx``.
+    """
+    if backend in ONNX_FILES:
+        if not model_dir:
+            raise ValueError(f"The {backend} encoder backend needs ENCODER_MODEL_DIR")
+        return OnnxEncoder(model_dir, ONNX_FILES[backend], threads)
+    if backend != 'torch':
+        raise ValueError(f"Unknown encoder backend: {backend}")
+
+    # Imported here: torch and transformers dominate import time
+    from sentence_transformers import SentenceTransformer
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    return SentenceTransformer(model_dir or model_name)
+
+
+def _fingerprint(model_dir: str, paths: List[str], chunk_size: int = 1024 * 1024) -> str:
+    """Short SHA-256 of the names and contents of files below ``model_dir``"""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.relpath(path, model_dir).encode('utf-8'))
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def encoder_id(backend: str, model_name: str, model_dir: Optional[str] = None) -> str:
+    """Identity of the vectors ``load_encoder`` produces, for keying cached embeddings
+
+    The hub model on PyTorch is just ``model_name``. Anything else adds the backend
+    and a hash of the files it loads, so vectors of a different runtime, quantization
+    or re-exported graph never share cache entries.
+    """
+    if backend in ONNX_FILES:
+        if not model_dir:
+            raise ValueError(f"The {backend} encoder backend needs ENCODER_MODEL_DIR")
+        files = [ONNX_FILES[backend], 'tokenizer.json', ONNX_CONFIG_FILE]
+        return f"{model_name}:{backend}:{_fingerprint(model_dir, [os.path.join(model_dir, name) for name in files])}"
+    if not model_dir:
+        return model_name
+    files = sorted(os.path.join(root, name) for root, _, names in os.walk(model_dir) for name in names)
+    return f"{model_name}:{backend}:{_fingerprint(model_dir, files)}"
+
+
+def export_onnx(model, output_dir: str, quantize: bool = True, opset: int = 17) -> List[str]:
+    """Export a SentenceTransformer's transformer to ONNX for OnnxEncoder
+
+    Writes ``model.onnx`` and, with ``quantize``, ``model_int8.onnx`` with int8
+    weights (dynamic quantization: activations are quantized per batch at run
+    time). Returns the backends written.
+    """
+    import torch
+
+    transformer, pooling = model[0], model[1]
+    # Older sentence-transformers releases only describe the mode through a method
+    pooling_mode = getattr(pooling, 'pooling_mode', None) or pooling.get_pooling_mode_str()
+    if pooling_mode != 'mean' or any(type(module).__name__ != 'Normalize' for module in list(model)[2:]):
+        raise ValueError("Only mean-pooled models (optionally followed by Normalize) can be exported")
+
+    tokenizer = transformer.tokenizer
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer.backend_tokenizer.save(os.path.join(output_dir, 'tokenizer.json'))
+
+    sample = tokenizer(VERIFY_TEXTS[:2], padding=True, return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+
+    class TokenEmbeddings(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.auto_model = transformer.auto_model
+
+        def forward(self, *inputs):
+            return self.auto_model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    dynamic_axes = {name: {0: 'batch', 1: 'tokens'} for name in input_names + ['token_embeddings']}
+    # dynamic_axes is read by the TorchScript exporter: releases that also have the dynamo
+    # exporter (the default since torch 2.9) are asked for it, older ones have no such option
+    options = {'dynamo': False} if 'dynamo' in inspect.signature(torch.onnx.export).parameters else {}
+    path = os.path.join(output_dir, ONNX_FILES['onnx'])
+    with torch.no_grad():
+        torch.onnx.export(
+            TokenEmbeddings().eval(), tuple(sample[name] for name in input_names), path,
+            input_names=input_names, output_names=['token_embeddings'],
+            dynamic_axes=dynamic_axes, opset_version=opset, **options
+        )
+    backends = ['onnx']
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(path, os.path.join(output_dir, ONNX_FILES['onnx-int8']), weight_type=QuantType.QInt8)
+        backends.append('onnx-int8')
+
+    with open(os.path.join(output_dir, ONNX_CONFIG_FILE), 'w') as f:
+        json.dump({
+            'dim': model.get_sentence_embedding_dimension(),
+            'max_seq_length': model.max_seq_length,
+            'pad_token': tokenizer.pad_token,
+            'pad_token_id': tokenizer.pad_token_id,
+        }, f, indent=2)
+    return backends
+
+
+def compare_encoders(reference, candidate, texts: List[str]) -> Dict[str, float]:
+    """Agreement of two encoders' unit-normalized embeddings of the same texts"""
+    expected = np.asarray(reference.encode(texts), dtype=np.float32)
+    actual = np.asarray(candidate.encode(texts), dtype=np.float32)
+    expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+    actual /= np.linalg.norm(actual, axis=1, keepdims=True)
+    cosines = (expected * actual).sum(axis=1)
+    return {
+        'min_cosine': float(cosines.min()),
+        'mean_cosine': float(cosines.mean()),
+        'max_abs_diff': float(np.abs(expected - actual).max()),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Export the sentence encoder to ONNX and check it against PyTorch")
+    parser.add_argument('command', choices=['export', 'verify'])
+    parser.add_argument('model_dir', help="directory the ONNX backends are written to / loaded from")
+    parser.add_argument('--model', default='all-MiniLM-L6-v2', help="SentenceTransformer name or local directory")
+    parser.add_argument('--no-quantize', action='store_true', help="skip the int8 graph")
+    parser.add_argument('--min-cosine', type=float, default=0.99,
+                        help="lowest acceptable cosine similarity to the PyTorch embedding of any text")
+    args = parser.parse_args(argv)
+
+    reference = load_encoder('torch', args.model)
+    if args.command == 'export':
+        backends = export_onnx(reference, args.model_dir, quantize=not args.no_quantize)
+    else:
+        backends = [backend for backend, file_name in ONNX_FILES.items()
+                    if os.path.exists(os.path.join(args.model_dir, file_name))]
+
+    failed = False
+    for backend in backends:
+        agreement = compare_encoders(reference, load_encoder(backend, args.model, args.model_dir), VERIFY_TEXTS)
+        ok = agreement['min_cosine'] >= args.min_cosine
+        failed = failed or not ok
+        print(f"{backend}: min cosine {agreement['min_cosine']:.5f}, mean cosine {agreement['mean_cosine']:.5f}, "
+              f"max abs diff {agreement['max_abs_diff']:.5f} - {'ok' if ok else 'FAILED'}")
+    if failed or not backends:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
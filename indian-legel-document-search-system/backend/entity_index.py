@@ -0,0 +1,224 @@
+import json
+import os
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from vector_store import GrowableMatrix
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == '_'
+
+
+def _is_boundary(text: str, pos: int) -> bool:
+    """Same rule as the regex ``\\b`` assertion at ``pos``"""
+    before = pos > 0 and _is_word_char(text[pos - 1])
+    after = pos < len(text) and _is_word_char(text[pos])
+    return before != after
+
+
+class EntityMatcher:
+    """Aho-Corasick automaton counting every category's phrases in a single pass
+
+    Matches are case-insensitive and must sit on word boundaries. Like ``re.findall``,
+    a phrase is not counted again where it overlaps its own previous match ("a a" is
+    found once in "a a a"), so the counts equal running
+    ``re.findall(r'\\b' + re.escape(phrase) + r'\\b')`` on the lowercased text for
+    each phrase separately.
+    """
+
+    def __init__(self, categories: Dict[str, List[str]]):
+        self.categories = list(categories)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Per state: (phrase length, category column, phrase number) for every phrase ending there
+        self._outputs: List[List[tuple]] = [[]]
+        self._phrase_count = 0
+        self._longest = 0
+
+        for column, category in enumerate(self.categories):
+            for phrase in categories[category]:
+                phrase = phrase.lower()
+                state = 0
+                for ch in phrase:
+                    if ch not in self._goto[state]:
+                        self._goto.append({})
+                        self._fail.append(0)
+                        self._outputs.append([])
+                        self._goto[state][ch] = len(self._goto) - 1
+                    state = self._goto[state][ch]
+                self._outputs[state].append((len(phrase), column, self._phrase_count))
+                self._phrase_count += 1
+                self._longest = max(self._longest, len(phrase))
+
+        # Breadth-first pass to build failure links and merge suffix outputs
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, child in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(ch, 0)
+                self._outputs[child] = self._outputs[child] + self._outputs[self._fail[child]]
+                queue.append(child)
+
+    def count(self, text: str) -> np.ndarray:
+        """Return phrase match counts per category, in ``self.categories`` order"""
+        counter = EntityCounter(self)
+        counter.update(text)
+        return counter.result()
+
+    def count_many(self, texts: List[str]) -> np.ndarray:
+        counts = np.zeros((len(texts), len(self.categories)), dtype=np.int32)
+        for row, text in enumerate(texts):
+            counts[row] = self.count(text)
+        return counts
+
+
+class EntityCounter:
+    """``EntityMatcher.count`` of a text fed in pieces
+
+    Only the last phrase's worth of text is held, for the word-boundary checks of
+    matches near a piece boundary. A match ending where the text so far ends waits
+    for the next character.
+    """
+
+    def __init__(self, matcher: EntityMatcher):
+        self._matcher = matcher
+        self.counts = np.zeros(len(matcher.categories), dtype=np.int32)
+        # End of the last counted match of each phrase
+        self._last_end = [0] * matcher._phrase_count
+        self._state = 0
+        self._text = ''
+        self._base = 0      # text offset of self._text[0]
+        self._waiting: List[Tuple[int, int, int, int]] = []
+
+    def _settle(self, start: int, end: int, column: int, phrase: int) -> None:
+        text, base = self._text, self._base
+        if start >= self._last_end[phrase] and _is_boundary(text, start - base) and _is_boundary(text, end - base):
+            self.counts[column] += 1
+            self._last_end[phrase] = end
+
+    def update(self, piece: str) -> None:
+        piece = piece.lower()
+        if not piece:
+            return
+        kept = self._text[-(self._matcher._longest + 1):]
+        self._base += len(self._text) - len(kept)
+        self._text = text = kept + piece
+        waiting, self._waiting = self._waiting, []
+        for match in waiting:
+            self._settle(*match)
+
+        goto, fail, outputs = self._matcher._goto, self._matcher._fail, self._matcher._outputs
+        counts, last_end = self.counts, self._last_end
+        state, base, last = self._state, self._base, len(text) - 1
+        for index, ch in enumerate(piece, start=len(kept)):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+
+            for length, column, phrase in outputs[state]:
+                start = index + 1 - length
+                if index == last:
+                    self._waiting.append((base + start, base + index + 1, column, phrase))
+                elif base + start >= last_end[phrase] and _is_boundary(text, start) and _is_boundary(text, index + 1):
+                    counts[column] += 1
+                    last_end[phrase] = base + index + 1
+        self._state = state
+
+    def result(self) -> np.ndarray:
+        """Counts per category of the text fed so far, which has ended"""
+        waiting, self._waiting = self._waiting, []
+        for match in waiting:
+            self._settle(*match)
+        return self.counts
+
+
+class EntityIndex:
+    """Dense (documents x categories) entity count matrix computed once at ingest
+
+    Persisted next to the vector index as ``entities.i32`` plus ``entities.json``,
+    which records the phrase list each column was counted with. When categories are
+    added or their phrases change, only the affected columns are recounted.
+    """
+
+    MATRIX_FILE = 'entities.i32'
+    META_FILE = 'entities.json'
+
+    def __init__(self, path: str, categories: Dict[str, List[str]]):
+        self.path = path
+        self.categories = {name: list(phrases) for name, phrases in categories.items()}
+        self.matcher = EntityMatcher(self.categories)
+        self.counts: Optional[GrowableMatrix] = None
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _read_meta(self) -> Optional[Dict]:
+        try:
+            with open(self._file(self.META_FILE)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _commit(self) -> None:
+        self.counts.flush()
+        tmp_path = self._file(self.META_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'categories': self.categories, 'count': len(self.counts)}, f)
+        os.replace(tmp_path, self._file(self.META_FILE))
+
+    def sync(self, documents: List[Dict]) -> None:
+        """Load stored counts, recounting only new category columns and missing rows"""
+        meta = self._read_meta() or {'categories': {}, 'count': 0}
+        stored_columns = list(meta['categories'])
+        stored_rows = min(meta['count'], len(documents))
+        matrix_path = self._file(self.MATRIX_FILE)
+
+        if stored_columns == list(self.categories) and meta['categories'] == self.categories:
+            self.counts = GrowableMatrix(len(self.categories), dtype=np.int32, path=matrix_path, count=stored_rows)
+        else:
+            stale = [name for name in self.categories
+                     if meta['categories'].get(name) != self.categories[name]]
+            counts = np.zeros((stored_rows, len(self.categories)), dtype=np.int32)
+
+            if stored_rows and os.path.exists(matrix_path):
+                previous = GrowableMatrix(len(stored_columns), dtype=np.int32, path=matrix_path,
+                                          count=stored_rows).view()
+                for column, name in enumerate(self.categories):
+                    if name not in stale:
+                        counts[:, column] = previous[:, stored_columns.index(name)]
+                del previous
+
+            # Only the changed categories are matched against the stored documents
+            if stale and stored_rows:
+                partial = EntityMatcher({name: self.categories[name] for name in stale})
+                recounted = partial.count_many([doc['content'] for doc in documents[:stored_rows]])
+                for partial_column, name in enumerate(stale):
+                    counts[:, list(self.categories).index(name)] = recounted[:, partial_column]
+
+            if os.path.exists(matrix_path):
+                os.remove(matrix_path)
+            self.counts = GrowableMatrix(len(self.categories), dtype=np.int32, path=matrix_path)
+            self.counts.append(counts)
+
+        if stored_rows < len(documents):
+            self.counts.append(self.matcher.count_many([doc['content'] for doc in documents[stored_rows:]]))
+        self._commit()
+
+    def refresh(self) -> None:
+        """Adopt count rows committed by another process"""
+        meta = self._read_meta()
+        if meta is not None:
+            self.counts.refresh(meta['count'])
+
+    def add(self, counts: np.ndarray) -> range:
+        """Append precomputed count rows for new documents"""
+        rows = self.counts.append(counts)
+        self._commit()
+        return rows
+
+    def view(self) -> np.ndarray:
+        return self.counts.view()
@@ -0,0 +1,160 @@
+import codecs
+import shutil
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import BinaryIO, Callable, Iterator, Optional
+import PyPDF2
+import docx
+
+# Pages handed to one worker task; large PDFs are split into ranges of this size
+PDF_PAGES_PER_TASK = 32
+# Lines of a text file or paragraphs of a Word document per yielded piece
+PARAGRAPHS_PER_PIECE = 1000
+READ_CHUNK_BYTES = 1024 * 1024
+
+
+class ProcessPool(Executor):
+    """``ProcessPoolExecutor`` started on first use that replaces itself once a worker has died
+
+    A process pool whose worker is killed (e.g. by the OOM killer) is broken for
+    good. Tasks in flight at the time fail with ``BrokenProcessPool``; the next
+    submit starts a fresh pool instead of failing as well.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, mp_context=None):
+        self._max_workers = max_workers
+        self._mp_context = mp_context
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def submit(self, fn, /, *args, **kwargs):
+        with self._lock:
+            if self._pool is not None:
+                try:
+                    return self._pool.submit(fn, *args, **kwargs)
+                except BrokenProcessPool:
+                    self._pool.shutdown(wait=False)
+            self._pool = ProcessPoolExecutor(max_workers=self._max_workers, mp_context=self._mp_context)
+            return self._pool.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=wait, cancel_futures=cancel_futures)
+                self._pool = None
+
+
+def spool(source: BinaryIO, suffix: str = '', directory: Optional[str] = None,
+          chunk_size: int = READ_CHUNK_BYTES) -> str:
+    """Copy an upload stream to a temporary file in fixed-size chunks; the caller removes it"""
+    with tempfile.NamedTemporaryFile(suffix=suffix, dir=directory, delete=False) as f:
+        shutil.copyfileobj(source, f, chunk_size)
+        return f.name
+
+
+def pdf_page_count(path: str) -> int:
+    with open(path, 'rb') as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+
+def extract_pdf_pages(path: str, start: int, stop: int) -> str:
+    """Text of pages [start, stop) of a PDF on disk
+
+    Kept free of application state so it can run in a worker process.
+    """
+    with open(path, 'rb') as f:
+        pages = PyPDF2.PdfReader(f).pages
+        return "".join(pages[i].extract_text() for i in range(start, stop))
+
+
+def iter_pdf_text(path: str, executor: Optional[Executor] = None, pages_per_task: int = PDF_PAGES_PER_TASK,
+                  max_pending: int = 8, on_progress: Optional[Callable[[int, int], None]] = None) -> Iterator[str]:
+    """Yield the text of consecutive page ranges, in order
+
+    Ranges are extracted in parallel on ``executor``; at most ``max_pending``
+    ranges are in flight so memory stays bounded however long the PDF is.
+    ``on_progress(pages_done, page_count)`` is called as each range is yielded.
+    """
+    page_count = pdf_page_count(path)
+    ranges = ((start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task))
+    on_progress = on_progress or (lambda done, total: None)
+    on_progress(0, page_count)
+    if executor is None:
+        for start, stop in ranges:
+            text = extract_pdf_pages(path, start, stop)
+            on_progress(stop, page_count)
+            yield text
+        return
+
+    pending = deque()
+    for start, stop in ranges:
+        pending.append((stop, executor.submit(extract_pdf_pages, path, start, stop)))
+        if len(pending) >= max_pending:
+            stop, future = pending.popleft()
+            text = future.result()
+            on_progress(stop, page_count)
+            yield text
+    while pending:
+        stop, future = pending.popleft()
+        text = future.result()
+        on_progress(stop, page_count)
+        yield text
+
+
+def iter_docx_text(path: str, paragraphs_per_piece: int = PARAGRAPHS_PER_PIECE) -> Iterator[str]:
+    """Yield paragraphs of a Word document joined by newlines, a block at a time"""
+    paragraphs = docx.Document(path).paragraphs
+    for start in range(0, len(paragraphs), paragraphs_per_piece):
+        piece = "\n".join(paragraph.text for paragraph in paragraphs[start:start + paragraphs_per_piece])
+        yield piece if start == 0 else "\n" + piece
+
+
+def iter_plain_text(path: str, chunk_size: int = READ_CHUNK_BYTES) -> Iterator[str]:
+    """Yield a UTF-8 file in decoded chunks without reading it whole"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+class TextFile:
+    """A UTF-8 text file standing in for a document's content; iterating streams it"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __iter__(self) -> Iterator[str]:
+        return iter_plain_text(self.path)
+
+
+def iter_text(path: str, filename: Optional[str] = None, executor: Optional[Executor] = None,
+              on_progress: Optional[Callable[[int, int], None]] = None) -> Iterator[str]:
+    """Yield the plain text of a PDF, Word or text file incrementally, in document order
+
+    ``on_progress(pages_done, page_count)`` reports PDF pages as they are extracted.
+    """
+    filename = filename or path
+    if filename.endswith('.pdf'):
+        return iter_pdf_text(path, executor, on_progress=on_progress)
+    elif filename.endswith('.docx'):
+        return iter_docx_text(path)
+    else:
+        # Assume text file
+        return iter_plain_text(path)
+
+
+def extract_text(path: str, filename: Optional[str] = None, executor: Optional[Executor] = None,
+                 on_progress: Optional[Callable[[int, int], None]] = None) -> str:
+    """Extract plain text from a PDF, Word or text file on disk"""
+    return "".join(iter_text(path, filename, executor, on_progress))
@@ -0,0 +1,234 @@
+"""Bulk ingestion into the search index
+
+Usage (from ``backend/``)::
+
+    python ingest.py /path/to/archive            # every .pdf/.docx/.txt file below a directory
+    python ingest.py manifest.jsonl --batch-size 128
+    python ingest.py /path/to/archive --shard 0/4 --index-dir index_shards/shard_0
+
+Manifest lines are JSON objects with either a ``path`` (relative paths are resolved
+against the manifest's directory) or inline ``content``, plus optional ``title``,
+``category`` and ``id``. Every batch is committed to the index as it is written, so
+an interrupted run is resumed by running the same command again: sources already
+in the index are skipped. Writes take the index lock, so the API server may keep
+running and picks up each batch as it is committed.
+
+With ``--shard I/N`` only the documents whose content hash routes to shard ``I`` of
+``N`` are loaded, so running the command once per shard splits an archive across the
+shard indexes a coordinator searches (see ``coordinator.py``). Uploads through the
+coordinator are routed the same way, so a document meets its duplicates whichever
+way it arrives. Every run parses every source to find its shard.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set
+from caching import content_hash
+from extraction import extract_text
+from sharding import shard_for
+
+DEFAULT_EXTENSIONS = ('.pdf', '.docx', '.txt')
+
+
+def walk_directory(root: str, extensions=DEFAULT_EXTENSIONS) -> Iterator[Dict]:
+    """Sources for every matching file below ``root``, in a stable order"""
+    for directory, subdirectories, filenames in os.walk(root):
+        subdirectories.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(extensions):
+                path = os.path.join(directory, filename)
+                yield {'path': path, 'source': os.path.relpath(path, root)}
+
+
+def read_manifest(manifest_path: str) -> Iterator[Dict]:
+    """Sources from a JSONL manifest, one JSON object per line"""
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            source = json.loads(line)
+            if 'path' in source:
+                source['source'] = source.get('source') or source['path']
+                source['path'] = os.path.join(base, source['path'])
+            else:
+                source['source'] = source.get('source') or source.get('id') or f"{manifest_path}:{line_number}"
+            yield source
+
+
+def parse_source(source: Dict) -> Optional[Dict]:
+    """Turn a source into a document ready for indexing
+
+    A source with a ``shard`` (index, count) pair yields None unless its content
+    routes to that shard. Kept free of application state so it can run in a worker
+    process.
+    """
+    if 'content' in source:
+        content = source['content']
+    else:
+        content = extract_text(source['path'], source.get('filename'))
+    if 'shard' in source:
+        shard_index, shard_count = source['shard']
+        if shard_for(content_hash(content), shard_count) != shard_index:
+            return None
+
+    doc = {
+        'title': source.get('title') or os.path.basename(source.get('filename') or source['path']),
+        'content': content,
+        'category': source.get('category', 'uploaded'),
+        'source': source['source'],
+    }
+    if source.get('id'):
+        doc['id'] = source['id']
+    return doc
+
+
+def _parse_in_order(sources: Iterable[Dict], executor: Executor, max_pending: int,
+                    failed: List[Dict]) -> Iterator[Dict]:
+    pending = deque()
+    sources = iter(sources)
+
+    def take():
+        source, future = pending.popleft()
+        try:
+            return future.result()
+        except Exception as e:
+            failed.append({'source': source['source'], 'error': str(e)})
+            return None
+
+    for source in sources:
+        pending.append((source, executor.submit(parse_source, source)))
+        if len(pending) >= max_pending:
+            doc = take()
+            if doc is not None:
+                yield doc
+    while pending:
+        doc = take()
+        if doc is not None:
+            yield doc
+
+
+def run_pipeline(sources: Iterable[Dict], encode: Callable, write: Callable, parse_executor: Executor,
+                 batch_size: int = 64, max_pending: int = 256,
+                 on_batch: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """Parse, encode and write documents as overlapping stages
+
+    Sources are parsed on ``parse_executor`` (at most ``max_pending`` in flight),
+    parsed documents are grouped into batches and encoded with ``encode(batch)``,
+    and each batch is written with ``write(batch, *encoded)`` on a writer thread
+    while the next batch is being encoded. Sources that fail to parse are
+    reported and skipped; documents the writer marks ``duplicate`` are counted.
+    """
+    failed: List[Dict] = []
+    report = {'documents': 0, 'duplicates': 0, 'document_ids': [], 'failed': failed, 'seconds': 0.0,
+              'docs_per_second': 0.0}
+    started = time.perf_counter()
+
+    def written(future) -> None:
+        docs = future.result()
+        report['documents'] += len(docs)
+        report['duplicates'] += sum(1 for doc in docs if doc.get('duplicate'))
+        report['document_ids'].extend(doc['id'] for doc in docs)
+        report['seconds'] = time.perf_counter() - started
+        report['docs_per_second'] = report['documents'] / report['seconds'] if report['seconds'] else 0.0
+        if on_batch:
+            on_batch(report)
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-writer") as writer:
+        pending_write = None
+        batch: List[Dict] = []
+        parsed = _parse_in_order(sources, parse_executor, max_pending, failed)
+
+        for doc in parsed:
+            batch.append(doc)
+            if len(batch) < batch_size:
+                continue
+            encoded = encode(batch)
+            if pending_write is not None:
+                written(pending_write)
+            pending_write = writer.submit(write, batch, *encoded)
+            batch = []
+
+        if batch:
+            encoded = encode(batch)
+            if pending_write is not None:
+                written(pending_write)
+            pending_write = writer.submit(write, batch, *encoded)
+        if pending_write is not None:
+            written(pending_write)
+
+    report['seconds'] = time.perf_counter() - started
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Bulk-load documents into the search index")
+    parser.add_argument('source', help="directory to walk or JSONL manifest")
+    parser.add_argument('--batch-size', type=int, default=64, help="documents encoded and committed together")
+    parser.add_argument('--category', default='uploaded', help="category for sources that do not set one")
+    parser.add_argument('--index-dir', help="index directory (default: INDEX_DIR or backend/index_data)")
+    parser.add_argument('--shard', help="I/N: load only the sources of shard I of N")
+    args = parser.parse_args(argv)
+
+    if args.index_dir:
+        os.environ['INDEX_DIR'] = args.index_dir
+    shard_index, shard_count = 0, 1
+    if args.shard:
+        shard_index, _, shard_count = args.shard.partition('/')
+        shard_index, shard_count = int(shard_index), int(shard_count)
+        if not 0 <= shard_index < shard_count:
+            parser.error(f"--shard {args.shard}: expected I/N with 0 <= I < N")
+        # The index ids its documents like the shard server will
+        os.environ['SHARD_INDEX'], os.environ['SHARD_COUNT'] = str(shard_index), str(shard_count)
+
+    # The application module owns the model and index layout, so the result loads as-is
+    import main as app
+    app.initialize()
+
+    if os.path.isdir(args.source):
+        sources = walk_directory(args.source)
+    else:
+        sources = read_manifest(args.source)
+
+    # The committed index is the checkpoint: anything already in it was fully written
+    done: Set[str] = {doc['source'] for doc in app.documents if 'source' in doc}
+    skipped = 0
+
+    def pending_sources() -> Iterator[Dict]:
+        nonlocal skipped
+        for source in sources:
+            if source['source'] in done:
+                skipped += 1
+                continue
+            source.setdefault('category', args.category)
+            if shard_count > 1:
+                source['shard'] = (shard_index, shard_count)
+            yield source
+
+    def progress(report: Dict) -> None:
+        passages = app.passage_meter.stats()
+        print(f"{report['documents']} documents, {report['docs_per_second']:.1f} docs/s, "
+              f"{passages['per_second']:.1f} passages/s, {len(report['failed'])} failed", flush=True)
+
+    report = run_pipeline(
+        pending_sources(),
+        app.encode_passages,
+        app.write_documents,
+        app.parse_executor,
+        batch_size=args.batch_size,
+        on_batch=progress
+    )
+
+    for failure in report['failed']:
+        print(f"failed: {failure['source']}: {failure['error']}", file=sys.stderr)
+    print(f"Ingested {report['documents']} documents in {report['seconds']:.1f}s "
+          f"({report['docs_per_second']:.1f} docs/s); skipped {skipped} already indexed, "
+          f"{report['duplicates']} duplicates of indexed content")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+# A forwarded upload continues as a job on the shard that owns its content
+TERMINAL_STATUSES = ('done', 'failed', 'forwarded')
+
+
+def _process_alive(pid: Optional[int]) -> bool:
+    # On Windows signal 0 is CTRL_C_EVENT, so liveness is not probed there
+    if not pid or pid == os.getpid() or os.name == 'nt':
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class Job:
+    """Status and progress of one background job, safe to update from its worker"""
+
+    def __init__(self, job_id: str, queue: "JobQueue", **fields):
+        self.id = job_id
+        self._queue = queue
+        self._lock = threading.Lock()
+        self.record = {'id': job_id, 'status': 'queued', 'created': time.time(), 'updated': time.time(),
+                       'error': None, 'worker': os.getpid(), **fields}
+
+    def update(self, **fields) -> None:
+        with self._lock:
+            self.record.update(fields, updated=time.time())
+            record = dict(self.record)
+        self._queue._save(record)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return dict(self.record)
+
+
+class JobQueue:
+    """Bounded background job queue with no external broker
+
+    Jobs run on a fixed pool of ``workers`` threads; at most ``max_pending``
+    jobs may be queued or running, and submitting beyond that raises
+    ``QueueFull`` so callers can push back. Job records are kept in memory (the
+    most recent ``history`` finished ones) and, when ``db_path`` is set, in a
+    SQLite table that survives restarts and can be read by other processes,
+    e.g. the other workers of a multi-process server. The table is opened on
+    first use, not when the queue is created.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 100, history: int = 1000,
+                 db_path: Optional[str] = None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest-job")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._jobs: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.db_path = db_path
+        self._db = None
+        self._db_lock = threading.Lock()
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """The job table, opened on first use; the caller holds ``_db_lock``"""
+        if self._db is None and self.db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, record TEXT, updated REAL)')
+            # Jobs only live in the memory of the process running them, so unfinished
+            # ones whose process is gone died with it
+            for job_id, record in db.execute('SELECT id, record FROM jobs').fetchall():
+                record = json.loads(record)
+                if record['status'] not in TERMINAL_STATUSES and not _process_alive(record.get('worker')):
+                    record.update(status='failed', error='Interrupted by a server restart', updated=time.time())
+                    db.execute('UPDATE jobs SET record = ?, updated = ? WHERE id = ?',
+                               (json.dumps(record), record['updated'], job_id))
+            db.commit()
+            self._db = db
+        return self._db
+
+    def _save(self, record: Dict) -> None:
+        if not self.db_path:
+            return
+        with self._db_lock:
+            db = self._connect()
+            db.execute('INSERT OR REPLACE INTO jobs VALUES (?, ?, ?)',
+                       (record['id'], json.dumps(record), record['updated']))
+            db.commit()
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.record['status'] not in TERMINAL_STATUSES)
+
+    def submit(self, fn: Callable[..., None], *args, **fields) -> Job:
+        """Queue ``fn(job, *args)``; ``fields`` seed the job record"""
+        if not self._slots.acquire(blocking=False):
+            raise QueueFull(f"{self.max_pending} jobs already pending")
+
+        job = Job(uuid.uuid4().hex, self, **fields)
+        with self._lock:
+            self._jobs[job.id] = job
+            # Forget the oldest finished jobs beyond the history limit
+            finished = [job_id for job_id, old in self._jobs.items() if old.record['status'] in TERMINAL_STATUSES]
+            for job_id in finished[:max(len(finished) - self.history, 0)]:
+                del self._jobs[job_id]
+        self._save(job.snapshot())
+        self._executor.submit(self._run, job, fn, args)
+        return job
+
+    def _run(self, job: Job, fn: Callable[..., None], args: tuple) -> None:
+        try:
+            fn(job, *args)
+            if job.record['status'] not in TERMINAL_STATUSES:
+                job.update(status='done')
+        except Exception as e:
+            job.update(status='failed', error=str(e))
+        finally:
+            self._slots.release()
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job.snapshot()
+        if self.db_path:
+            with self._db_lock:
+                row = self._connect().execute('SELECT record FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is not None:
+                return json.loads(row[0])
+        return None
+
+    def stats(self) -> Dict:
+        return {
+            'workers': self.workers,
+            'max_pending': self.max_pending,
+            'pending': self.pending(),
+            'persistent': bool(self.db_path),
+        }
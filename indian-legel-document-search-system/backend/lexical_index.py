@@ -0,0 +1,312 @@
+import array
+import os
+import pickle
+import re
+import threading
+from collections import Counter
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+from vector_store import top_k_indices
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+_stop_words: Optional[FrozenSet[str]] = None
+
+
+def stop_words() -> FrozenSet[str]:
+    """scikit-learn's English stop words, imported on first use since sklearn is slow to import"""
+    global _stop_words
+    if _stop_words is None:
+        from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+        _stop_words = ENGLISH_STOP_WORDS
+    return _stop_words
+
+
+def _aligned(offset: int, alignment: int = 8) -> int:
+    return -(-offset // alignment) * alignment
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens without stop words; "Section 80C" -> ["section", "80c"]"""
+    excluded = stop_words()
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in excluded]
+
+
+class TermCounter:
+    """Term frequencies of ``tokenize`` for a text fed in pieces
+
+    A token running into the end of a piece is held back until the next piece ends it.
+    """
+
+    def __init__(self):
+        self._counts: Counter = Counter()
+        self._tail = ''
+
+    def update(self, piece: str) -> None:
+        text = self._tail + piece.lower()
+        tokens = TOKEN_PATTERN.findall(text)
+        self._tail = tokens.pop() if tokens and text.endswith(tokens[-1]) else ''
+        self._counts.update(tokens)
+
+    def result(self) -> Counter:
+        """Frequency of every term of the text fed so far, which has ended"""
+        if self._tail:
+            self._counts[self._tail] += 1
+            self._tail = ''
+        excluded = stop_words()
+        return Counter({term: count for term, count in self._counts.items() if term not in excluded})
+
+
+def term_frequencies(text: str) -> Counter:
+    return Counter(tokenize(text))
+
+
+class BM25Index:
+    """Sparse inverted index scored with Okapi BM25
+
+    Postings are (document row, term frequency) pairs. Those covered by the last
+    save live in ``lexical.bin``, grouped by term and memory-mapped, so every
+    process serving the index shares them through the OS page cache. Documents
+    added since are held in small append-only per-term arrays, so adding a
+    document only touches the postings of its own terms. Readers pass the number
+    of rows they can see and ignore postings for anything newer.
+
+    The file is rewritten every ``save_every`` documents; on startup, or after
+    another process saved, only documents added after it are tokenized.
+    """
+
+    POSTINGS_FILE = 'lexical.bin'
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75, save_every: int = 1000):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.save_every = save_every
+        self.total_length = 0
+        # (saved, recent, document lengths) swapped as one reference. saved is
+        # (term -> (start, stop), rows, frequencies, row count) from the file;
+        # recent maps terms to (rows, frequencies) arrays for the rows after it
+        self._state = (({}, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32), 0), {}, array.array('i'))
+        self._file_stat = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._state[2])
+
+    def _file(self) -> str:
+        return os.path.join(self.path, self.POSTINGS_FILE)
+
+    def _stat(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self._file())
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _read(self) -> Tuple[Dict, np.ndarray, np.ndarray, tuple]:
+        """(header, rows, frequencies, file identity) of the saved postings"""
+        with open(self._file(), 'rb') as f:
+            header_length = int.from_bytes(f.read(8), 'little')
+            header = pickle.loads(f.read(header_length))
+            stat = os.fstat(f.fileno())
+            postings = header['postings']
+            if not postings:
+                return header, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32), \
+                    (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            offset = _aligned(8 + header_length)
+            rows = np.memmap(f, dtype=np.int64, mode='r', offset=offset, shape=(postings,))
+            frequencies = np.memmap(f, dtype=np.int32, mode='r', offset=offset + 8 * postings, shape=(postings,))
+        return header, rows, frequencies, (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _index(self, term_counts: Iterable[Counter], start: int, recent: Dict, doc_lengths: array.array) -> None:
+        for row, counts in enumerate(term_counts, start=start):
+            for term, frequency in counts.items():
+                if term not in recent:
+                    recent[term] = (array.array('q'), array.array('i'))
+                rows, frequencies = recent[term]
+                rows.append(row)
+                frequencies.append(frequency)
+            length = sum(counts.values())
+            self.total_length += length
+            # The length is published last: it is what makes the row visible
+            doc_lengths.append(length)
+
+    def load(self, documents: Sequence[Dict]) -> None:
+        """Map the saved postings, index any documents added after them and save"""
+        self.refresh(documents)
+        if len(self) > self._state[0][3]:
+            self.save()
+
+    def refresh(self, documents: Sequence[Dict]) -> None:
+        """Catch up with ``documents``, adopting postings another process saved; never writes"""
+        if self._stat() != self._file_stat:
+            try:
+                header, rows, frequencies, stat = self._read()
+            except (FileNotFoundError, EOFError, KeyError, ValueError, pickle.UnpicklingError):
+                header = None
+            if header is not None and header['count'] <= len(documents) and (self.k1, self.b) == header['params']:
+                # The new state is built to the side so searches never see fewer rows
+                saved = (header['terms'], rows, frequencies, header['count'])
+                recent: Dict = {}
+                doc_lengths = header['doc_lengths']
+                with self._lock:
+                    self.total_length = header['total_length']
+                    self._index((term_frequencies(doc['content']) for doc in documents[header['count']:]),
+                                header['count'], recent, doc_lengths)
+                    self._state = (saved, recent, doc_lengths)
+                    self._file_stat = stat
+                return
+
+        if len(self) < len(documents):
+            self.add([doc['content'] for doc in documents[len(self):]], save=False)
+
+    def save(self) -> None:
+        """Merge the recent postings into a new postings file"""
+        with self._lock:
+            (terms, rows, frequencies, _), recent, doc_lengths = self._state
+            positions: Dict[str, Tuple[int, int]] = {}
+            row_parts, frequency_parts = [], []
+            position = 0
+            for term in terms.keys() | recent.keys():
+                start = position
+                if term in terms:
+                    saved_start, saved_stop = terms[term]
+                    row_parts.append(rows[saved_start:saved_stop])
+                    frequency_parts.append(frequencies[saved_start:saved_stop])
+                    position += saved_stop - saved_start
+                if term in recent:
+                    row_parts.append(np.array(recent[term][0], dtype=np.int64))
+                    frequency_parts.append(np.array(recent[term][1], dtype=np.int32))
+                    position += len(recent[term][0])
+                positions[term] = (start, position)
+
+            header = pickle.dumps({
+                'params': (self.k1, self.b),
+                'count': len(doc_lengths),
+                'terms': positions,
+                'postings': position,
+                'doc_lengths': doc_lengths,
+                'total_length': self.total_length,
+            }, protocol=pickle.HIGHEST_PROTOCOL)
+
+            # Per-process temporary name: any process may save, readers keep the file they mapped
+            tmp_path = f"{self._file()}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(len(header).to_bytes(8, 'little'))
+                f.write(header)
+                f.write(bytes(_aligned(8 + len(header)) - 8 - len(header)))
+                for parts, dtype in ((row_parts, np.int64), (frequency_parts, np.int32)):
+                    if parts:
+                        np.concatenate(parts).astype(dtype, copy=False).tofile(f)
+            os.replace(tmp_path, self._file())
+
+            header, rows, frequencies, self._file_stat = self._read()
+            self._state = ((header['terms'], rows, frequencies, header['count']), {}, doc_lengths)
+
+    def add(self, texts: List[str], save: bool = True) -> range:
+        """Index new documents, which take the next rows in order"""
+        return self.add_terms([term_frequencies(text) for text in texts], save)
+
+    def add_terms(self, term_counts: List[Counter], save: bool = True) -> range:
+        """``add`` for documents whose term frequencies were counted already, e.g. by ``TermCounter``"""
+        with self._lock:
+            _, recent, doc_lengths = self._state
+            start = len(doc_lengths)
+            self._index(term_counts, start, recent, doc_lengths)
+
+        if save and len(self) - self._state[0][3] >= self.save_every:
+            self.save()
+        return range(start, start + len(term_counts))
+
+    def _postings(self, query: str, limit: int) -> Iterator[Tuple[str, np.ndarray, np.ndarray]]:
+        """(term, rows, frequencies) of every query term among the first ``limit`` rows"""
+        (terms, saved_rows, saved_frequencies, _), recent, _ = self._state
+        for term in set(tokenize(query)):
+            row_parts, frequency_parts = [], []
+            if term in terms:
+                start, stop = terms[term]
+                row_parts.append(saved_rows[start:stop])
+                frequency_parts.append(saved_frequencies[start:stop])
+            if term in recent:
+                term_rows, term_frequencies = recent[term]
+                # Frequencies are appended after rows, so their length is the safe bound
+                count = len(term_frequencies)
+                row_parts.append(np.array(term_rows[:count], dtype=np.int64))
+                frequency_parts.append(np.array(term_frequencies[:count], dtype=np.int32))
+            if not row_parts:
+                continue
+            rows = np.concatenate(row_parts)
+            frequencies = np.concatenate(frequency_parts).astype(np.float32)
+            visible = rows < limit
+            if visible.any():
+                yield term, rows[visible], frequencies[visible]
+
+    def statistics(self, query: str, limit: int) -> Dict:
+        """Corpus statistics BM25 needs for ``query`` over the first ``limit`` rows
+
+        Statistics of several indexes add up (see ``merge_statistics``), so shards of
+        one corpus can score with the idf and average length of the whole corpus.
+        """
+        doc_lengths = self._state[2]
+        limit = min(limit, len(doc_lengths))
+        return {
+            'documents': limit,
+            'total_length': float(np.sum(doc_lengths[:limit], dtype=np.float64)) if limit else 0.0,
+            'document_frequencies': {term: len(rows) for term, rows, _ in self._postings(query, limit)},
+        }
+
+    def search(self, query: str, k: int, limit: int, statistics: Optional[Dict] = None,
+               only: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k rows by BM25 among the first ``limit`` rows, best first
+
+        ``statistics`` (from ``statistics``/``merge_statistics``) replaces this
+        index's own document count, average length and document frequencies.
+        ``only`` (sorted rows) restricts the results, e.g. to a filtered partition;
+        scores still use the statistics of all ``limit`` rows.
+        """
+        doc_lengths = self._state[2]
+        limit = min(limit, len(doc_lengths))
+        if not limit:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        doc_lengths = np.array(doc_lengths[:limit], dtype=np.float32)
+        if statistics is None:
+            documents = limit
+            average_length = max(float(doc_lengths.mean()), 1.0)
+        else:
+            documents = statistics['documents']
+            average_length = max(statistics['total_length'] / max(documents, 1), 1.0)
+
+        matched_rows = []
+        contributions = []
+        for term, rows, frequencies in self._postings(query, limit):
+            frequency = len(rows) if statistics is None else statistics['document_frequencies'].get(term, len(rows))
+            if only is not None:
+                # The document frequency counts every visible row; only the allowed ones are scored
+                allowed = np.isin(rows, only, assume_unique=True)
+                rows, frequencies = rows[allowed], frequencies[allowed]
+            idf = np.log(1.0 + (documents - frequency + 0.5) / (frequency + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * doc_lengths[rows] / average_length)
+            matched_rows.append(rows)
+            contributions.append(idf * frequencies * (self.k1 + 1.0) / (frequencies + norm))
+
+        if not matched_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        # Sum per-term contributions for every matched document
+        rows, inverse = np.unique(np.concatenate(matched_rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contributions)).astype(np.float32)
+        best = top_k_indices(scores, k)
+        return rows[best], scores[best]
+
+
+def merge_statistics(parts: List[Dict]) -> Dict:
+    """Sum the ``BM25Index.statistics`` of disjoint parts of one corpus"""
+    frequencies: Dict[str, int] = {}
+    for part in parts:
+        for term, frequency in part['document_frequencies'].items():
+            frequencies[term] = frequencies.get(term, 0) + frequency
+    return {
+        'documents': sum(part['documents'] for part in parts),
+        'total_length': sum(part['total_length'] for part in parts),
+        'document_frequencies': frequencies,
+    }
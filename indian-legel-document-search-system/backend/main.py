@@ -1,34 +1,53 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import time
+
+# Measured from the first line so /health/ready can report the cost of importing this module
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Dict, Optional
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, Field
+from typing import List, Dict, Literal, Optional, get_args
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity, euclidean_distances
-from sklearn.feature_extraction.text import TfidfVectorizer
+import asyncio
+import functools
+import itertools
 import json
+import multiprocessing
+import threading
 import os
-import PyPDF2
-import docx
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 import re
-import nltk
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-import spacy
-
-# Download required NLTK data
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt')
+import requests
+from vector_store import DocumentFile, IndexLock, VectorStore, normalize_rows, top_k_indices, top_k_rows
+from ann_index import ExactIndex, IVFIndex, measure_recall
+from lexical_index import BM25Index, TermCounter
+from caching import ContentHasher, EmbeddingCache, LRUCache, QueryEmbeddingCache, content_hash, normalize_query
+from entity_index import EntityCounter, EntityIndex
+from dedup import ContentHashes
+from metadata_index import CitationScanner, MetadataIndex, document_keys, upload_time
+from extraction import ProcessPool, TextFile, iter_plain_text, iter_text, spool
+from ingest import run_pipeline
+from encoder import MicroBatchEncoder, ThroughputMeter, encode_sorted, encoder_id, load_encoder
+from passage_index import PassageIndex, pool
+from sharding import pack_vector, shard_for, unpack_vector
+from snapshot import DocumentList, IndexSnapshot
+from quantization import QuantizedMatrix
+from jobs import Job, JobQueue, QueueFull
 
-try:
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('stopwords')
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background: the server accepts connections (and answers liveness
+    # probes) at once and reports ready when the model and index are loaded
+    if WARMUP_ON_STARTUP:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    yield
+    parse_executor.shutdown(wait=False, cancel_futures=True)
 
-app = FastAPI(title="Indian Legal Document Search System")
+app = FastAPI(title="Indian Legal Document Search System", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -39,9 +58,83 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize models
-model = SentenceTransformer('all-MiniLM-L6-v2')
-tfidf_vectorizer = TfidfVectorizer(max_features=5000, stop_words='english')
+# The model is loaded on first use (or by the startup warm-up), not at import
+MODEL_NAME = 'all-MiniLM-L6-v2'
+WARMUP_ON_STARTUP = os.environ.get("WARMUP_ON_STARTUP", "1") == "1"
+# torch, or onnx / onnx-int8 for graphs exported by `python encoder.py export` into ENCODER_MODEL_DIR
+ENCODER_BACKEND = os.environ.get("ENCODER_BACKEND", "torch")
+ENCODER_MODEL_DIR = os.environ.get("ENCODER_MODEL_DIR") or None
+# Intra-op threads per model call; 0 keeps the runtime's default
+ENCODER_THREADS = int(os.environ.get("ENCODER_THREADS", "0"))
+model = None
+model_lock = threading.Lock()
+# Seconds spent in each startup phase, reported by /health/ready
+startup_timings: Dict[str, float] = {}
+
+def get_model():
+    """The sentence encoder for ENCODER_BACKEND, loaded once on first use"""
+    global model
+    if model is None:
+        with model_lock:
+            if model is None:
+                started = time.perf_counter()
+                model = load_encoder(ENCODER_BACKEND, MODEL_NAME, ENCODER_MODEL_DIR, ENCODER_THREADS)
+                startup_timings["model_load_seconds"] = time.perf_counter() - started
+    return model
+
+@functools.lru_cache(maxsize=None)
+def current_encoder_id() -> str:
+    """Identity of the configured encoder's vectors; keys the index and the embedding caches"""
+    return encoder_id(ENCODER_BACKEND, MODEL_NAME, ENCODER_MODEL_DIR)
+
+def encode_texts(texts: List[str]) -> np.ndarray:
+    """Unit-normalized embeddings for a batch of texts in one model call"""
+    return normalize_rows(get_model().encode(texts))
+
+# Concurrent query encodes are coalesced into batched model calls
+query_encoder = MicroBatchEncoder(
+    encode_texts,
+    max_batch_size=int(os.environ.get("ENCODE_MAX_BATCH", "32")),
+    max_wait_ms=float(os.environ.get("ENCODE_BATCH_WINDOW_MS", "5"))
+)
+
+# Query embedding cache: bounded in-process LRU with an optional shared SQLite tier;
+# opened by open_caches() along with the passage embedding cache
+query_cache: Optional[QueryEmbeddingCache] = None
+
+# Full /search/compare responses, keyed by request parameters and index version
+response_cache = LRUCache(max_entries=int(os.environ.get("RESPONSE_CACHE_SIZE", "1024")))
+
+# Worker pools keep CPU-bound work off the event loop. Encoding and scoring need the
+# in-process model and index, so they run on threads (torch and NumPy release the GIL);
+# document parsing is pure Python and runs in worker processes by default.
+SEARCH_WORKERS = int(os.environ.get("SEARCH_WORKERS", str(os.cpu_count() or 4)))
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", str(os.cpu_count() or 4)))
+PARSE_EXECUTOR = os.environ.get("PARSE_EXECUTOR", "process")
+SEARCH_TIMEOUT = float(os.environ.get("SEARCH_TIMEOUT", "30"))
+UPLOAD_TIMEOUT = float(os.environ.get("UPLOAD_TIMEOUT", "300"))
+# Uploads are copied here in chunks before parsing (default: the system temp directory)
+UPLOAD_SPOOL_DIR = os.environ.get("UPLOAD_SPOOL_DIR") or None
+
+search_executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="search")
+if PARSE_EXECUTOR == "process":
+    # Workers are forked from a single-threaded fork server, never from this threaded
+    # process, so they inherit none of its locks or open files. The server imports the
+    # main module once, so workers do not re-run it; "spawn" is the fallback where
+    # fork servers are unavailable.
+    parse_context = multiprocessing.get_context(
+        "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    )
+    if parse_context.get_start_method() == "forkserver":
+        parse_context.set_forkserver_preload(["__main__", "extraction", "ingest"])
+    parse_executor = ProcessPool(max_workers=PARSE_WORKERS, mp_context=parse_context)
+else:
+    parse_executor = ThreadPoolExecutor(max_workers=PARSE_WORKERS, thread_name_prefix="parse")
+
+async def run_in_pool(executor, fn, *args, **kwargs):
+    """Run a blocking call on a worker pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
 
 # Legal entities for hybrid similarity
 LEGAL_ENTITIES = {
@@ -51,9 +144,38 @@ LEGAL_ENTITIES = {
     'court': ['court fee', 'filing fee', 'judicial', 'litigation', 'judgment', 'decree']
 }
 
+class SearchFilters(BaseModel):
+    """Restricts a search to matching documents: any value of a field, every given field"""
+    categories: Optional[List[str]] = None
+    sources: Optional[List[str]] = None
+    acts: Optional[List[str]] = None
+    sections: Optional[List[str]] = None
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+
 class SearchRequest(BaseModel):
     query: str
     top_k: int = 5
+    lambda_param: float = Field(0.7, ge=0.0, le=1.0)
+    mmr_candidates: int = Field(50, ge=1)
+    hybrid_candidates: int = Field(200, ge=1)
+    exact: bool = False
+    nprobe: Optional[int] = Field(None, ge=1)
+    candidate_generator: Optional[Literal["ann", "lexical"]] = None
+    pooling: Optional[Literal["max", "sum"]] = None
+    filters: Optional[SearchFilters] = None
+
+SearchMethod = Literal["cosine", "euclidean", "mmr", "hybrid", "bm25"]
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    methods: Optional[List[SearchMethod]] = None
+    top_k: int = 5
+    lambda_param: float = Field(0.7, ge=0.0, le=1.0)
+    mmr_candidates: int = Field(50, ge=1)
+    hybrid_candidates: int = Field(200, ge=1)
+    pooling: Optional[Literal["max", "sum"]] = None
+    filters: Optional[SearchFilters] = None
 
 class SearchResult(BaseModel):
     document_id: str
@@ -61,6 +183,11 @@ class SearchResult(BaseModel):
     content: str
     score: float
     method: str
+    passage: Optional[str] = None
+
+class BatchSearchResult(BaseModel):
+    query: str
+    results: Dict[str, List[SearchResult]]
 
 class ComparisonResult(BaseModel):
     query: str
@@ -68,8 +195,22 @@ class ComparisonResult(BaseModel):
     euclidean_results: List[SearchResult]
     mmr_results: List[SearchResult]
     hybrid_results: List[SearchResult]
+    bm25_results: List[SearchResult] = []
     metrics: Dict[str, float]
 
+# Requests a coordinator (coordinator.py) sends to the shard processes it fans out to
+class ShardStatsRequest(BaseModel):
+    query: str
+    filters: Optional[SearchFilters] = None
+
+class ShardSearchRequest(SearchRequest):
+    query_vector: str
+    max_entity_score: float = 0.0
+    lexical_statistics: Dict
+
+class ShardDocumentsRequest(BaseModel):
+    rows: List[int]
+
 # Sample legal documents dataset
 SAMPLE_DOCUMENTS = [
     {
@@ -122,22 +263,549 @@ SAMPLE_DOCUMENTS = [
     }
 ]
 
-# Initialize document embeddings
-document_embeddings = None
-document_tfidf = None
+# Queries scored together are split so each (queries x docs) block stays under this many floats
+BATCH_BLOCK_ELEMENTS = int(os.environ.get("BATCH_BLOCK_ELEMENTS", str(16 * 1024 * 1024)))
+
+# Persistent index location (float32 matrix + document sidecar)
+INDEX_DIR = os.environ.get("INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "index_data"))
+# Set by coordinator.py when this process serves shard SHARD_INDEX of SHARD_COUNT: the shard
+# holds only documents whose content hash routes to it and gives uploads ids unique across shards
+SHARD_COUNT = int(os.environ.get("SHARD_COUNT", "1"))
+SHARD_INDEX = int(os.environ.get("SHARD_INDEX", "0"))
+# URLs of every shard in order, as given to the coordinator: uploads whose text belongs
+# to another shard are forwarded there once parsed instead of being rejected
+SHARD_URLS = [url.rstrip("/") for url in os.environ.get("SHARD_URLS", "").split(",") if url]
+
+# Uploads are indexed by background jobs; a full queue rejects new uploads with 429. Job
+# records are kept in INDEX_DIR by default, so every worker process can report every job
+JOBS_DB = os.environ.get("JOBS_DB", os.path.join(INDEX_DIR, "jobs.sqlite"))
+ingest_jobs = JobQueue(
+    workers=int(os.environ.get("INGEST_WORKERS", "2")),
+    max_pending=int(os.environ.get("INGEST_QUEUE_SIZE", "100")),
+    db_path=JOBS_DB or None
+)
+
+def check_shard(digest: bytes) -> None:
+    """Reject content that routes to another shard, where its duplicates would be found"""
+    owner = shard_for(digest, SHARD_COUNT)
+    if owner != SHARD_INDEX:
+        raise ValueError(f"Content belongs to shard {owner} of {SHARD_COUNT}; set SHARD_URLS on the shards to forward it there")
+
+# The vector and passage stores need the model's dimension, so they are opened by initialize()
+vector_store: Optional[VectorStore] = None
+documents: Optional[DocumentFile] = None
+entity_index = EntityIndex(INDEX_DIR, LEGAL_ENTITIES)
+lexical_index = BM25Index(INDEX_DIR)
+# Re-uploads of indexed content are recognised by hash and not written again
+content_hashes = ContentHashes(INDEX_DIR)
+# Upload time, source, category and cited acts/sections of every document, for filtered searches
+metadata_index = MetadataIndex(INDEX_DIR)
+# Filtered searches gather their partition's rows into contiguous blocks, kept per index version and filter
+partition_cache = LRUCache(
+    max_bytes=int(os.environ.get("PARTITION_CACHE_MB", "256")) * 1024 * 1024,
+    sizeof=lambda partition: partition.nbytes
+)
+# Partitions of up to this many documents are gathered into their own vectors; larger
+# ones are searched in place, with candidates from the whole index filtered by row
+PARTITION_GATHER_ROWS = int(os.environ.get("PARTITION_GATHER_ROWS", "20000"))
+
+# Documents are split into overlapping passages so long texts are not truncated by the model
+passage_index: Optional[PassageIndex] = None
+PASSAGE_WORDS = int(os.environ.get("PASSAGE_WORDS", "150"))
+PASSAGE_OVERLAP = int(os.environ.get("PASSAGE_OVERLAP", "30"))
+PASSAGE_BATCH_SIZE = int(os.environ.get("PASSAGE_BATCH_SIZE", "64"))
+# Passages of one upload encoded and spooled to disk together while its text streams in
+PASSAGE_WINDOW = int(os.environ.get("PASSAGE_WINDOW", "1024"))
+# With an ANN index, pooled passage scores re-rank this many document candidates
+PASSAGE_CANDIDATES = int(os.environ.get("PASSAGE_CANDIDATES", "200"))
+passage_meter = ThroughputMeter()
+# Passage embeddings by model and content hash; kept outside INDEX_DIR so rebuilding
+# the index from the same documents only encodes text the model has never seen
+EMBEDDING_CACHE = os.environ.get("EMBEDDING_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache.sqlite"))
+embedding_cache: Optional[EmbeddingCache] = None
+caches_lock = threading.Lock()
+
+def open_caches() -> None:
+    """Open the query and passage embedding caches once; their SQLite tiers are not opened at import
+    
+    Both are keyed by the encoder's identity, so vectors cached under one backend or
+    exported graph are never served to another.
+    """
+    global query_cache, embedding_cache
+    if query_cache is None:
+        with caches_lock:
+            if query_cache is None:
+                model_id = current_encoder_id()
+                if EMBEDDING_CACHE:
+                    embedding_cache = EmbeddingCache(EMBEDDING_CACHE, model_id)
+                # Assigned last: a set query_cache means both caches are open
+                query_cache = QueryEmbeddingCache(
+                    model_id,
+                    max_bytes=int(os.environ.get("QUERY_CACHE_MAX_MB", "64")) * 1024 * 1024,
+                    ttl=float(os.environ.get("QUERY_CACHE_TTL", "0")) or None,
+                    disk_path=os.environ.get("QUERY_CACHE_DISK") or None
+                )
+
+# Full scans read an int8 or float16 copy of the vectors when set, and rescore their best
+# RESCORE_CANDIDATES rows in float32; "float32" scans the float32 rows directly
+EMBEDDING_STORAGE = os.environ.get("EMBEDDING_STORAGE", "float32")
+RESCORE_CANDIDATES = int(os.environ.get("RESCORE_CANDIDATES", "100"))
+
+# Approximate nearest-neighbour backend ("ivf" or "exact"); small corpora are always scanned exactly
+ANN_BACKEND = os.environ.get("ANN_BACKEND", "ivf")
+if ANN_BACKEND == "ivf":
+    ann_index = IVFIndex(
+        INDEX_DIR,
+        min_documents=int(os.environ.get("ANN_MIN_DOCUMENTS", "20000")),
+        nprobe=int(os.environ.get("ANN_NPROBE", "8"))
+    )
+else:
+    ann_index = ExactIndex()
+
+# Candidate generator for large corpora: "ann" (vector index) or "lexical" (BM25 hits only)
+CANDIDATE_GENERATOR = os.environ.get("CANDIDATE_GENERATOR", "ann")
+LEXICAL_MIN_DOCUMENTS = int(os.environ.get("LEXICAL_MIN_DOCUMENTS", "20000"))
+LEXICAL_CANDIDATES = int(os.environ.get("LEXICAL_CANDIDATES", "1000"))
+
+# The published corpus; its version is bumped by every change, so older cached responses become unreachable
+index_snapshot: Optional[IndexSnapshot] = None
+
+# Serializes writers across threads and every worker process serving INDEX_DIR; searches never take it
+index_lock = IndexLock(os.path.join(INDEX_DIR, "index.lock"))
+# Only one thread per process adopts commits made by other processes
+refresh_lock = threading.Lock()
+
+initialize_lock = threading.Lock()
+index_ready = False
+warmed_up = False
+startup_error: Optional[str] = None
+
+def publish_snapshot(version: int) -> IndexSnapshot:
+    """Build a snapshot of everything committed so far and make it the one searches see
+    
+    Auxiliary rows are written before embedding rows, so sizing every view by the
+    embedding count gives arrays that all describe the same documents.
+    """
+    global index_snapshot
+    
+    embeddings = vector_store.embeddings.view()
+    count = len(embeddings)
+    snapshot = IndexSnapshot(
+        version,
+        DocumentList(vector_store.documents, count),
+        embeddings,
+        entity_index.view()[:count],
+        *passage_index.view(count),
+        compact_embeddings=vector_store.compact_view(count),
+        compact_passages=passage_index.compact_view(count)
+    )
+    # A single reference assignment: readers see the old snapshot or the new one, never a mix
+    index_snapshot = snapshot
+    return snapshot
+
+def filtered_snapshot(filters: Optional[SearchFilters], snapshot: IndexSnapshot) -> IndexSnapshot:
+    """The partition of ``snapshot`` matching ``filters``, or ``snapshot`` itself without filters
+    
+    Matching rows come from the metadata postings. Up to ``PARTITION_GATHER_ROWS`` of
+    them are gathered into their own snapshot, so searching it costs in proportion to
+    the partition, not the corpus; larger partitions are only masked, not copied.
+    """
+    if filters is None:
+        return snapshot
+    values = {
+        field: field_values
+        for field, field_values in (("category", filters.categories), ("act", filters.acts), ("section", filters.sections))
+        if field_values
+    }
+    if not values and not filters.sources and filters.uploaded_after is None and filters.uploaded_before is None:
+        return snapshot
+    
+    cache_key = (snapshot.version, json.dumps(jsonable_encoder(filters), sort_keys=True))
+    partition = partition_cache.get(cache_key)
+    if partition is None:
+        rows = metadata_index.filter(
+            len(snapshot),
+            values,
+            sources=filters.sources,
+            uploaded_after=upload_time(filters.uploaded_after) if filters.uploaded_after else None,
+            uploaded_before=upload_time(filters.uploaded_before) if filters.uploaded_before else None
+        )
+        partition = snapshot.subset(rows) if len(rows) <= PARTITION_GATHER_ROWS else snapshot.masked(rows)
+        partition_cache.put(cache_key, partition)
+    return partition
+
+def encode_passage_texts(texts: List[str], on_progress=None, done: int = 0, total: Optional[int] = None) -> np.ndarray:
+    """Encode passages in length-sorted batches, skipping those found in the embedding cache
+    
+    ``on_progress(encoded, total)`` counts from ``done`` passages encoded before these.
+    """
+    total = done + len(texts) if total is None else total
+    
+    def encode_misses(misses: List[str]) -> np.ndarray:
+        cached = done + len(texts) - len(misses)
+        return encode_sorted(
+            encode_texts,
+            misses,
+            PASSAGE_BATCH_SIZE,
+            on_progress=(lambda encoded: on_progress(cached + encoded, total)) if on_progress else None
+        )
+    
+    started = time.perf_counter()
+    if embedding_cache is not None:
+        vectors = embedding_cache.get_or_encode_many(texts, encode_misses)
+    else:
+        vectors = encode_misses(texts)
+    if on_progress:
+        # Also reached when every passage was cached and nothing was encoded
+        on_progress(done + len(texts), total)
+    passage_meter.record(len(texts), time.perf_counter() - started)
+    return vectors
+
+def encode_passages(docs: List[Dict], on_progress=None):
+    """Chunk documents and encode their passages in length-sorted batches
+    
+    Returns the passage spans per document and the passage vectors in document order.
+    ``on_progress(encoded, total)`` is called after every batch.
+    """
+    spans = [passage_index.chunk(doc['content']) for doc in docs]
+    texts = [doc['content'][start:stop] for doc, doc_spans in zip(docs, spans) for start, stop in doc_spans]
+    return spans, encode_passage_texts(texts, on_progress)
+
+def encode_passage_stream(chunks, vectors_path: str, total: int, on_progress=None):
+    """Encode a stream of ``(start, stop, text)`` passages of one document window by window
+    
+    Vectors go to ``vectors_path`` as each window is encoded, so only one window of
+    passages is in memory. Returns the spans and the vectors memory-mapped from the file.
+    """
+    spans = []
+    window = []
+    with open(vectors_path, 'wb') as f:
+        for chunk in itertools.chain(chunks, [None]):
+            if chunk is not None:
+                spans.append(chunk[:2])
+                window.append(chunk[2])
+            if window and (chunk is None or len(window) == PASSAGE_WINDOW):
+                vectors = encode_passage_texts(window, on_progress, done=len(spans) - len(window), total=total)
+                np.asarray(vectors, dtype=np.float32).tofile(f)
+                window = []
+    dim = passage_index.dim
+    return spans, np.memmap(vectors_path, dtype=np.float32, mode='r', shape=(len(spans), dim))
+
+def add_passages(first_row: int, spans: List[list], vectors: np.ndarray) -> None:
+    """Append the passages of consecutive documents starting at row ``first_row``"""
+    document_rows = np.repeat(np.arange(first_row, first_row + len(spans)), [len(doc_spans) for doc_spans in spans])
+    passage_index.add(document_rows, [span for doc_spans in spans for span in doc_spans], vectors)
 
 def initialize_embeddings():
-    global document_embeddings, document_tfidf
+    dim = get_model().get_sentence_embedding_dimension()
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    # Worker processes start together: one seeds or repairs the index, the rest open the result
+    with index_lock.exclusive():
+        open_index(dim)
+
+def open_index(dim: int) -> None:
+    """Open the stores in INDEX_DIR, seeding or re-encoding as needed; the caller holds ``index_lock``"""
+    global vector_store, documents, passage_index
+    
+    quantized = EMBEDDING_STORAGE != "float32"
+    vector_store = VectorStore(
+        INDEX_DIR, dim, current_encoder_id(),
+        compact=QuantizedMatrix(INDEX_DIR, "embeddings", dim, EMBEDDING_STORAGE) if quantized else None
+    )
+    documents = vector_store.documents
+    passage_index = PassageIndex(
+        INDEX_DIR, dim, current_encoder_id(), max_words=PASSAGE_WORDS, overlap=PASSAGE_OVERLAP,
+        compact=QuantizedMatrix(INDEX_DIR, "passages", dim, EMBEDDING_STORAGE) if quantized else None
+    )
+    
+    covered = passage_index.load(len(vector_store.documents))
+    seeded_at = datetime.now(timezone.utc).isoformat()
+    seed = [dict(doc, uploaded_at=seeded_at) for doc in SAMPLE_DOCUMENTS
+            if shard_for(content_hash(doc['content']), SHARD_COUNT) == SHARD_INDEX]
+    if not vector_store.documents and seed:
+        # Empty index: seed it with the sample corpus
+        add_passages(0, *encode_passages(seed))
+        vector_store.add(seed, passage_index.document_vectors(len(seed)))
+    elif vector_store.needs_reencode or covered < len(vector_store.documents):
+        # Stored vectors came from a different model or predate passage chunking:
+        # only documents without current passages are encoded again
+        add_passages(covered, *encode_passages(vector_store.documents[covered:]))
+        vector_store.rebuild(passage_index.document_vectors(len(vector_store.documents)))
     
-    # Create embeddings for all documents
-    texts = [doc['content'] for doc in SAMPLE_DOCUMENTS]
-    document_embeddings = model.encode(texts)
+    # Entity counts and postings are loaded from disk; only new categories or rows are processed
+    entity_index.sync(vector_store.documents)
+    content_hashes.sync(vector_store.documents)
+    metadata_index.sync(vector_store.documents)
+    lexical_index.load(vector_store.documents)
     
-    # Create TF-IDF vectors
-    document_tfidf = tfidf_vectorizer.fit_transform(texts)
+    # Existing rows are memory-mapped, not re-encoded
+    snapshot = publish_snapshot(vector_store.version)
+    ann_index.load(snapshot.embeddings)
 
-# Initialize on startup
-initialize_embeddings()
+def catch_up() -> bool:
+    """Adopt everything other processes committed to the index; the caller holds ``index_lock``"""
+    if not vector_store.changed_on_disk() or not vector_store.refresh():
+        return False
+    # The other stores were committed before meta.json, so they cover at least the new rows
+    entity_index.refresh()
+    content_hashes.refresh()
+    metadata_index.refresh()
+    passage_index.refresh()
+    lexical_index.refresh(vector_store.documents)
+    ann_index.refresh()
+    publish_snapshot(vector_store.version)
+    return True
+
+def refresh_index() -> None:
+    """Make documents uploaded through other worker processes visible to this one"""
+    with refresh_lock:
+        if vector_store.changed_on_disk():
+            with index_lock.shared():
+                catch_up()
+
+class TextFeatures:
+    """Everything the index derives from a document's text, gathered piece by piece
+    
+    ``update`` is fed the text as it streams past; ``finish`` then sets the content
+    hash, entity counts, BM25 term frequencies and cited (acts, sections).
+    """
+    
+    def __init__(self):
+        self._hasher = ContentHasher()
+        self._entities = EntityCounter(entity_index.matcher)
+        self._terms = TermCounter()
+        self._citations = CitationScanner()
+    
+    @classmethod
+    def of(cls, text: str) -> "TextFeatures":
+        features = cls()
+        features.update(text)
+        return features.finish()
+    
+    def update(self, piece: str) -> None:
+        self._hasher.update(piece)
+        self._entities.update(piece)
+        self._terms.update(piece)
+        self._citations.update(piece)
+    
+    def finish(self) -> "TextFeatures":
+        self.digest = self._hasher.digest()
+        self.entity_counts = self._entities.result()
+        self.terms = self._terms.result()
+        self.references = self._citations.result()
+        return self
+
+def write_documents(docs: List[Dict], spans: List[list], passage_vectors: np.ndarray,
+                    features: Optional[List[TextFeatures]] = None) -> List[Dict]:
+    """Append already-encoded documents to the index as one commit
+    
+    ``features`` are the documents' ``TextFeatures`` if already gathered, in which case
+    a ``content`` may be an iterable of text pieces (see ``DocumentFile.append``).
+    A document whose content is already indexed, or repeats earlier in ``docs``, is
+    not written again: it gets the original's id and ``duplicate: True``. Only the
+    ``content_hash`` of the text is compared, so title, category and source play no
+    part and the original keeps its own. On a shard,
+    content that routes to another shard raises ValueError (see ``check_shard``).
+    """
+    # Everything except the writes happens outside the lock so concurrent searches keep
+    # using the current snapshot; a document vector is the mean of its passage vectors
+    first_passages = np.cumsum([0] + [len(doc_spans) for doc_spans in spans[:-1]])
+    embeddings = normalize_rows(np.add.reduceat(passage_vectors, first_passages, axis=0))
+    if features is None:
+        features = [TextFeatures.of(doc['content']) for doc in docs]
+    entity_counts = np.array([doc_features.entity_counts for doc_features in features], dtype=np.int32)
+    digests = [doc_features.digest for doc_features in features]
+    for digest in digests:
+        check_shard(digest)
+    metadata_keys = [document_keys(doc, doc_features.references) for doc, doc_features in zip(docs, features)]
+    
+    with index_lock.exclusive():
+        # Rows are appended after whatever other worker processes committed
+        catch_up()
+        # Ids are assigned under the lock so concurrent uploads never collide
+        first_row = len(documents)
+        originals: Dict[bytes, Dict] = {}
+        keep = []
+        for i, (doc, digest) in enumerate(zip(docs, digests)):
+            row = content_hashes.find(digest, first_row)
+            original = documents[row] if row is not None else originals.get(digest)
+            if original is not None:
+                doc.update(id=original["id"], duplicate=True)
+                continue
+            doc.setdefault("id", new_document_id(first_row + len(keep)))
+            originals[digest] = doc
+            keep.append(i)
+        if not keep:
+            return docs
+        
+        new_docs = [docs[i] for i in keep]
+        # Stamped under the lock, so upload times never decrease along rows
+        uploaded_at = datetime.now(timezone.utc).isoformat()
+        for doc in new_docs:
+            doc["uploaded_at"] = uploaded_at
+        if len(keep) < len(docs):
+            passage_vectors = np.concatenate([passage_vectors[first_passages[i]:first_passages[i] + len(spans[i])] for i in keep])
+            spans = [spans[i] for i in keep]
+            embeddings = embeddings[keep]
+            entity_counts = entity_counts[keep]
+        
+        # Auxiliary rows first: readers size everything by the embedding view
+        entity_index.add(entity_counts)
+        content_hashes.add([digests[i] for i in keep])
+        metadata_index.add(new_docs, [metadata_keys[i] for i in keep])
+        lexical_index.add_terms([features[i].terms for i in keep])
+        add_passages(first_row, spans, passage_vectors)
+        # Nothing is visible to searches until the next snapshot is published
+        rows = vector_store.add(new_docs, embeddings)
+        ann_index.add(vector_store.embeddings.view(), rows)
+        snapshot = publish_snapshot(vector_store.version)
+        ann_index.maybe_train(snapshot.embeddings)
+    
+    return docs
+
+def new_document_id(row: int) -> str:
+    """Id of an uploaded document; a shard adds its index so ids are unique across shards"""
+    return f"uploaded_{row}" if SHARD_COUNT == 1 else f"uploaded_{SHARD_INDEX}_{row}"
+
+def add_document(doc: Dict) -> Dict:
+    """Encode a single new document and append it to the index"""
+    return write_documents([doc], *encode_passages([doc]))[0]
+
+def forward_upload(owner: int, text_path: str, title: str) -> str:
+    """Queue the extracted text of an upload on the shard that owns it; returns that shard's job id"""
+    with open(text_path, "rb") as f:
+        response = requests.post(f"{SHARD_URLS[owner]}/upload", files={"file": (title + ".txt", f)},
+                                 data={"title": title}, timeout=UPLOAD_TIMEOUT)
+    response.raise_for_status()
+    return response.json()["job_id"]
+
+def run_upload_job(job: Job, path: str, filename: str, title: Optional[str] = None) -> None:
+    """Parse, encode and index one spooled upload, reporting progress on the job
+    
+    The text streams from the parser to a spooled text file, the chunker and
+    ``TextFeatures``. Passages are then encoded window by window from that file, and
+    the document store copies the text from it, so neither the text, the passage
+    texts nor their vectors are held in memory all at once. On a shard, text that
+    belongs to another shard is forwarded there as plain text when ``SHARD_URLS`` is
+    set, and the job ends ``forwarded`` with that shard's job id.
+    """
+    title = title or filename
+    text_path = path + ".txt"
+    vectors_path = path + ".f32"
+    try:
+        job.update(status="parsing")
+        features = TextFeatures()
+        with open(text_path, "w", encoding="utf-8", newline="") as text_file:
+            def pieces():
+                # PDF page ranges are extracted in parallel on the parse pool
+                for piece in iter_text(
+                    path,
+                    filename,
+                    parse_executor,
+                    on_progress=lambda done, total: job.update(pages_parsed=done, pages_total=total)
+                ):
+                    text_file.write(piece)
+                    features.update(piece)
+                    yield piece
+            chunks_total = sum(1 for _ in passage_index.iter_chunks(pieces()))
+        os.remove(path)
+        
+        digest = features.finish().digest
+        owner = shard_for(digest, SHARD_COUNT)
+        if owner != SHARD_INDEX and SHARD_URLS:
+            # Parsed once: the owner only reads the text, and finds any duplicates
+            job.update(status="forwarded", shard=owner, forwarded_job_id=forward_upload(owner, text_path, title))
+            return
+        check_shard(digest)
+        
+        # A re-upload of indexed content is answered before anything is encoded
+        snapshot = index_snapshot
+        row = content_hashes.find(digest, len(snapshot))
+        if row is not None:
+            job.update(status="done", indexed=True, duplicate=True, document_id=snapshot.documents[row]["id"])
+            return
+        
+        job.update(status="encoding")
+        spans, passage_vectors = encode_passage_stream(
+            passage_index.iter_chunks(iter_plain_text(text_path)),
+            vectors_path,
+            chunks_total,
+            on_progress=lambda done, total: job.update(chunks_encoded=done, chunks_total=total)
+        )
+        
+        new_doc = {
+            "title": title,
+            "content": TextFile(text_path),
+            "category": "uploaded",
+            "source": title
+        }
+        job.update(status="indexing")
+        write_documents([new_doc], [spans], passage_vectors, [features])
+        job.update(status="done", indexed=True, duplicate=new_doc.get("duplicate", False), document_id=new_doc["id"])
+    finally:
+        for leftover in (path, text_path, vectors_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+def run_batch_job(job: Job, paths: List[str], filenames: List[str]) -> None:
+    """Index many spooled uploads as one pipeline on the job's worker, reporting progress on the job"""
+    sources = [{"path": path, "filename": filename, "source": filename} for path, filename in zip(paths, filenames)]
+    try:
+        job.update(status="indexing")
+        # Files are parsed in parallel on the parse pool; every batch is committed as one write
+        report = run_pipeline(
+            sources, encode_passages, write_documents, parse_executor,
+            on_batch=lambda report: job.update(documents=report["documents"], duplicates=report["duplicates"])
+        )
+        job.update(status="done", **report)
+    finally:
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+def initialize() -> None:
+    """Load the model and open the index on first use; later calls return at once"""
+    global index_ready
+    if index_ready:
+        return
+    
+    with initialize_lock:
+        if index_ready:
+            return
+        started = time.perf_counter()
+        open_caches()
+        initialize_embeddings()
+        # The model load is timed on its own; this is the index part
+        startup_timings["index_load_seconds"] = time.perf_counter() - started - startup_timings.get("model_load_seconds", 0.0)
+        index_ready = True
+
+def warm_up() -> None:
+    """Initialize everything and run one dummy encode so the first real query is not slow"""
+    global warmed_up, startup_error
+    try:
+        initialize()
+        started = time.perf_counter()
+        encode_texts(["warm up"])
+        startup_timings["warm_up_seconds"] = time.perf_counter() - started
+        warmed_up = True
+    except Exception as e:
+        startup_error = str(e)
+
+# Probes answer without loading anything; every other request waits for initialization
+PROBE_PATHS = {"/", "/health/live", "/health/ready"}
+
+@app.middleware("http")
+async def require_initialized(request: Request, call_next):
+    if request.url.path not in PROBE_PATHS:
+        if not index_ready:
+            try:
+                await run_in_pool(search_executor, initialize)
+            except Exception as e:
+                return JSONResponse(status_code=503, content={"detail": f"Index failed to load: {e}"})
+        elif vector_store.changed_on_disk():
+            # Another worker process committed uploads: adopt them before serving
+            await run_in_pool(search_executor, refresh_index)
+    return await call_next(request)
 
 def preprocess_text(text: str) -> str:
     """Preprocess text by removing special characters and converting to lowercase"""
@@ -147,179 +815,416 @@ def preprocess_text(text: str) -> str:
 
 def extract_legal_entities(text: str) -> Dict[str, int]:
     """Extract legal entities from text for hybrid similarity"""
-    text_lower = text.lower()
-    entity_counts = {}
-    
-    for category, entities in LEGAL_ENTITIES.items():
-        count = 0
-        for entity in entities:
-            count += len(re.findall(r'\b' + re.escape(entity) + r'\b', text_lower))
-        entity_counts[category] = count
-    
-    return entity_counts
+    counts = entity_index.matcher.count(text)
+    return {category: int(count) for category, count in zip(entity_index.matcher.categories, counts)}
+
+def encode_query(query: str) -> np.ndarray:
+    """Unit-normalized query embedding; repeated queries skip the transformer"""
+    open_caches()
+    return query_cache.get_or_encode(query, query_encoder.encode)
+
+def euclidean_from_cosine(similarities: np.ndarray) -> np.ndarray:
+    """Euclidean distance between unit vectors from their dot product: |a-b|^2 = 2 - 2a.b"""
+    return np.sqrt(np.maximum(2.0 - 2.0 * similarities, 0.0))
 
-def cosine_similarity_search(query: str, top_k: int = 5) -> List[SearchResult]:
-    """Perform cosine similarity search"""
-    query_embedding = model.encode([query])
-    similarities = cosine_similarity(query_embedding, document_embeddings)[0]
+class QueryContext:
+    """Per-request query state shared by every search method
     
-    # Get top k results
-    top_indices = np.argsort(similarities)[::-1][:top_k]
+    The query is encoded at most once (and only if a dense method needs it) and the
+    cosine similarity vector is computed at most once, against the index snapshot
+    that was current when the request started. Document rows are stored
+    unit-normalized, so cosine similarity is a single float32 matrix-vector product
+    and Euclidean distance is derived from it.
     
-    results = []
-    for idx in top_indices:
-        doc = SAMPLE_DOCUMENTS[idx]
-        results.append(SearchResult(
-            document_id=doc['id'],
-            title=doc['title'],
-            content=doc['content'],
-            score=float(similarities[idx]),
-            method="cosine"
-        ))
+    With quantized storage, full scans read the compact copy and each method
+    rescores its shortlist against the float32 rows. ``exact`` requests scan
+    float32 directly unless ``quantized`` says otherwise.
+    """
     
-    return results
-
-def euclidean_distance_search(query: str, top_k: int = 5) -> List[SearchResult]:
-    """Perform Euclidean distance search"""
-    query_embedding = model.encode([query])
-    distances = euclidean_distances(query_embedding, document_embeddings)[0]
+    def __init__(self, query: str, exact: bool = False, nprobe: Optional[int] = None,
+                 generator: Optional[str] = None, snapshot: Optional[IndexSnapshot] = None,
+                 query_vector: Optional[np.ndarray] = None, similarities: Optional[np.ndarray] = None,
+                 quantized: Optional[bool] = None, lexical_statistics: Optional[Dict] = None):
+        self.query = query
+        self.exact = exact
+        self.nprobe = nprobe
+        self.generator = generator or CANDIDATE_GENERATOR
+        # Batch searches pass in a shared snapshot and their precomputed row of the score matrix
+        self.snapshot = snapshot if snapshot is not None else index_snapshot
+        self.documents = self.snapshot.documents
+        self.embeddings = self.snapshot.embeddings
+        self.entity_counts = self.snapshot.entity_counts
+        self.passage_vectors = self.snapshot.passage_vectors
+        self.passage_documents = self.snapshot.passage_documents
+        self.passage_spans = self.snapshot.passage_spans
+        use_compact = not exact if quantized is None else quantized
+        self.compact_embeddings = self.snapshot.compact_embeddings if use_compact else None
+        self.compact_passages = self.snapshot.compact_passages if use_compact else None
+        self._query_vector = query_vector
+        self._similarities = similarities
+        # A shard scores BM25 with the statistics of the whole corpus it is part of
+        self.lexical_statistics = lexical_statistics
+        self._passage_similarities = None
+        self._query_entity_counts = None
+        self._lexical = None
+        self._lexical_limit = 0
+        # Row of every document a method returned, by id, for the metrics
+        self.result_rows: Dict[str, int] = {}
     
-    # Convert distances to similarity scores (lower distance = higher similarity)
-    max_distance = np.max(distances)
-    similarities = 1 - (distances / max_distance)
+    @property
+    def query_vector(self) -> np.ndarray:
+        if self._query_vector is None:
+            self._query_vector = encode_query(self.query)
+        return self._query_vector
     
-    # Get top k results
-    top_indices = np.argsort(similarities)[::-1][:top_k]
+    def lexical(self, k: int = LEXICAL_CANDIDATES):
+        """BM25 (rows, scores) over the rows visible to this request, best first"""
+        if self._lexical is None or k > self._lexical_limit:
+            self._lexical_limit = max(k, LEXICAL_CANDIDATES)
+            if self.snapshot.rows is None:
+                self._lexical = lexical_index.search(self.query, self._lexical_limit, limit=len(self.embeddings),
+                                                     statistics=self.lexical_statistics, only=self.snapshot.matching)
+            else:
+                # A partition is scored with the statistics of the whole corpus, then numbered like its rows
+                rows, scores = lexical_index.search(self.query, self._lexical_limit, limit=len(self.snapshot.parent),
+                                                    statistics=self.lexical_statistics, only=self.snapshot.rows)
+                self._lexical = np.searchsorted(self.snapshot.rows, rows), scores
+        rows, scores = self._lexical
+        return rows[:k], scores[:k]
     
-    results = []
-    for idx in top_indices:
-        doc = SAMPLE_DOCUMENTS[idx]
-        results.append(SearchResult(
-            document_id=doc['id'],
-            title=doc['title'],
-            content=doc['content'],
-            score=float(similarities[idx]),
-            method="euclidean"
-        ))
+    @property
+    def similarities(self) -> np.ndarray:
+        """Cosine similarity of every document; approximate when read from the quantized copy"""
+        if self._similarities is None:
+            if self.compact_embeddings is not None:
+                self._similarities = self.compact_embeddings.dot(self.query_vector)
+            else:
+                self._similarities = self.embeddings @ self.query_vector
+        return self._similarities
     
-    return results
-
-def mmr_search(query: str, top_k: int = 5, lambda_param: float = 0.7) -> List[SearchResult]:
-    """Perform Maximum Marginal Relevance (MMR) search"""
-    query_embedding = model.encode([query])
-    similarities = cosine_similarity(query_embedding, document_embeddings)[0]
+    @property
+    def passage_similarities(self) -> np.ndarray:
+        """Cosine similarity of every passage; approximate when read from the quantized copy"""
+        if self._passage_similarities is None:
+            if self.compact_passages is not None:
+                self._passage_similarities = self.compact_passages.dot(self.query_vector)
+            else:
+                self._passage_similarities = self.passage_vectors @ self.query_vector
+        return self._passage_similarities
     
-    selected_indices = []
-    remaining_indices = list(range(len(SAMPLE_DOCUMENTS)))
+    @property
+    def rescoring(self) -> bool:
+        """Whether full-scan scores are approximate, so shortlists are rescored in float32"""
+        return self.compact_embeddings is not None and not self.approximate
     
-    for _ in range(min(top_k, len(SAMPLE_DOCUMENTS))):
-        mmr_scores = []
-        
-        for idx in remaining_indices:
-            relevance_score = similarities[idx]
-            
-            if not selected_indices:
-                diversity_score = 0
-            else:
-                # Calculate maximum similarity with already selected documents
-                selected_embeddings = document_embeddings[selected_indices]
-                current_embedding = document_embeddings[idx].reshape(1, -1)
-                max_similarity = np.max(cosine_similarity(current_embedding, selected_embeddings))
-                diversity_score = max_similarity
-            
-            mmr_score = lambda_param * relevance_score - (1 - lambda_param) * diversity_score
-            mmr_scores.append((idx, mmr_score))
+    def shortlist(self, scores: np.ndarray, k: int) -> np.ndarray:
+        """Best k rows of full-scan scores, widened to RESCORE_CANDIDATES when they will be rescored"""
+        return top_k_indices(scores, max(k, RESCORE_CANDIDATES) if self.rescoring else k)
+    
+    def passage_scores(self, pooling: str, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Document scores pooled ("max" or "sum", see ``pool``) from passage similarities, for all rows or the given ones"""
+        if rows is None:
+            starts = np.searchsorted(self.passage_documents, np.arange(len(self.embeddings)))
+            return pool(self.passage_similarities, starts, pooling)
         
-        # Select document with highest MMR score
-        best_idx = max(mmr_scores, key=lambda x: x[1])[0]
-        selected_indices.append(best_idx)
-        remaining_indices.remove(best_idx)
+        # Only the passages of the candidate documents are scored
+        starts = np.searchsorted(self.passage_documents, rows)
+        stops = np.searchsorted(self.passage_documents, rows + 1)
+        passages = np.concatenate([np.arange(start, stop) for start, stop in zip(starts, stops)]) \
+            if len(rows) else np.empty(0, dtype=np.int64)
+        if self._passage_similarities is not None and self.compact_passages is None:
+            similarities = self._passage_similarities[passages]
+        else:
+            similarities = self.passage_vectors[passages] @ self.query_vector
+        return pool(similarities, np.concatenate([[0], np.cumsum(stops - starts)[:-1]]).astype(np.int64), pooling)
     
-    results = []
-    for idx in selected_indices:
-        doc = SAMPLE_DOCUMENTS[idx]
-        results.append(SearchResult(
-            document_id=doc['id'],
-            title=doc['title'],
-            content=doc['content'],
-            score=float(similarities[idx]),
-            method="mmr"
-        ))
+    def best_passage(self, row: int) -> str:
+        """Text of the document's passage most similar to the query"""
+        start, stop = np.searchsorted(self.passage_documents, [row, row + 1])
+        similarities = self.passage_vectors[start:stop] @ self.query_vector
+        span_start, span_stop = self.passage_spans[start + int(np.argmax(similarities))]
+        return self.documents[row]['content'][span_start:span_stop]
     
-    return results
-
-def hybrid_similarity_search(query: str, top_k: int = 5) -> List[SearchResult]:
-    """Perform hybrid similarity search (0.6 * cosine + 0.4 * legal entity match)"""
-    query_embedding = model.encode([query])
-    cosine_similarities = cosine_similarity(query_embedding, document_embeddings)[0]
+    @property
+    def approximate(self) -> bool:
+        """Whether candidate retrieval avoids a full scan of the corpus"""
+        if self.snapshot.mask is not None:
+            # A masked partition always takes the candidate path, which keeps to its rows
+            return True
+        if self.exact:
+            return False
+        if self.generator == "lexical":
+            return len(self.embeddings) >= LEXICAL_MIN_DOCUMENTS and len(self.lexical()[0]) > 0
+        # The ANN index covers the whole corpus; a filtered partition is scanned exactly
+        return self.snapshot.rows is None and ann_index.is_ready(len(self.embeddings))
     
-    # Extract legal entities from query
-    query_entities = extract_legal_entities(query)
+    @property
+    def scans_partition(self) -> bool:
+        """Whether candidates of a masked partition come from a full scan rather than an index"""
+        if self.snapshot.mask is None:
+            return False
+        if self.exact:
+            return True
+        if self.generator == "lexical":
+            return len(self.embeddings) < LEXICAL_MIN_DOCUMENTS or not len(self.lexical()[0])
+        return not ann_index.is_ready(len(self.embeddings))
     
-    # Calculate entity match scores
-    entity_scores = []
-    for doc in SAMPLE_DOCUMENTS:
-        doc_entities = extract_legal_entities(doc['content'])
+    def partition_candidates(self, k: int) -> np.ndarray:
+        """The k most similar rows of a masked partition, best first
         
-        # Calculate entity overlap score
-        total_query_entities = sum(query_entities.values())
-        if total_query_entities == 0:
-            entity_score = 0
-        else:
-            overlap_score = 0
-            for category, count in query_entities.items():
-                if count > 0 and doc_entities.get(category, 0) > 0:
-                    overlap_score += min(count, doc_entities[category])
-            entity_score = overlap_score / total_query_entities
+        Index candidates are over-fetched in proportion to how much of the corpus the
+        partition covers and then filtered by row; when too few of them match, or
+        ``scans_partition``, every row is scanned (the quantized copy if there is one)
+        and only matching rows are kept.
+        """
+        matching = self.snapshot.matching
+        k = min(k, len(matching))
+        if not self.scans_partition:
+            if self.generator == "lexical":
+                # BM25 hits are already limited to the partition
+                rows = self.lexical()[0]
+                return rows[top_k_indices(self.scores(rows), k)]
+            wanted = min(len(self.embeddings), 2 * k * len(self.embeddings) // len(matching) + k)
+            rows = ann_index.search(self.embeddings, self.query_vector, wanted, nprobe=self.nprobe)[0]
+            rows = rows[self.snapshot.mask[rows]]
+            if len(rows) >= k:
+                return rows[:k]
         
-        entity_scores.append(entity_score)
+        similarities = self.similarities[matching]
+        if self.compact_embeddings is None:
+            return matching[top_k_indices(similarities, k)]
+        rows = matching[top_k_indices(similarities, max(k, RESCORE_CANDIDATES))]
+        return rows[top_k_indices(self.scores(rows), k)]
     
-    # Normalize entity scores
-    max_entity_score = max(entity_scores) if max(entity_scores) > 0 else 1
-    normalized_entity_scores = [score / max_entity_score for score in entity_scores]
+    def candidates(self, k: int) -> np.ndarray:
+        """Row indices of the k most similar documents, best first"""
+        if self.snapshot.mask is not None:
+            return self.partition_candidates(k)
+        if self.approximate:
+            if self.generator == "lexical":
+                # Dense scoring only runs on the documents that matched lexically
+                rows = self.lexical()[0]
+                return rows[top_k_indices(self.scores(rows), k)]
+            return ann_index.search(self.embeddings, self.query_vector, k, nprobe=self.nprobe)[0]
+        rows = self.shortlist(self.similarities, k)
+        if self.rescoring:
+            rows = rows[top_k_indices(self.scores(rows), k)]
+        return rows
     
-    # Calculate hybrid scores
-    hybrid_scores = []
-    for i in range(len(SAMPLE_DOCUMENTS)):
-        hybrid_score = 0.6 * cosine_similarities[i] + 0.4 * normalized_entity_scores[i]
-        hybrid_scores.append(hybrid_score)
+    def scores(self, rows: np.ndarray) -> np.ndarray:
+        """Exact cosine similarity of the given rows, without scanning the whole corpus"""
+        if self._similarities is not None and self.compact_embeddings is None:
+            return self._similarities[rows]
+        return self.embeddings[rows] @ self.query_vector
     
-    # Get top k results
-    top_indices = np.argsort(hybrid_scores)[::-1][:top_k]
+    def prepare(self) -> "QueryContext":
+        """Compute shared state up front so concurrent methods only read it"""
+        self.query_vector
+        if not self.approximate:
+            self.similarities
+            self.passage_similarities
+        elif self.scans_partition:
+            self.similarities
+        self.query_entity_counts
+        self.lexical()
+        return self
     
+    @property
+    def query_entity_counts(self) -> np.ndarray:
+        if self._query_entity_counts is None:
+            self._query_entity_counts = entity_index.matcher.count(self.query)
+        return self._query_entity_counts
+
+def build_results(context: QueryContext, rows: np.ndarray, scores: np.ndarray, method: str,
+                  passages: bool = False) -> List[SearchResult]:
+    """A SearchResult per row, optionally with the passage that matched best"""
     results = []
-    for idx in top_indices:
-        doc = SAMPLE_DOCUMENTS[idx]
+    for idx, score in zip(rows, scores):
+        doc = context.documents[idx]
+        context.result_rows[doc['id']] = int(idx)
         results.append(SearchResult(
             document_id=doc['id'],
             title=doc['title'],
             content=doc['content'],
-            score=float(hybrid_scores[idx]),
-            method="hybrid"
+            score=float(score),
+            method=method,
+            passage=context.best_passage(idx) if passages else None
         ))
-    
     return results
 
-def calculate_metrics(results_dict: Dict[str, List[SearchResult]], query: str) -> Dict[str, float]:
-    """Calculate precision, recall, and diversity metrics"""
+def cosine_rows(context: QueryContext, top_k: int, pooling: Optional[str] = None):
+    """(rows, scores) of the top_k documents by cosine similarity, optionally pooled from passages"""
+    if pooling is None:
+        # Get top k results
+        top_indices = context.candidates(top_k)
+        similarities = context.scores(top_indices)
+    elif context.approximate:
+        # Re-rank the nearest documents by their pooled passage scores
+        rows = context.candidates(max(PASSAGE_CANDIDATES, top_k))
+        pooled = context.passage_scores(pooling, rows)
+        best = top_k_indices(pooled, top_k)
+        top_indices, similarities = rows[best], pooled[best]
+    else:
+        pooled = context.passage_scores(pooling)
+        top_indices = context.shortlist(pooled, top_k)
+        if context.rescoring:
+            # Pool the shortlist again from the float32 passage vectors
+            pooled = context.passage_scores(pooling, top_indices)
+            best = top_k_indices(pooled, top_k)
+            top_indices, similarities = top_indices[best], pooled[best]
+        else:
+            similarities = pooled[top_indices]
+    return top_indices, similarities
+
+def cosine_similarity_search(query: str, top_k: int = 5, context: Optional[QueryContext] = None,
+                             pooling: Optional[str] = None) -> List[SearchResult]:
+    """Perform cosine similarity search, optionally pooling passage scores per document"""
+    context = context or QueryContext(query)
+    return build_results(context, *cosine_rows(context, top_k, pooling), "cosine", passages=pooling is not None)
+
+def euclidean_max_distance(context: QueryContext) -> float:
+    """Largest distance from the query to any document, which scales Euclidean scores"""
+    if context.approximate or not len(context.embeddings):
+        # Unknown without a full scan (or nothing to scan): use the bound for unit vectors instead
+        return 2.0
+    farthest = np.array([np.argmin(context.similarities)])
+    if context.rescoring:
+        # The farthest document is rescored as well, so the scale is exact too
+        return float(euclidean_from_cosine(context.scores(farthest))[0])
+    return float(euclidean_from_cosine(context.similarities[farthest])[0])
+
+def euclidean_rows(context: QueryContext, top_k: int, max_distance: Optional[float] = None):
+    """(rows, scores) of the top_k documents by Euclidean distance, scored 1 - distance / max_distance"""
+    if max_distance is None:
+        max_distance = euclidean_max_distance(context)
     
-    # For demonstration, we'll use a simple relevance judgment
-    # In practice, this would be based on human annotations
-    relevant_docs = set()
-    query_lower = query.lower()
+    if context.approximate:
+        # Distance ranks like cosine, so the nearest candidates are the closest documents
+        top_indices = context.candidates(top_k)
+        similarities = 1 - euclidean_from_cosine(context.scores(top_indices)) / max_distance
+    else:
+        # Convert distances to similarity scores (lower distance = higher similarity)
+        similarities = 1 - euclidean_from_cosine(context.similarities) / max_distance
+        
+        # Get top k results
+        top_indices = context.shortlist(similarities, top_k)
+        if context.rescoring:
+            similarities = 1 - euclidean_from_cosine(context.scores(top_indices)) / max_distance
+            best = top_k_indices(similarities, top_k)
+            top_indices, similarities = top_indices[best], similarities[best]
+        else:
+            similarities = similarities[top_indices]
+    return top_indices, similarities
+
+def euclidean_distance_search(query: str, top_k: int = 5, context: Optional[QueryContext] = None) -> List[SearchResult]:
+    """Perform Euclidean distance search"""
+    context = context or QueryContext(query)
+    return build_results(context, *euclidean_rows(context, top_k), "euclidean")
+
+def mmr_select(relevance_scores: np.ndarray, candidate_embeddings: np.ndarray, top_k: int,
+               lambda_param: float) -> List[int]:
+    """Indices of the candidates Maximum Marginal Relevance picks, in the order it picks them"""
+    selected = []
+    available = np.ones(len(relevance_scores), dtype=bool)
+    # Running maximum similarity of each candidate to the documents selected so far
+    max_similarity = np.zeros(len(relevance_scores), dtype=np.float32)
     
-    # Simple relevance judgment based on query terms
-    for doc in SAMPLE_DOCUMENTS:
-        doc_content_lower = doc['content'].lower()
-        doc_title_lower = doc['title'].lower()
+    for round_idx in range(min(top_k, len(relevance_scores))):
+        mmr_scores = lambda_param * relevance_scores - (1 - lambda_param) * max_similarity
+        mmr_scores[~available] = -np.inf
         
-        # Check if query terms appear in document
-        query_terms = query_lower.split()
-        matches = sum(1 for term in query_terms if term in doc_content_lower or term in doc_title_lower)
+        # Select document with highest MMR score
+        best = int(np.argmax(mmr_scores))
+        selected.append(best)
+        available[best] = False
         
-        if matches >= len(query_terms) * 0.5:  # At least 50% of query terms match
-            relevant_docs.add(doc['id'])
+        # One matrix-vector product updates the diversity term for every candidate
+        similarity_to_best = candidate_embeddings @ candidate_embeddings[best]
+        if round_idx == 0:
+            max_similarity = similarity_to_best
+        else:
+            max_similarity = np.maximum(max_similarity, similarity_to_best)
+    
+    return selected
+
+def mmr_search(query: str, top_k: int = 5, lambda_param: float = 0.7, candidate_pool: int = 50,
+               context: Optional[QueryContext] = None) -> List[SearchResult]:
+    """Perform Maximum Marginal Relevance (MMR) search"""
+    context = context or QueryContext(query)
+    
+    # MMR only reorders the most relevant documents, never the whole corpus
+    candidates = context.candidates(max(candidate_pool, top_k))
+    relevance_scores = context.scores(candidates)
+    selected = mmr_select(relevance_scores, context.embeddings[candidates], top_k, lambda_param)
+    return build_results(context, candidates[selected], relevance_scores[selected], "mmr")
+
+def entity_match_scores(context: QueryContext, rows: np.ndarray) -> np.ndarray:
+    """Entity overlap of each row: sum over categories of min(query count, document count) / query total"""
+    query_counts = context.query_entity_counts
+    total_query_entities = query_counts.sum()
+    if total_query_entities == 0:
+        return np.zeros(len(rows), dtype=np.float32)
+    return np.minimum(context.entity_counts[rows], query_counts).sum(axis=1) / total_query_entities
+
+def hybrid_rows(context: QueryContext, top_k: int, candidate_pool: int = 200,
+                max_entity_score: Optional[float] = None):
+    """(rows, scores) of the top_k documents by 0.6 * cosine + 0.4 * normalized entity match
+    
+    Entity scores are normalized by the best one among the scored rows, or by
+    ``max_entity_score`` when it is given (e.g. the best across every shard).
+    """
+    # With an ANN index only the nearest candidates are blended; otherwise every document
+    if context.approximate:
+        rows = context.candidates(max(candidate_pool, top_k))
+        cosine_similarities = context.scores(rows)
+    else:
+        rows = np.arange(len(context.embeddings))
+        cosine_similarities = context.similarities
+    
+    entity_scores = entity_match_scores(context, rows)
     
+    # Normalize entity scores
+    if max_entity_score is None:
+        max_entity_score = entity_scores.max() if len(entity_scores) else 0
+    max_entity_score = max_entity_score if max_entity_score > 0 else 1
+    
+    # Calculate hybrid scores
+    hybrid_scores = 0.6 * cosine_similarities + 0.4 * (entity_scores / max_entity_score)
+    
+    # Get top k results
+    top_indices = context.shortlist(hybrid_scores, top_k)
+    if context.rescoring:
+        hybrid_scores[top_indices] = 0.6 * context.scores(rows[top_indices]) \
+            + 0.4 * (entity_scores[top_indices] / max_entity_score)
+        top_indices = top_indices[top_k_indices(hybrid_scores[top_indices], top_k)]
+    return rows[top_indices], hybrid_scores[top_indices]
+
+def hybrid_similarity_search(query: str, top_k: int = 5, candidate_pool: int = 200,
+                             context: Optional[QueryContext] = None) -> List[SearchResult]:
+    """Perform hybrid similarity search (0.6 * cosine + 0.4 * legal entity match)"""
+    context = context or QueryContext(query)
+    return build_results(context, *hybrid_rows(context, top_k, candidate_pool), "hybrid")
+
+def bm25_search(query: str, top_k: int = 5, context: Optional[QueryContext] = None) -> List[SearchResult]:
+    """Perform lexical BM25 search (no transformer pass)"""
+    context = context or QueryContext(query)
+    return build_results(context, *context.lexical(top_k), "bm25")
+
+def is_relevant(query_terms: List[str], doc: Dict) -> bool:
+    """Simple relevance judgment: at least half of the query terms appear in the document"""
+    doc_content_lower = doc['content'].lower()
+    doc_title_lower = doc['title'].lower()
+    matches = sum(1 for term in query_terms if term in doc_content_lower or term in doc_title_lower)
+    return matches >= len(query_terms) * 0.5
+
+def result_metrics(results_dict: Dict[str, List[SearchResult]], relevant_docs: set, relevant_total: int,
+                   embedding_of) -> Dict[str, float]:
+    """Precision, recall and diversity of each method's results
+    
+    ``relevant_docs`` holds at least the relevant ids among the results, ``relevant_total``
+    is the number of relevant documents recall is measured against and
+    ``embedding_of(document_id)`` gives a result's vector.
+    """
     metrics = {}
     
     for method, results in results_dict.items():
@@ -329,22 +1234,16 @@ def calculate_metrics(results_dict: Dict[str, List[SearchResult]], query: str) -
         precision = len(relevant_docs.intersection(retrieved_docs)) / len(retrieved_docs) if retrieved_docs else 0
         
         # Recall: coverage of relevant documents
-        recall = len(relevant_docs.intersection(retrieved_docs)) / len(relevant_docs) if relevant_docs else 0
+        recall = len(relevant_docs.intersection(retrieved_docs)) / relevant_total if relevant_total else 0
         
         # Diversity score: average pairwise distance between results
         if len(results) > 1:
-            result_embeddings = []
-            for result in results:
-                doc_idx = next(i for i, doc in enumerate(SAMPLE_DOCUMENTS) if doc['id'] == result.document_id)
-                result_embeddings.append(document_embeddings[doc_idx])
+            result_embeddings = np.stack([embedding_of(result.document_id) for result in results])
             
-            pairwise_distances = []
-            for i in range(len(result_embeddings)):
-                for j in range(i + 1, len(result_embeddings)):
-                    distance = euclidean_distances([result_embeddings[i]], [result_embeddings[j]])[0][0]
-                    pairwise_distances.append(distance)
-            
-            diversity = np.mean(pairwise_distances) if pairwise_distances else 0
+            # All pairwise distances from one Gram matrix of unit vectors
+            pairwise_distances = euclidean_from_cosine(result_embeddings @ result_embeddings.T)
+            upper = np.triu_indices(len(results), k=1)
+            diversity = float(np.mean(pairwise_distances[upper]))
         else:
             diversity = 0
         
@@ -354,85 +1253,543 @@ def calculate_metrics(results_dict: Dict[str, List[SearchResult]], query: str) -
     
     return metrics
 
+def calculate_metrics(results_dict: Dict[str, List[SearchResult]], query: str,
+                      context: Optional[QueryContext] = None) -> Dict[str, float]:
+    """Calculate precision, recall, and diversity metrics
+    
+    Only the returned documents are judged, pooled over every method as in TREC
+    evaluations: recall counts the relevant documents any compared method found, and
+    no request reads the whole corpus.
+    """
+    context = context or QueryContext(query)
+    
+    # For demonstration, we'll use a simple relevance judgment
+    # In practice, this would be based on human annotations
+    query_terms = query.lower().split()
+    returned = {result.document_id: result for results in results_dict.values() for result in results}
+    relevant_docs = {document_id for document_id, result in returned.items()
+                     if is_relevant(query_terms, {"title": result.title, "content": result.content})}
+    
+    def embedding_of(document_id: str) -> np.ndarray:
+        if document_id not in context.result_rows:
+            # Results built without this context: find the row once
+            for row, doc in enumerate(context.documents):
+                context.result_rows.setdefault(doc["id"], row)
+        return context.embeddings[context.result_rows[document_id]]
+    
+    return result_metrics(results_dict, relevant_docs, len(relevant_docs), embedding_of)
+
+def storage_stats(snapshot: IndexSnapshot) -> Dict:
+    """Bytes read by full scans in the configured storage mode, next to the float32 size"""
+    float32_bytes = snapshot.embeddings.nbytes + snapshot.passage_vectors.nbytes
+    compact = [view for view in (snapshot.compact_embeddings, snapshot.compact_passages) if view is not None]
+    return {
+        "mode": EMBEDDING_STORAGE,
+        "rescore_candidates": RESCORE_CANDIDATES if compact else 0,
+        "float32_bytes": float32_bytes,
+        "scan_bytes": sum(view.nbytes for view in compact) if compact else float32_bytes
+    }
+
+def measure_storage_recall(snapshot: IndexSnapshot, k: int = 10, sample_size: int = 100,
+                           seed: int = 0) -> Dict[str, float]:
+    """Recall@k of each dense method scanning the quantized copy, against float32 scans
+    
+    Stored passages serve as queries: their text feeds the entity and lexical parts and
+    their stored vector is the query embedding, so nothing is encoded.
+    """
+    searches = {
+        "cosine": lambda query, context: cosine_similarity_search(query, k, context=context),
+        "cosine_pooled": lambda query, context: cosine_similarity_search(query, k, context=context, pooling="max"),
+        "euclidean": lambda query, context: euclidean_distance_search(query, k, context=context),
+        "mmr": lambda query, context: mmr_search(query, k, context=context),
+        "hybrid": lambda query, context: hybrid_similarity_search(query, k, context=context),
+    }
+    if snapshot.compact_embeddings is None or not len(snapshot.passage_vectors):
+        return {method: 1.0 for method in searches}
+    
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(snapshot.passage_vectors), min(sample_size, len(snapshot.passage_vectors)), replace=False)
+    hits = dict.fromkeys(searches, 0)
+    total = dict.fromkeys(searches, 0)
+    for passage in sample:
+        start, stop = snapshot.passage_spans[passage]
+        query = snapshot.documents[int(snapshot.passage_documents[passage])]['content'][start:stop]
+        query_vector = np.asarray(snapshot.passage_vectors[passage])
+        # Both contexts scan every row; only the first reads the quantized copy
+        quantized = QueryContext(query, exact=True, snapshot=snapshot, query_vector=query_vector, quantized=True)
+        reference = QueryContext(query, exact=True, snapshot=snapshot, query_vector=query_vector)
+        for method, search in searches.items():
+            expected = {result.document_id for result in search(query, reference)}
+            found = {result.document_id for result in search(query, quantized)}
+            hits[method] += len(expected & found)
+            total[method] += len(expected)
+    return {method: hits[method] / total[method] if total[method] else 1.0 for method in searches}
+
+def shard_stats(query: str, snapshot: IndexSnapshot, filters: Optional[SearchFilters] = None) -> Dict:
+    """This shard's part of the corpus-wide statistics a coordinated search scores with
+    
+    Needs neither the query vector nor a scan of the vectors. The entity maximum
+    covers the filtered partition; BM25 statistics cover every document, as they do
+    for a filtered search on a single index.
+    """
+    partition = filtered_snapshot(filters, snapshot)
+    context = QueryContext(query, exact=True, snapshot=partition)
+    entity_scores = entity_match_scores(context, partition.searchable)
+    return {
+        "version": snapshot.version,
+        "documents": len(snapshot),
+        "max_entity_score": float(entity_scores.max()) if len(entity_scores) else 0.0,
+        "lexical": lexical_index.statistics(query, len(snapshot)),
+    }
+
+def shard_search(request: ShardSearchRequest, snapshot: IndexSnapshot) -> Dict:
+    """This shard's candidates for a coordinated /search/compare, by row and without content
+    
+    Cosine, hybrid and BM25 return their top_k with scores that compare across shards:
+    hybrid and BM25 use the corpus-wide entity maximum and BM25 statistics sent with the
+    request. Euclidean scores come with the shard's maximum distance so they can be
+    rescaled to the corpus-wide one. MMR returns its whole candidate pool, which the
+    coordinator merges before selecting. Every candidate carries its embedding and
+    relevance judgment for the metrics, and its row in the unfiltered snapshot.
+    """
+    partition = filtered_snapshot(request.filters, snapshot)
+    context = QueryContext(
+        request.query,
+        exact=request.exact,
+        nprobe=request.nprobe,
+        generator=request.candidate_generator,
+        snapshot=partition,
+        query_vector=unpack_vector(request.query_vector),
+        lexical_statistics=request.lexical_statistics
+    )
+    response = {"version": snapshot.version, "cosine": [], "euclidean": [], "max_distance": 0.0,
+                "mmr": [], "hybrid": [], "bm25": []}
+    if not len(partition):
+        return response
+    context.prepare()
+    
+    query_terms = request.query.lower().split()
+    
+    def candidates(rows: np.ndarray, scores: np.ndarray, passages: bool = False) -> List[Dict]:
+        items = []
+        for row, score in zip(rows, scores):
+            doc = partition.documents[row]
+            item = {
+                "row": int(row if partition.rows is None else partition.rows[row]),
+                "document_id": doc["id"],
+                "score": float(score),
+                "relevant": is_relevant(query_terms, doc),
+                "embedding": pack_vector(partition.embeddings[row]),
+            }
+            if passages:
+                item["passage"] = context.best_passage(row)
+            items.append(item)
+        return items
+    
+    top_k = request.top_k
+    max_distance = euclidean_max_distance(context)
+    mmr_rows = context.candidates(max(request.mmr_candidates, top_k))
+    response.update(
+        cosine=candidates(*cosine_rows(context, top_k, request.pooling), passages=request.pooling is not None),
+        euclidean=candidates(*euclidean_rows(context, top_k, max_distance)),
+        max_distance=max_distance,
+        mmr=candidates(mmr_rows, context.scores(mmr_rows)),
+        hybrid=candidates(*hybrid_rows(context, top_k, request.hybrid_candidates, request.max_entity_score)),
+        bm25=candidates(*context.lexical(top_k))
+    )
+    return response
+
+def shard_documents(rows: List[int], snapshot: IndexSnapshot) -> List[Dict]:
+    """Id, title and content of the given rows, for the results a coordinator kept"""
+    return [
+        {key: snapshot.documents[row][key] for key in ("id", "title", "content")}
+        for row in rows
+    ]
+
+async def run_comparison(request: SearchRequest, context: QueryContext):
+    """Run every method concurrently on the search pool against one shared context"""
+    await run_in_pool(search_executor, context.prepare)
+    
+    cosine_results, euclidean_results, mmr_results, hybrid_results, bm25_results = await asyncio.gather(
+        run_in_pool(
+            search_executor,
+            cosine_similarity_search,
+            request.query,
+            request.top_k,
+            context=context,
+            pooling=request.pooling
+        ),
+        run_in_pool(search_executor, euclidean_distance_search, request.query, request.top_k, context=context),
+        run_in_pool(
+            search_executor,
+            mmr_search,
+            request.query,
+            request.top_k,
+            lambda_param=request.lambda_param,
+            candidate_pool=request.mmr_candidates,
+            context=context
+        ),
+        run_in_pool(
+            search_executor,
+            hybrid_similarity_search,
+            request.query,
+            request.top_k,
+            candidate_pool=request.hybrid_candidates,
+            context=context
+        ),
+        run_in_pool(search_executor, bm25_search, request.query, request.top_k, context=context)
+    )
+    
+    # Calculate metrics
+    results_dict = {
+        "cosine": cosine_results,
+        "euclidean": euclidean_results,
+        "mmr": mmr_results,
+        "hybrid": hybrid_results,
+        "bm25": bm25_results
+    }
+    metrics = await run_in_pool(search_executor, calculate_metrics, results_dict, request.query, context=context)
+    
+    return cosine_results, euclidean_results, mmr_results, hybrid_results, bm25_results, metrics
+
+def encode_queries(queries: List[str]) -> np.ndarray:
+    """(queries x dim) unit vectors; cache misses share a single batched encode"""
+    open_caches()
+    return query_cache.get_or_encode_many(queries, encode_texts)
+
+def batch_search_block(request: BatchSearchRequest, queries: List[str], query_vectors: Optional[np.ndarray],
+                       snapshot: IndexSnapshot) -> List[BatchSearchResult]:
+    """Score a block of queries with one (queries x docs) product and row-wise top-k"""
+    methods = request.methods or list(get_args(SearchMethod))
+    if not len(snapshot):
+        # No document matches the filters
+        return [BatchSearchResult(query=query, results={method: [] for method in methods}) for query in queries]
+    
+    similarities = None
+    top_k = min(request.top_k, len(snapshot.searchable))
+    if query_vectors is not None:
+        similarities = query_vectors @ snapshot.embeddings.T
+        if snapshot.mask is not None:
+            # A masked partition is scored in place; rows outside it can never be picked
+            lowest = similarities[:, snapshot.matching].min(axis=1, keepdims=True)
+            similarities[:, ~snapshot.mask] = -np.inf
+        else:
+            lowest = similarities.min(axis=1, keepdims=True)
+        top_rows = top_k_rows(similarities, top_k)
+        top_similarities = np.take_along_axis(similarities, top_rows, axis=1)
+        # Euclidean distance ranks like cosine; only each row's maximum distance is needed
+        max_distances = euclidean_from_cosine(lowest)
+        max_distances[max_distances == 0] = 1.0
+        euclidean_scores = 1 - euclidean_from_cosine(top_similarities) / max_distances
+        
+        if request.pooling and "cosine" in methods:
+            # Cosine ranks documents by pooled passage scores: a (queries x passages) product
+            starts = np.searchsorted(snapshot.passage_documents, np.arange(len(snapshot)))
+            pooled = pool(query_vectors @ snapshot.passage_vectors.T, starts, request.pooling)
+            if snapshot.mask is not None:
+                pooled[:, ~snapshot.mask] = -np.inf
+            pooled_rows = top_k_rows(pooled, top_k)
+            pooled_scores = np.take_along_axis(pooled, pooled_rows, axis=1)
+    
+    block_results = []
+    for i, query in enumerate(queries):
+        context = QueryContext(
+            query,
+            exact=True,
+            snapshot=snapshot,
+            query_vector=None if query_vectors is None else query_vectors[i],
+            similarities=None if similarities is None else similarities[i]
+        )
+        results = {}
+        for method in methods:
+            if method == "mmr":
+                results[method] = mmr_search(query, request.top_k, lambda_param=request.lambda_param,
+                                             candidate_pool=request.mmr_candidates, context=context)
+            elif method == "hybrid":
+                results[method] = hybrid_similarity_search(query, request.top_k,
+                                                           candidate_pool=request.hybrid_candidates, context=context)
+            elif method == "bm25":
+                results[method] = bm25_search(query, request.top_k, context=context)
+            else:
+                # Cosine and Euclidean come straight from the row-wise top-k of the block
+                pooled_cosine = method == "cosine" and request.pooling
+                if pooled_cosine:
+                    rows, scores = pooled_rows[i], pooled_scores[i]
+                else:
+                    rows = top_rows[i]
+                    scores = top_similarities[i] if method == "cosine" else euclidean_scores[i]
+                results[method] = [
+                    SearchResult(
+                        document_id=snapshot.documents[idx]['id'],
+                        title=snapshot.documents[idx]['title'],
+                        content=snapshot.documents[idx]['content'],
+                        score=float(score),
+                        method=method,
+                        passage=context.best_passage(idx) if pooled_cosine else None
+                    )
+                    for idx, score in zip(rows, scores)
+                ]
+        block_results.append(BatchSearchResult(query=query, results=results))
+    
+    return block_results
+
+async def stream_batch_search(request: BatchSearchRequest):
+    """Yield one NDJSON line per query as soon as its block has been scored"""
+    methods = request.methods or list(get_args(SearchMethod))
+    # Every block is scored against the same snapshot, even if uploads land mid-batch
+    snapshot = await run_in_pool(search_executor, filtered_snapshot, request.filters, index_snapshot)
+    
+    query_vectors = None
+    if any(method != "bm25" for method in methods):
+        query_vectors = await run_in_pool(search_executor, encode_queries, request.queries)
+    
+    block_size = max(1, BATCH_BLOCK_ELEMENTS // max(len(snapshot.passage_vectors), len(snapshot), 1))
+    for start in range(0, len(request.queries), block_size):
+        stop = start + block_size
+        block_results = await asyncio.wait_for(
+            run_in_pool(
+                search_executor,
+                batch_search_block,
+                request,
+                request.queries[start:stop],
+                None if query_vectors is None else query_vectors[start:stop],
+                snapshot
+            ),
+            timeout=SEARCH_TIMEOUT
+        )
+        for result in block_results:
+            yield json.dumps(jsonable_encoder(result)) + "\n"
+
+def response_cache_key(request: SearchRequest, version: int) -> tuple:
+    """(normalized query, every other request parameter, index version)"""
+    params = jsonable_encoder(request)
+    params.pop("query")
+    return normalize_query(request.query), json.dumps(params, sort_keys=True), version
+
 @app.get("/")
 async def root():
     return {"message": "Indian Legal Document Search System API"}
 
+@app.post("/shard/stats")
+async def get_shard_stats(request: ShardStatsRequest):
+    """Corpus statistics of this shard for a coordinated search (see coordinator.py)"""
+    return await run_in_pool(search_executor, shard_stats, request.query, index_snapshot, request.filters)
+
+@app.post("/shard/search")
+async def search_shard(request: ShardSearchRequest):
+    """Candidates of this shard for a coordinated search (see coordinator.py)"""
+    try:
+        return await asyncio.wait_for(
+            run_in_pool(search_executor, shard_search, request, index_snapshot),
+            timeout=SEARCH_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Search exceeded {SEARCH_TIMEOUT:.0f}s")
+
+@app.post("/shard/documents")
+async def get_shard_documents(request: ShardDocumentsRequest):
+    """Documents by row, for the results a coordinated search kept"""
+    snapshot = index_snapshot
+    if any(not 0 <= row < len(snapshot) for row in request.rows):
+        raise HTTPException(status_code=404, detail="Unknown document row")
+    return await run_in_pool(search_executor, shard_documents, request.rows, snapshot)
+
+@app.get("/health/live")
+async def liveness():
+    """The process is up and serving requests"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Whether the model, index and caches are loaded; 503 until they are"""
+    components = {
+        "model": model is not None,
+        "index": index_ready,
+        "warmed_up": warmed_up,
+        "caches": query_cache is not None and response_cache is not None,
+    }
+    body = {
+        "ready": index_ready and (warmed_up or not WARMUP_ON_STARTUP),
+        "components": components,
+        "documents": len(index_snapshot) if index_snapshot is not None else 0,
+        "startup_seconds": startup_timings,
+        "error": startup_error,
+    }
+    return JSONResponse(status_code=200 if body["ready"] else 503, content=body)
+
 @app.post("/search/compare", response_model=ComparisonResult)
 async def compare_search_methods(request: SearchRequest):
-    """Compare all 4 similarity methods for a given query"""
+    """Compare all similarity methods (4 dense + BM25) for a given query"""
     
     try:
-        # Perform searches with all methods
-        cosine_results = cosine_similarity_search(request.query, request.top_k)
-        euclidean_results = euclidean_distance_search(request.query, request.top_k)
-        mmr_results = mmr_search(request.query, request.top_k)
-        hybrid_results = hybrid_similarity_search(request.query, request.top_k)
+        # The request pins one snapshot: the cache key and every method use the same corpus
+        snapshot = index_snapshot
+        cache_key = response_cache_key(request, snapshot.version)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
         
-        # Calculate metrics
-        results_dict = {
-            "cosine": cosine_results,
-            "euclidean": euclidean_results,
-            "mmr": mmr_results,
-            "hybrid": hybrid_results
-        }
+        # Filters narrow the search to a partition of the snapshot
+        partition = await run_in_pool(search_executor, filtered_snapshot, request.filters, snapshot)
+        
+        # Encode the query once and share it across all methods
+        context = QueryContext(
+            request.query,
+            exact=request.exact,
+            nprobe=request.nprobe,
+            generator=request.candidate_generator,
+            snapshot=partition
+        )
         
-        metrics = calculate_metrics(results_dict, request.query)
+        # A timed-out request stops waiting; work already running on the pool finishes
+        cosine_results, euclidean_results, mmr_results, hybrid_results, bm25_results, metrics = \
+            await asyncio.wait_for(run_comparison(request, context), timeout=SEARCH_TIMEOUT)
         
-        return ComparisonResult(
+        result = ComparisonResult(
             query=request.query,
             cosine_results=cosine_results,
             euclidean_results=euclidean_results,
             mmr_results=mmr_results,
             hybrid_results=hybrid_results,
+            bm25_results=bm25_results,
             metrics=metrics
         )
+        response_cache.put(cache_key, result)
+        return result
         
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Search exceeded {SEARCH_TIMEOUT:.0f}s")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/search/batch")
+async def batch_search(request: BatchSearchRequest):
+    """Search many queries at once, streaming one JSON line of results per query"""
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="No queries provided")
+    
+    return StreamingResponse(stream_batch_search(request), media_type="application/x-ndjson")
+
+@app.post("/upload", status_code=202)
+async def upload_document(file: UploadFile = File(...), title: Optional[str] = Form(None)):
+    """Queue a legal document for indexing and return its job id; the title defaults to the file name"""
+    
+    if ingest_jobs.pending() >= ingest_jobs.max_pending:
+        raise HTTPException(status_code=429, detail="Ingestion queue is full, retry later")
+    
+    try:
+        # Spool to disk rather than reading the whole upload into memory
+        path = await run_in_pool(search_executor, spool, file.file, os.path.splitext(file.filename)[1], UPLOAD_SPOOL_DIR)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    try:
+        # The job owns the spooled file from here on and removes it once parsed
+        job = ingest_jobs.submit(run_upload_job, path, file.filename, title, filename=title or file.filename)
+    except QueueFull:
+        os.remove(path)
+        raise HTTPException(status_code=429, detail="Ingestion queue is full, retry later")
+    
+    return {"message": f"Document {file.filename} queued for indexing", "job_id": job.id, "status": "queued"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Report the status and progress of an ingestion job"""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job
 
-@app.post("/upload")
-async def upload_document(file: UploadFile = File(...)):
-    """Upload and process a legal document"""
+@app.post("/upload/batch", status_code=202)
+async def upload_documents(files: List[UploadFile] = File(...)):
+    """Queue many documents for indexing as one job and return its id"""
     
+    if ingest_jobs.pending() >= ingest_jobs.max_pending:
+        raise HTTPException(status_code=429, detail="Ingestion queue is full, retry later")
+    
+    paths = []
     try:
-        content = await file.read()
-        
-        # Extract text based on file type
-        if file.filename.endswith('.pdf'):
-            pdf_reader = PyPDF2.PdfReader(BytesIO(content))
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text()
-        elif file.filename.endswith('.docx'):
-            doc = docx.Document(BytesIO(content))
-            text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-        else:
-            # Assume text file
-            text = content.decode('utf-8')
-        
-        # Add to document collection (in practice, this would be stored in a database)
-        new_doc = {
-            "id": f"uploaded_{len(SAMPLE_DOCUMENTS)}",
-            "title": file.filename,
-            "content": text,
-            "category": "uploaded"
-        }
-        
-        SAMPLE_DOCUMENTS.append(new_doc)
-        
-        # Reinitialize embeddings
-        initialize_embeddings()
-        
-        return {"message": f"Document {file.filename} uploaded successfully", "document_id": new_doc["id"]}
-        
+        for file in files:
+            paths.append(await run_in_pool(
+                search_executor, spool, file.file, os.path.splitext(file.filename)[1], UPLOAD_SPOOL_DIR
+            ))
+        # The job owns the spooled files from here on and removes them once indexed
+        job = ingest_jobs.submit(run_batch_job, paths, [file.filename for file in files], files=len(files))
+    except QueueFull:
+        for path in paths:
+            os.remove(path)
+        raise HTTPException(status_code=429, detail="Ingestion queue is full, retry later")
     except Exception as e:
+        for path in paths:
+            os.remove(path)
         raise HTTPException(status_code=500, detail=str(e))
+    
+    return {"message": f"{len(files)} documents queued for indexing", "job_id": job.id, "status": "queued"}
+
+def document_page(snapshot: IndexSnapshot, offset: int, limit: int) -> List[Dict]:
+    """id, title and category of the documents in rows [offset, offset + limit)"""
+    return [{"id": doc["id"], "title": doc["title"], "category": doc["category"]}
+            for doc in snapshot.documents[offset:offset + limit]]
 
 @app.get("/documents")
-async def get_documents():
-    """Get all available documents"""
-    return [{"id": doc["id"], "title": doc["title"], "category": doc["category"]} for doc in SAMPLE_DOCUMENTS]
+async def get_documents(offset: int = 0, limit: int = 100):
+    """Get a page of the available documents; the X-Total-Count header gives the corpus size"""
+    if offset < 0 or not 0 < limit <= 1000:
+        raise HTTPException(status_code=422, detail="offset must be >= 0 and limit between 1 and 1000")
+    snapshot = index_snapshot
+    page = await run_in_pool(search_executor, document_page, snapshot, offset, limit)
+    return JSONResponse(content=page, headers={"X-Total-Count": str(len(snapshot))})
+
+@app.get("/index/stats")
+async def get_index_stats():
+    """Report corpus size, passage ingest throughput, vector storage and ANN index state"""
+    return {
+        "version": index_snapshot.version,
+        "documents": len(index_snapshot),
+        "passages": len(passage_index),
+        "passage_encoding": passage_meter.stats(),
+        "embedding_cache": embedding_cache.stats() if embedding_cache is not None else None,
+        "storage": storage_stats(index_snapshot),
+        "ann": ann_index.stats()
+    }
+
+@app.get("/index/recall")
+async def get_index_recall(k: int = 10, sample_size: int = 100, nprobe: Optional[int] = None):
+    """Measure ANN and quantized-storage recall@k against exact float32 search"""
+    snapshot = index_snapshot
+    embeddings = snapshot.embeddings
+    recall = await run_in_pool(search_executor, measure_recall, ann_index, embeddings, k=k,
+                               sample_size=sample_size, nprobe=nprobe)
+    storage_recall = await run_in_pool(search_executor, measure_storage_recall, snapshot, k, sample_size)
+    return {
+        "k": k,
+        "sample_size": min(sample_size, len(embeddings)),
+        "recall": recall,
+        "ann": ann_index.stats(),
+        "storage": {**storage_stats(snapshot), "recall": storage_recall}
+    }
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Report cache sizes and hit/miss counters"""
+    return {
+        "index_version": index_snapshot.version,
+        "query_embeddings": query_cache.stats(),
+        "responses": response_cache.stats(),
+        "partitions": partition_cache.stats()
+    }
+
+@app.get("/jobs")
+async def get_job_stats():
+    """Report ingestion queue capacity and load"""
+    return ingest_jobs.stats()
+
+@app.get("/encoder/stats")
+async def get_encoder_stats():
+    """Report the encoder backend, query batch-size distribution and queueing delay"""
+    return {"backend": ENCODER_BACKEND, "threads": ENCODER_THREADS, **query_encoder.stats()}
+
+startup_timings["import_seconds"] = time.perf_counter() - IMPORT_STARTED
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,286 @@
+import array
+import hashlib
+import json
+import os
+import re
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from caching import normalize_query
+from vector_store import GrowableMatrix
+
+# "Section 80C", "sec. 10(14)", "u/s 80D", "Article 226"
+SECTION_PATTERN = re.compile(r'(?:\bu/s\.?|\b(?:sections?|sec\.|articles?|art\.))\s*(\d+[a-z]*(?:\(\w+\))*)',
+                             re.IGNORECASE)
+# Capitalized words ending in "Act", e.g. "Income Tax Act", "Goods and Services Tax Act"
+ACT_PATTERN = re.compile(r"\b((?:[A-Z][\w&'-]*\s+(?:(?:of|and|for|to|from|on)\s+)?){1,8})Act\b")
+
+
+def normalize_section(text: str) -> str:
+    """"Section 80C", "sec. 80c" and "80C" -> "section 80c"; "Art. 226" -> "article 226\""""
+    text = normalize_query(text)
+    match = re.fullmatch(r'(?:(u/s\.?|sections?|sec\.?|s\.|articles?|art\.?)\s*)?(\d+[a-z]*(?:\s*\(\w+\))*)', text)
+    if match is None:
+        return text
+    kind = 'article' if (match.group(1) or '').startswith('art') else 'section'
+    return f"{kind} {match.group(2).replace(' ', '')}"
+
+
+def normalize_act(text: str) -> str:
+    """"The Income Tax Act, 1961" and "income tax" -> "income tax act\""""
+    text = re.sub(r'[,\s]*\d{4}$', '', normalize_query(text))
+    text = re.sub(r'^the\s+', '', text)
+    return text if text == 'act' or text.endswith(' act') else f"{text} act"
+
+
+def legal_references(text: str) -> Tuple[List[str], List[str]]:
+    """(acts, sections) cited in a document, normalized and deduplicated"""
+    acts = {normalize_act(match.group(1) + 'Act') for match in ACT_PATTERN.finditer(text)}
+    acts.discard('act')
+    sections = {normalize_section(match.group(0)) for match in SECTION_PATTERN.finditer(text)}
+    return sorted(acts), sorted(sections)
+
+
+class CitationScanner:
+    """``legal_references`` of a text fed in pieces
+
+    No citation contains any of ``,;:!?"``, so the text is scanned up to the last
+    of them and only what follows is held back; a text without any is held whole.
+    """
+
+    BREAKS = ',;:!?"'
+
+    def __init__(self):
+        self._acts = set()
+        self._sections = set()
+        self._tail = ''
+
+    def _scan(self, text: str) -> None:
+        acts, sections = legal_references(text)
+        self._acts.update(acts)
+        self._sections.update(sections)
+
+    def update(self, piece: str) -> None:
+        text = self._tail + piece
+        cut = max(text.rfind(ch) for ch in self.BREAKS)
+        if cut < 0:
+            self._tail = text
+            return
+        # The break is kept on both sides, as word-boundary context
+        self._scan(text[:cut + 1])
+        self._tail = text[cut:]
+
+    def result(self) -> Tuple[List[str], List[str]]:
+        """(acts, sections) of the text fed so far, which has ended"""
+        self._scan(self._tail)
+        self._tail = ''
+        return sorted(self._acts), sorted(self._sections)
+
+
+def upload_time(value) -> float:
+    """Seconds since the epoch of an ``uploaded_at`` value; naive times are UTC, missing ones 0"""
+    if value is None:
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+# Fields filtered through per-value postings and how their values are normalized
+KEYED_FIELDS = {
+    'category': normalize_query,
+    'act': normalize_act,
+    'section': normalize_section,
+}
+
+
+def document_keys(doc: Dict, references: Optional[Tuple[List[str], List[str]]] = None) -> List[str]:
+    """Every ``field:value`` key of a document, e.g. ``category:gst`` or ``section:section 80c``
+
+    ``references`` are its ``legal_references`` if already extracted.
+    """
+    acts, sections = references if references is not None else legal_references(doc['content'])
+    values = {'category': [doc['category']] if doc.get('category') else [], 'act': acts, 'section': sections}
+    return [f"{field}:{KEYED_FIELDS[field](value)}" for field, field_values in values.items() for value in field_values]
+
+
+def source_hash(source: Optional[str]) -> int:
+    """64-bit hash of a normalized source name; 0 for documents without one"""
+    if not source:
+        return 0
+    return int.from_bytes(hashlib.sha256(normalize_query(source).encode('utf-8')).digest()[:8], 'big') or 1
+
+
+class MetadataIndex:
+    """Filterable metadata of every document: upload time, source, category and cited acts and sections
+
+    * ``metadata_times.f64`` - upload time per row in seconds since the epoch,
+      never decreasing along rows, so a date range is one contiguous run of rows
+    * ``metadata_sources.u64`` - hash of each row's source name; nearly every
+      source is unique, so they are matched in a column rather than a posting each
+    * ``metadata_keys.i64`` - (row, key id) pairs in row order for the keyed fields
+    * ``metadata.json`` - committed row and pair counts and the key of every id
+
+    The sorted rows of each key are rebuilt in memory from the pairs on open and
+    extended as documents are added, so a filter only touches the rows it selects.
+    Readers pass the number of rows they can see and ignore anything newer.
+    """
+
+    TIMES_FILE = 'metadata_times.f64'
+    SOURCES_FILE = 'metadata_sources.u64'
+    KEYS_FILE = 'metadata_keys.i64'
+    META_FILE = 'metadata.json'
+    # Bumped when extraction changes, so stored metadata is extracted again
+    VERSION = 1
+
+    def __init__(self, path: str):
+        self.path = path
+        self.times: Optional[GrowableMatrix] = None
+        self.sources: Optional[GrowableMatrix] = None
+        self.pairs: Optional[GrowableMatrix] = None
+        self.keys: List[str] = []
+        self._key_ids: Dict[str, int] = {}
+        self._postings: Dict[int, array.array] = {}
+        self._indexed_pairs = 0
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _read_meta(self) -> Optional[Dict]:
+        try:
+            with open(self._file(self.META_FILE)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _commit(self) -> None:
+        for matrix in (self.times, self.sources, self.pairs):
+            matrix.flush()
+        tmp_path = self._file(self.META_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': self.VERSION, 'count': len(self.times), 'pairs': len(self.pairs),
+                       'keys': self.keys}, f)
+        os.replace(tmp_path, self._file(self.META_FILE))
+
+    def _adopt(self, keys: List[str]) -> None:
+        """Learn new key ids and add the pairs beyond those already indexed to the postings"""
+        for key_id in range(len(self.keys), len(keys)):
+            self._key_ids[keys[key_id]] = key_id
+        self.keys = list(keys)
+
+        pairs = self.pairs.view()[self._indexed_pairs:]
+        # Grouped by key with one stable sort, so rows stay in order within each key
+        order = np.argsort(pairs[:, 1], kind='stable')
+        key_ids, starts = np.unique(pairs[order, 1], return_index=True)
+        for key_id, rows in zip(key_ids.tolist(), np.split(pairs[order, 0], starts[1:])):
+            self._postings.setdefault(key_id, array.array('q')).extend(rows.tolist())
+        self._indexed_pairs += len(pairs)
+
+    def _append(self, docs: Sequence[Dict], keys_per_doc: Optional[List[List[str]]] = None) -> None:
+        first_row = len(self.times)
+        last_time = self.times.view()[-1, 0] if first_row else 0.0
+        times = np.maximum.accumulate([last_time] + [upload_time(doc.get('uploaded_at')) for doc in docs])[1:]
+
+        if keys_per_doc is None:
+            keys_per_doc = [document_keys(doc) for doc in docs]
+        pairs = []
+        keys = list(self.keys)
+        key_ids = dict(self._key_ids)
+        for row, doc_keys in enumerate(keys_per_doc, start=first_row):
+            for key in doc_keys:
+                if key not in key_ids:
+                    key_ids[key] = len(keys)
+                    keys.append(key)
+                pairs.append((row, key_ids[key]))
+        if pairs:
+            self.pairs.append(np.array(pairs, dtype=np.int64))
+        self._adopt(keys)
+        self.sources.append(np.array([source_hash(doc.get('source')) for doc in docs], dtype=np.uint64).reshape(-1, 1))
+        self.times.append(times.reshape(-1, 1))
+
+    def sync(self, documents: Sequence[Dict], block_rows: int = 4096) -> None:
+        """Load stored metadata and extract it for the documents beyond it"""
+        meta = self._read_meta()
+        if meta is None or meta.get('version') != self.VERSION:
+            meta = {'count': 0, 'pairs': 0, 'keys': []}
+            for name in (self.TIMES_FILE, self.SOURCES_FILE, self.KEYS_FILE):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+
+        stored_rows = min(meta['count'], len(documents))
+        self.times = GrowableMatrix(1, dtype=np.float64, path=self._file(self.TIMES_FILE), count=stored_rows)
+        self.sources = GrowableMatrix(1, dtype=np.uint64, path=self._file(self.SOURCES_FILE), count=stored_rows)
+        self.pairs = GrowableMatrix(2, dtype=np.int64, path=self._file(self.KEYS_FILE), count=meta['pairs'])
+        # Drop pairs of rows that were never committed (e.g. a crash mid-upload)
+        committed_pairs = int(np.searchsorted(self.pairs.view()[:, 0], stored_rows))
+        if committed_pairs < meta['pairs']:
+            self.pairs = GrowableMatrix(2, dtype=np.int64, path=self._file(self.KEYS_FILE), count=committed_pairs)
+        self.keys, self._key_ids, self._postings, self._indexed_pairs = [], {}, {}, 0
+        self._adopt(meta['keys'])
+
+        for start in range(stored_rows, len(documents), block_rows):
+            self._append(documents[start:start + block_rows])
+        self._commit()
+
+    def refresh(self) -> None:
+        """Adopt metadata committed by another process"""
+        meta = self._read_meta()
+        if meta is not None:
+            self.pairs.refresh(meta['pairs'])
+            self._adopt(meta['keys'])
+            self.sources.refresh(meta['count'])
+            self.times.refresh(meta['count'])
+
+    def add(self, docs: Sequence[Dict], keys_per_doc: Optional[List[List[str]]] = None) -> None:
+        """Append the metadata of new documents, which take the next rows in order
+
+        ``keys_per_doc`` are their ``document_keys`` if already extracted.
+        """
+        self._append(docs, keys_per_doc)
+        self._commit()
+
+    def _rows(self, key: str, start: int, stop: int) -> np.ndarray:
+        rows = self._postings.get(self._key_ids.get(key))
+        if rows is None:
+            return np.empty(0, dtype=np.int64)
+        # Sliced first: the copy is taken at once, while a writer may be appending
+        rows = np.array(rows[:len(rows)], dtype=np.int64)
+        return rows[np.searchsorted(rows, start):np.searchsorted(rows, stop)]
+
+    def filter(self, limit: int, values: Dict[str, List[str]], sources: Optional[List[str]] = None,
+               uploaded_after: Optional[float] = None, uploaded_before: Optional[float] = None) -> np.ndarray:
+        """Sorted rows among the first ``limit`` that match every given field
+
+        ``values`` maps keyed fields to accepted values; a row matches a field when it
+        has any of them. Upload times are bounded by ``uploaded_after`` (inclusive)
+        and ``uploaded_before`` (exclusive).
+        """
+        times = self.times.view()[:limit, 0]
+        start = int(np.searchsorted(times, uploaded_after)) if uploaded_after is not None else 0
+        stop = int(np.searchsorted(times, uploaded_before)) if uploaded_before is not None else len(times)
+        stop = max(stop, start)
+
+        matches = []
+        for field, field_values in values.items():
+            parts = [self._rows(key, start, stop) for key in {f"{field}:{KEYED_FIELDS[field](value)}" for value in field_values}]
+            matches.append(np.unique(np.concatenate(parts)) if len(parts) > 1 else parts[0])
+        # Smallest first, so every intersection is at most as large as the smallest field
+        matches.sort(key=len)
+        rows = matches[0] if matches else None
+        for other in matches[1:]:
+            rows = np.intersect1d(rows, other, assume_unique=True)
+
+        if sources:
+            wanted = np.array([source_hash(source) for source in sources], dtype=np.uint64)
+            if rows is None:
+                rows = start + np.flatnonzero(np.isin(self.sources.view()[start:stop, 0], wanted))
+            else:
+                rows = rows[np.isin(self.sources.view()[rows, 0], wanted)]
+        return np.arange(start, stop, dtype=np.int64) if rows is None else rows.astype(np.int64, copy=False)
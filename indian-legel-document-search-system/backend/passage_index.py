@@ -0,0 +1,222 @@
+import json
+import os
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+from vector_store import GrowableMatrix, normalize_rows
+
+WORD_PATTERN = re.compile(r'\S+')
+
+
+def chunk_text(text: str, max_words: int = 150, overlap: int = 30) -> List[Tuple[int, int]]:
+    """Character spans of overlapping passages of at most ``max_words`` words
+
+    Every text yields at least one span, so every document owns at least one passage.
+    """
+    words = [match.span() for match in WORD_PATTERN.finditer(text)]
+    if not words:
+        return [(0, len(text))]
+
+    step = max(max_words - overlap, 1)
+    spans = []
+    for start in range(0, len(words), step):
+        chunk = words[start:start + max_words]
+        spans.append((chunk[0][0], chunk[-1][1]))
+        if start + max_words >= len(words):
+            break
+    return spans
+
+
+def iter_chunks(pieces: Iterable[str], max_words: int = 150, overlap: int = 30) -> Iterator[Tuple[int, int, str]]:
+    """(start, stop, text) of the passages ``chunk_text`` finds in the concatenated pieces
+
+    Only the words of the passage being built are held, so a text of any length
+    is chunked as it is extracted.
+    """
+    step = max(max_words - overlap, 1)
+    buffer = ''
+    base = 0        # text offset of buffer[0]
+    scanned = 0     # text offset up to which words are known complete
+    words: List[Tuple[int, int]] = []
+
+    def emit(chunk: List[Tuple[int, int]]) -> Tuple[int, int, str]:
+        start, stop = chunk[0][0], chunk[-1][1]
+        return start, stop, buffer[start - base:stop - base]
+
+    for piece in pieces:
+        buffer += piece
+        for match in WORD_PATTERN.finditer(buffer, scanned - base):
+            # A word running into the end of the buffer may continue in the next piece
+            if match.end() == len(buffer):
+                scanned = base + match.start()
+                break
+            words.append((base + match.start(), base + match.end()))
+        else:
+            scanned = base + len(buffer)
+
+        # A passage is final once a word beyond it is known
+        while len(words) > max_words:
+            yield emit(words[:max_words])
+            del words[:step]
+        keep = words[0][0] if words else scanned
+        buffer, base = buffer[keep - base:], keep
+
+    end = base + len(buffer)
+    words.extend((base + match.start(), base + match.end()) for match in WORD_PATTERN.finditer(buffer, scanned - base))
+    if not words:
+        yield 0, end, buffer
+        return
+    while True:
+        yield emit(words[:max_words])
+        if len(words) <= max_words:
+            return
+        del words[:step]
+
+
+def pool(scores: np.ndarray, starts: np.ndarray, pooling: str) -> np.ndarray:
+    """Reduce passage scores (last axis) to one score per document; ``starts`` are first passage rows
+
+    "max" keeps the best passage's score. "sum" adds up every passage's score and
+    divides by the document's passage count, so it stays within cosine's [-1, 1].
+    """
+    if not len(starts):
+        return np.zeros(scores.shape[:-1] + (0,), dtype=np.float32)
+    if pooling == 'max':
+        return np.maximum.reduceat(scores, starts, axis=-1)
+    counts = np.diff(starts, append=scores.shape[-1])
+    return np.add.reduceat(scores, starts, axis=-1) / np.maximum(counts, 1).astype(scores.dtype)
+
+
+class PassageIndex:
+    """Passage embeddings with a passage -> document map
+
+    * ``passages.f32`` - unit-normalized float32 passage vectors, memory-mapped
+    * ``passages.i64`` - (document row, start, stop) per passage; start/stop are
+      character offsets into the document content
+    * ``passages.json`` - committed passage count plus the model and chunking
+      parameters the vectors were produced with
+
+    Passages are stored in document order, so a document's passages are one
+    contiguous run of rows. They are appended before the document's own row, and
+    readers only look at passages of documents they can see. ``compact`` is an
+    optional quantized copy of the vectors, kept in step like the map.
+    """
+
+    VECTORS_FILE = 'passages.f32'
+    MAP_FILE = 'passages.i64'
+    META_FILE = 'passages.json'
+
+    def __init__(self, path: str, dim: int, model_name: str, max_words: int = 150, overlap: int = 30,
+                 compact=None):
+        self.path = path
+        self.dim = dim
+        self.model_name = model_name
+        self.max_words = max_words
+        self.overlap = overlap
+        self.compact = compact
+        self.generation = 0
+        self.vectors: Optional[GrowableMatrix] = None
+        self.map: Optional[GrowableMatrix] = None
+
+    def __len__(self) -> int:
+        return len(self.map)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _params(self) -> Dict:
+        return {'model_name': self.model_name, 'dim': self.dim, 'max_words': self.max_words, 'overlap': self.overlap}
+
+    def chunk(self, text: str) -> List[Tuple[int, int]]:
+        return chunk_text(text, self.max_words, self.overlap)
+
+    def iter_chunks(self, pieces: Iterable[str]) -> Iterator[Tuple[int, int, str]]:
+        return iter_chunks(pieces, self.max_words, self.overlap)
+
+    def load(self, document_count: int) -> int:
+        """Open the stored passages and return how many leading documents they cover
+
+        Passages from another model or chunking configuration are discarded.
+        """
+        try:
+            with open(self._file(self.META_FILE)) as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            meta = None
+
+        count = 0
+        if meta is not None and meta['params'] == self._params():
+            count = meta['count']
+            self.generation = meta.get('generation', 0)
+        else:
+            # Derived copies of the discarded vectors are rebuilt as well
+            self.generation = meta.get('generation', 0) + 1 if meta is not None else 0
+            for name in (self.VECTORS_FILE, self.MAP_FILE):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+
+        self.vectors = GrowableMatrix(self.dim, path=self._file(self.VECTORS_FILE), count=count)
+        self.map = GrowableMatrix(3, dtype=np.int64, path=self._file(self.MAP_FILE), count=count)
+
+        # Drop passages of documents that were never committed (e.g. a crash mid-upload)
+        document_rows = self.map.view()[:, 0]
+        visible = int(np.searchsorted(document_rows, document_count))
+        if visible < count:
+            self.vectors = GrowableMatrix(self.dim, path=self._file(self.VECTORS_FILE), count=visible)
+            self.map = GrowableMatrix(3, dtype=np.int64, path=self._file(self.MAP_FILE), count=visible)
+        if self.compact is not None:
+            self.compact.sync(self.vectors.view(), self.generation)
+        self._commit()
+
+        return int(document_rows[visible - 1]) + 1 if visible else 0
+
+    def _commit(self) -> None:
+        self.vectors.flush()
+        self.map.flush()
+        tmp_path = self._file(self.META_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'params': self._params(), 'count': len(self.map), 'generation': self.generation}, f)
+        os.replace(tmp_path, self._file(self.META_FILE))
+
+    def refresh(self) -> None:
+        """Adopt passages committed by another process"""
+        with open(self._file(self.META_FILE)) as f:
+            count = json.load(f)['count']
+        if self.compact is not None:
+            self.compact.refresh()
+        self.vectors.refresh(count)
+        self.map.refresh(count)
+
+    def add(self, document_rows: np.ndarray, spans: List[Tuple[int, int]], vectors: np.ndarray,
+            block_rows: int = 4096) -> range:
+        """Append passages; ``document_rows`` must continue the existing document order
+
+        ``vectors`` may be memory-mapped; they are normalized and copied a block at a time.
+        """
+        for start in range(0, len(vectors), block_rows):
+            block = normalize_rows(vectors[start:start + block_rows])
+            if self.compact is not None:
+                self.compact.add(block)
+            self.vectors.append(block)
+        # The map is appended last: its length is what makes passages visible
+        rows = self.map.append(np.column_stack([document_rows, np.asarray(spans, dtype=np.int64).reshape(-1, 2)]))
+        self._commit()
+        return rows
+
+    def view(self, document_count: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(vectors, document rows, spans) of the passages of the first ``document_count`` documents"""
+        passage_map = self.map.view()
+        count = int(np.searchsorted(passage_map[:, 0], document_count))
+        return self.vectors.view()[:count], passage_map[:count, 0], passage_map[:count, 1:]
+
+    def compact_view(self, document_count: int):
+        """Quantized vectors of the passages of the first ``document_count`` documents, or None"""
+        if self.compact is None:
+            return None
+        return self.compact.view(int(np.searchsorted(self.map.view()[:, 0], document_count)))
+
+    def document_vectors(self, document_count: int) -> np.ndarray:
+        """One unit vector per document: the normalized mean of its passage vectors"""
+        vectors, document_rows, _ = self.view(document_count)
+        starts = np.searchsorted(document_rows, np.arange(document_count))
+        return normalize_rows(np.add.reduceat(vectors, starts, axis=0)) if document_count else vectors[:0]
@@ -0,0 +1,150 @@
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+import numpy as np
+from vector_store import GrowableMatrix
+
+STORAGE_MODES = ('float32', 'float16', 'int8')
+# Rows widened to float32 at a time during a scan; small enough to stay in cache
+SCAN_BLOCK_ROWS = 512
+
+
+def quantize(vectors: np.ndarray, mode: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Codes for float32 rows, plus one scale per row for int8 (symmetric, max-abs)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if mode == 'float16':
+        return vectors.astype(np.float16), None
+
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+@dataclass(frozen=True)
+class QuantizedView:
+    """Read-only quantized rows; ``dot`` gives approximate inner products with float32 queries"""
+
+    codes: np.ndarray
+    scales: Optional[np.ndarray]
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def dot(self, queries: np.ndarray, block_rows: int = SCAN_BLOCK_ROWS) -> np.ndarray:
+        """Scores of every row for one query (rows,) or a (queries x dim) matrix (queries x rows)"""
+        queries = np.asarray(queries, dtype=np.float32)
+        single = queries.ndim == 1
+        columns = np.ascontiguousarray(queries.reshape(-1, queries.shape[-1]).T)
+
+        scores = np.empty((len(self.codes), columns.shape[1]), dtype=np.float32)
+        for start in range(0, len(self.codes), block_rows):
+            block = self.codes[start:start + block_rows].astype(np.float32)
+            np.matmul(block, columns, out=scores[start:start + block_rows])
+        if self.scales is not None:
+            scores *= self.scales[:, None]
+        return np.ascontiguousarray(scores[:, 0] if single else scores.T)
+
+
+class QuantizedMatrix:
+    """Scalar-quantized copy of an append-only float32 matrix of unit vectors
+
+    Full scans read this copy instead of the float32 rows: ``int8`` codes with
+    one scale per row (about 4x smaller) or ``float16`` (2x smaller). Callers
+    rescore their shortlist against the float32 rows.
+
+    * ``<name>.i8`` and ``<name>.scales.f32``, or ``<name>.f16`` - memory-mapped codes
+    * ``<name>.<mode>.json`` - committed row count and the generation of the
+      float32 matrix they were quantized from; a rebuilt source is requantized
+    """
+
+    def __init__(self, path: str, name: str, dim: int, mode: str):
+        if mode not in STORAGE_MODES[1:]:
+            raise ValueError(f"Unknown quantized storage mode: {mode}")
+        self.path = path
+        self.name = name
+        self.dim = dim
+        self.mode = mode
+        self.generation = 0
+        self.codes: Optional[GrowableMatrix] = None
+        self.scales: Optional[GrowableMatrix] = None
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def _file(self, suffix: str) -> str:
+        return os.path.join(self.path, f"{self.name}.{suffix}")
+
+    def _files(self) -> Dict[str, str]:
+        if self.mode == 'int8':
+            return {'codes': self._file('i8'), 'scales': self._file('scales.f32')}
+        return {'codes': self._file('f16')}
+
+    def _read_meta(self) -> Optional[Dict]:
+        try:
+            with open(self._file(f'{self.mode}.json')) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _open(self, count: int) -> None:
+        files = self._files()
+        self.codes = GrowableMatrix(self.dim, dtype=np.int8 if self.mode == 'int8' else np.float16,
+                                    path=files['codes'], count=count)
+        self.scales = GrowableMatrix(1, path=files['scales'], count=count) if 'scales' in files else None
+
+    def _commit(self) -> None:
+        self.codes.flush()
+        if self.scales is not None:
+            self.scales.flush()
+        tmp_path = self._file(f'{self.mode}.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'count': len(self.codes), 'generation': self.generation}, f)
+        os.replace(tmp_path, self._file(f'{self.mode}.json'))
+
+    def _append(self, vectors: np.ndarray) -> None:
+        codes, scales = quantize(vectors, self.mode)
+        # Scales first: the code count is what readers size views by
+        if self.scales is not None:
+            self.scales.append(scales.reshape(-1, 1))
+        self.codes.append(codes)
+
+    def sync(self, source: np.ndarray, generation: int = 0, block_rows: int = 65536) -> None:
+        """Open the stored codes and quantize the rows of ``source`` beyond them"""
+        meta = self._read_meta()
+        count = 0
+        if meta is not None and meta['generation'] == generation:
+            count = min(meta['count'], len(source))
+        else:
+            for path in self._files().values():
+                if os.path.exists(path):
+                    os.remove(path)
+
+        self.generation = generation
+        self._open(count)
+        for start in range(count, len(source), block_rows):
+            self._append(source[start:start + block_rows])
+        self._commit()
+
+    def add(self, vectors: np.ndarray) -> None:
+        """Append the codes of rows about to be appended to the float32 matrix"""
+        self._append(vectors)
+        self._commit()
+
+    def refresh(self) -> None:
+        """Adopt codes committed by another process"""
+        meta = self._read_meta()
+        if meta is not None:
+            if self.scales is not None:
+                self.scales.refresh(meta['count'])
+            self.codes.refresh(meta['count'])
+
+    def view(self, count: int) -> QuantizedView:
+        """The first ``count`` rows"""
+        scales = self.scales.view()[:count, 0] if self.scales is not None else None
+        return QuantizedView(self.codes.view()[:count], scales)
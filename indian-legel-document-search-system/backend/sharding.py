@@ -0,0 +1,17 @@
+import base64
+import numpy as np
+
+
+def shard_for(digest: bytes, shard_count: int) -> int:
+    """Shard that owns a document, from a SHA-256 digest of its routing key"""
+    return int.from_bytes(digest[:8], 'big') % shard_count
+
+
+def pack_vector(vector: np.ndarray) -> str:
+    """A float32 vector as base64 text for JSON bodies (a third the size of a float list)"""
+    return base64.b64encode(np.ascontiguousarray(vector, dtype=np.float32).tobytes()).decode('ascii')
+
+
+def unpack_vector(text: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(text), dtype=np.float32)
+
@@ -0,0 +1,125 @@
+from dataclasses import dataclass, replace
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Sequence
+import numpy as np
+from quantization import QuantizedView
+
+
+class DocumentList(Sequence):
+    """Read-only, fixed-length prefix of an append-only document list
+
+    Sharing the underlying list avoids copying the corpus for every snapshot;
+    documents appended later stay invisible through this view.
+    """
+
+    def __init__(self, documents: List[Dict], count: int):
+        self._documents = documents
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._documents[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError('document index out of range')
+        return self._documents[index]
+
+    def __iter__(self) -> Iterator[Dict]:
+        return islice(self._documents, self._count)
+
+
+class DocumentSubset(Sequence):
+    """Read-only view of chosen rows of a document list, in the order given"""
+
+    def __init__(self, documents: Sequence[Dict], rows: np.ndarray):
+        self._documents = documents
+        self._rows = rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._documents[row] for row in self._rows[index]]
+        return self._documents[int(self._rows[index])]
+
+    def __iter__(self) -> Iterator[Dict]:
+        return (self._documents[row] for row in self._rows.tolist())
+
+
+@dataclass(frozen=True)
+class IndexSnapshot:
+    """One consistent, immutable version of the searchable corpus
+
+    Every array covers exactly the same documents. Writers build the next
+    snapshot and publish it by replacing a single reference; readers take that
+    reference once per request and never need a lock. The compact copies are
+    only present when vectors are also stored quantized.
+
+    A snapshot made by ``subset`` holds some rows of its ``parent``, copied into
+    contiguous arrays; its row ``i`` is row ``rows[i]`` of the parent. One made by
+    ``masked`` shares every array of its parent and only marks the ``matching`` rows
+    (``mask``), so searches pick their candidates among those rows.
+    """
+
+    version: int
+    documents: DocumentList
+    embeddings: np.ndarray
+    entity_counts: np.ndarray
+    passage_vectors: np.ndarray
+    passage_documents: np.ndarray
+    passage_spans: np.ndarray
+    compact_embeddings: Optional[QuantizedView] = None
+    compact_passages: Optional[QuantizedView] = None
+    rows: Optional[np.ndarray] = None
+    parent: Optional["IndexSnapshot"] = None
+    mask: Optional[np.ndarray] = None
+    matching: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.embeddings)
+
+    @property
+    def searchable(self) -> np.ndarray:
+        """Rows a search may return"""
+        return self.matching if self.matching is not None else np.arange(len(self))
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by this snapshot alone; a masked one shares its parent's arrays"""
+        if self.mask is not None:
+            return self.mask.nbytes + self.matching.nbytes
+        return sum(array.nbytes for array in (self.embeddings, self.entity_counts, self.passage_vectors,
+                                              self.passage_documents, self.passage_spans))
+
+    def masked(self, rows: np.ndarray) -> "IndexSnapshot":
+        """Snapshot of every row, restricted to the given rows (sorted) without copying any"""
+        mask = np.zeros(len(self), dtype=bool)
+        mask[rows] = True
+        return replace(self, mask=mask, matching=rows)
+
+    def subset(self, rows: np.ndarray) -> "IndexSnapshot":
+        """Snapshot of the given rows (sorted) with their passages; gathers only those rows
+
+        The full-precision vectors are gathered and scanned directly, so the subset
+        has no compact copies.
+        """
+        starts = np.searchsorted(self.passage_documents, rows)
+        counts = np.searchsorted(self.passage_documents, rows + 1) - starts
+        # Passage indices of every row, run after run, without a Python loop
+        passages = np.arange(counts.sum()) + np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        return IndexSnapshot(
+            self.version,
+            DocumentSubset(self.documents, rows),
+            self.embeddings[rows],
+            self.entity_counts[rows],
+            self.passage_vectors[passages],
+            np.repeat(np.arange(len(rows)), counts),
+            self.passage_spans[passages],
+            rows=rows,
+            parent=self
+        )
@@ -0,0 +1,58 @@
+import hashlib
+import os
+import re
+import sys
+import numpy as np
+import pytest
+
+# The backend modules import each other as top-level modules, as when run from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class HashingEncoder:
+    """Bag-of-words stand-in for the sentence encoder: similar wording, similar vectors"""
+
+    dimension = 64
+
+    def __init__(self):
+        self.texts = []
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, texts, **kwargs):
+        self.texts.extend(texts)
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r'[a-z0-9]+', text.lower()):
+                vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dimension] += 1.0
+        return vectors
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """The API module on a freshly seeded index in a temporary directory
+
+    ``main`` reads its configuration at import, so it is imported once per session.
+    """
+    pytest.importorskip('fastapi')
+    pytest.importorskip('httpx')
+    os.environ.update(
+        INDEX_DIR=str(tmp_path_factory.mktemp('index')),
+        EMBEDDING_CACHE='',
+        JOBS_DB='',
+        WARMUP_ON_STARTUP='0',
+        PARSE_EXECUTOR='thread',
+    )
+    import main
+    main.model = HashingEncoder()
+    main.initialize()
+    return main
+
+
+@pytest.fixture(scope='session')
+def client(app):
+    # One client for the session: leaving it runs the lifespan shutdown, which stops the pools
+    from fastapi.testclient import TestClient
+    with TestClient(app.app) as client:
+        yield client
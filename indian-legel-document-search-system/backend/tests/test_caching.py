@@ -0,0 +1,22 @@
+import numpy as np
+from caching import EmbeddingCache
+
+
+def test_embedding_cache_is_keyed_by_the_exact_text(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / 'cache.sqlite'), 'model')
+    encoded = []
+
+    def encode(texts):
+        encoded.extend(texts)
+        return np.arange(len(texts) * 2, dtype=np.float32).reshape(-1, 2) + len(encoded)
+
+    first = cache.get_or_encode_many(['Section 80C', 'Section 80C'], encode)
+    assert encoded == ['Section 80C'] and (first[0] == first[1]).all()
+
+    cache.get_or_encode_many(['section  80c', 'Section 80C'], encode)
+    assert encoded == ['Section 80C', 'section  80c']
+    assert cache.hits == 2 and cache.misses == 2
+
+    reopened = EmbeddingCache(str(tmp_path / 'cache.sqlite'), 'model')
+    assert (reopened.get_or_encode_many(['Section 80C'], encode) == first[:1]).all()
+    assert len(encoded) == 2
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from sharding import pack_vector
+
+
+@pytest.fixture
+def coordinator(app, monkeypatch):
+    import coordinator
+    monkeypatch.setattr(coordinator, 'shards', [])
+    return coordinator
+
+
+class LocalShard:
+    """A shard answered in-process by the API under test"""
+
+    def __init__(self, client):
+        self.url = 'local'
+        self.client = client
+
+    def post(self, path, body, timeout):
+        response = self.client.post(path, json=body)
+        response.raise_for_status()
+        return response.json()
+
+
+def candidate(row, score, vector=None):
+    return {'row': row, 'document_id': f'doc_{row}', 'score': score, 'relevant': False,
+            'embedding': pack_vector(np.asarray(vector if vector is not None else [1.0, 0.0], dtype=np.float32))}
+
+
+def test_merge_top_k_orders_by_score_then_shard_and_row(coordinator):
+    merged = coordinator.merge_top_k([(1, candidate(0, 0.5)), (0, candidate(3, 0.9)), (0, candidate(1, 0.5)),
+                                      (1, candidate(2, 0.1))], 3)
+    assert [(shard, item['row']) for shard, item in merged] == [(0, 3), (0, 1), (1, 0)]
+
+
+def test_euclidean_scores_are_rescaled_to_the_largest_distance(coordinator):
+    responses = {
+        0: {'max_distance': 1.0, 'euclidean': [candidate(0, 0.5)]},
+        1: {'max_distance': 2.0, 'euclidean': [candidate(0, 0.5)]},
+    }
+    scores = {shard: item['score'] for shard, item in coordinator.rescale_euclidean(responses)}
+    assert scores == pytest.approx({0: 0.75, 1: 0.5})
+
+
+def test_mmr_selects_from_the_candidates_of_every_shard(coordinator):
+    candidates = [(0, candidate(0, 0.9, [1.0, 0.0])), (0, candidate(1, 0.89, [1.0, 0.0])),
+                  (1, candidate(0, 0.5, [0.0, 1.0]))]
+    selected = coordinator.merge_mmr(candidates, top_k=2, candidate_pool=3, lambda_param=0.5)
+    assert [(shard, item['row']) for shard, item in selected] == [(0, 0), (1, 0)]
+
+
+def test_a_single_shard_answers_like_the_index_itself(app, client, coordinator, monkeypatch):
+    monkeypatch.setattr(coordinator, 'shards', [LocalShard(client)])
+    request = {'query': 'GST input tax credit', 'top_k': 3}
+    merged = coordinator.coordinated_search(app.SearchRequest(**request))
+    direct = client.post('/search/compare', json=request).json()
+
+    assert merged.shards == {'queried': 1, 'answered': 1, 'missing': {}}
+    for method in ('cosine', 'euclidean', 'mmr', 'hybrid', 'bm25'):
+        results = getattr(merged, f'{method}_results')
+        assert [result.document_id for result in results] == \
+            [result['document_id'] for result in direct[f'{method}_results']]
+        assert [result.score for result in results] == \
+            pytest.approx([result['score'] for result in direct[f'{method}_results']], abs=1e-5)
+    assert merged.metrics == pytest.approx(direct['metrics'], abs=1e-5)
+
+
+def test_no_shards_is_a_503(coordinator):
+    from fastapi.testclient import TestClient
+    client = TestClient(coordinator.app)
+    assert client.post('/search/compare', json={'query': 'gst'}).status_code == 503
+    assert client.post('/upload', files={'file': ('a.txt', b'text')}).status_code == 503
+    assert client.get('/jobs/0-abc').status_code == 503
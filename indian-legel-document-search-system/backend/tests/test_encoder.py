@@ -0,0 +1,28 @@
+import pytest
+from encoder import ONNX_CONFIG_FILE, VERIFY_TEXTS, compare_encoders, encoder_id, export_onnx, load_encoder
+
+
+def test_encoder_id_separates_backends_and_exports(tmp_path):
+    for name in ('model.onnx', 'model_int8.onnx', 'tokenizer.json', ONNX_CONFIG_FILE):
+        (tmp_path / name).write_text(name)
+
+    assert encoder_id('torch', 'all-MiniLM-L6-v2') == 'all-MiniLM-L6-v2'
+    onnx = encoder_id('onnx', 'all-MiniLM-L6-v2', str(tmp_path))
+    int8 = encoder_id('onnx-int8', 'all-MiniLM-L6-v2', str(tmp_path))
+    assert len({'all-MiniLM-L6-v2', onnx, int8}) == 3
+
+    (tmp_path / 'model.onnx').write_text('re-exported')
+    assert encoder_id('onnx', 'all-MiniLM-L6-v2', str(tmp_path)) != onnx
+
+
+def test_onnx_exports_agree_with_pytorch(tmp_path):
+    for module in ('onnxruntime', 'onnx', 'tokenizers', 'torch', 'sentence_transformers'):
+        pytest.importorskip(module)
+    try:
+        reference = load_encoder('torch', 'all-MiniLM-L6-v2')
+    except OSError as e:
+        pytest.skip(f"model not available: {e}")
+
+    for backend in export_onnx(reference, str(tmp_path)):
+        agreement = compare_encoders(reference, load_encoder(backend, 'all-MiniLM-L6-v2', str(tmp_path)), VERIFY_TEXTS)
+        assert agreement['min_cosine'] >= 0.99, (backend, agreement)
@@ -0,0 +1,55 @@
+import random
+import re
+import numpy as np
+from entity_index import EntityCounter, EntityIndex, EntityMatcher
+
+CATEGORIES = {
+    'repeat': ['a a', 'a a a', 'ab ab', 'aa'],
+    'tax': ['income tax', 'tax', 'tax rate', 'section 80c'],
+    'mixed': ['a', 'b.', 'c-c', 'tax'],
+}
+
+
+def reference_counts(categories, text):
+    text = text.lower()
+    return np.array([
+        sum(len(re.findall(r'\b' + re.escape(phrase.lower()) + r'\b', text)) for phrase in phrases)
+        for phrases in categories.values()
+    ], dtype=np.int32)
+
+
+def test_counts_match_findall_per_phrase():
+    matcher = EntityMatcher(CATEGORIES)
+    rng = random.Random(7)
+    vocabulary = ['a', 'aa', 'ab', 'b.', 'c-c', 'Tax', 'income', 'rate', 'section', '80c', 'x', '.', '-', '_']
+    for _ in range(3000):
+        text = ''.join(rng.choice(vocabulary) + rng.choice(['', ' ', '  ', '\n', ',']) for _ in range(rng.randint(0, 30)))
+        np.testing.assert_array_equal(matcher.count(text), reference_counts(CATEGORIES, text), err_msg=repr(text))
+
+
+def test_overlapping_matches_of_one_phrase_count_once():
+    matcher = EntityMatcher({'repeat': ['a a']})
+    assert matcher.count('a a a').tolist() == [1]
+    assert matcher.count('A a a a').tolist() == [2]
+
+
+def test_sync_recounts_only_changed_categories(tmp_path):
+    documents = [{'content': 'Income tax and GST at the tax rate'}, {'content': 'stamp duty'}]
+    index = EntityIndex(str(tmp_path), {'tax': ['tax'], 'property': ['stamp duty']})
+    index.sync(documents)
+    assert index.view().tolist() == [[2, 0], [0, 1]]
+
+    changed = EntityIndex(str(tmp_path), {'tax': ['tax', 'gst'], 'property': ['stamp duty']})
+    changed.sync(documents)
+    assert changed.view().tolist() == [[3, 0], [0, 1]]
+
+
+def test_counter_fed_in_pieces_matches_count():
+    matcher = EntityMatcher(CATEGORIES)
+    rng = random.Random(11)
+    text = ' '.join(rng.choice(['a', 'aa', 'ab', 'Tax', 'rate', 'income', 'section', '80c', 'b.', 'c-c']) for _ in range(2000))
+    for size in (1, 2, 3, 7, 64):
+        counter = EntityCounter(matcher)
+        for start in range(0, len(text), size):
+            counter.update(text[start:start + size])
+        np.testing.assert_array_equal(counter.result(), matcher.count(text))
@@ -0,0 +1,36 @@
+import multiprocessing
+import os
+from concurrent.futures.process import BrokenProcessPool
+import pytest
+from extraction import ProcessPool, extract_text, iter_plain_text, spool
+
+
+def test_process_pool_recovers_after_a_worker_dies():
+    pool = ProcessPool(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        assert pool.submit(pow, 2, 3).result(timeout=60) == 8
+        with pytest.raises(BrokenProcessPool):
+            pool.submit(os._exit, 1).result(timeout=60)
+        assert pool.submit(pow, 2, 4).result(timeout=60) == 16
+    finally:
+        pool.shutdown()
+
+
+def test_plain_text_is_decoded_across_chunk_boundaries(tmp_path):
+    path = tmp_path / 'act.txt'
+    text = 'धारा 80C — कटौती\n' * 100
+    path.write_text(text, encoding='utf-8')
+    assert ''.join(iter_plain_text(str(path), chunk_size=7)) == text
+    assert extract_text(str(path)) == text
+
+
+def test_spool_copies_the_stream(tmp_path):
+    source = tmp_path / 'upload.bin'
+    source.write_bytes(os.urandom(3000))
+    with open(source, 'rb') as f:
+        path = spool(f, '.bin', str(tmp_path), chunk_size=1024)
+    try:
+        assert path.endswith('.bin')
+        assert open(path, 'rb').read() == source.read_bytes()
+    finally:
+        os.remove(path)
@@ -0,0 +1,58 @@
+import json
+import sqlite3
+import threading
+import pytest
+from jobs import JobQueue, QueueFull
+
+
+def wait_for(queue, job_id, status='done'):
+    for _ in range(200):
+        record = queue.get(job_id)
+        if record['status'] == status:
+            return record
+        threading.Event().wait(0.01)
+    raise AssertionError(f"job {job_id} never reached {status}: {record}")
+
+
+def test_jobs_are_visible_to_another_queue_on_the_same_table(tmp_path):
+    path = str(tmp_path / 'index' / 'jobs.sqlite')
+    worker_a = JobQueue(workers=1, db_path=path)
+    worker_b = JobQueue(workers=1, db_path=path)
+    assert not (tmp_path / 'index').exists()
+    # Opened first: recovery treats unfinished jobs of this very process as dead
+    assert worker_b.get('unknown') is None
+
+    job = worker_a.submit(lambda job, n: job.update(status='done', result=n * 2), 21, filename='a.txt')
+    record = wait_for(worker_b, job.id)
+    assert record['status'] == 'done' and record['result'] == 42 and record['filename'] == 'a.txt'
+
+
+def test_failures_are_recorded():
+    queue = JobQueue(workers=1)
+
+    def fail(job):
+        raise ValueError("unreadable file")
+    record = wait_for(queue, queue.submit(fail).id, 'failed')
+    assert record['error'] == 'unreadable file'
+
+
+def test_full_queue_rejects_submissions():
+    queue = JobQueue(workers=1, max_pending=1)
+    release = threading.Event()
+    queue.submit(lambda job: release.wait(5))
+    with pytest.raises(QueueFull):
+        queue.submit(lambda job: None)
+    release.set()
+
+
+def test_jobs_of_dead_processes_are_reported_failed(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite')
+    db = sqlite3.connect(path)
+    db.execute('CREATE TABLE jobs (id TEXT PRIMARY KEY, record TEXT, updated REAL)')
+    record = {'id': 'old', 'status': 'encoding', 'updated': 0.0, 'error': None, 'worker': 2 ** 22 + 12345}
+    db.execute('INSERT INTO jobs VALUES (?, ?, ?)', ('old', json.dumps(record), 0.0))
+    db.commit()
+    db.close()
+
+    recovered = JobQueue(db_path=path).get('old')
+    assert recovered['status'] == 'failed' and recovered['error'] == 'Interrupted by a server restart'
@@ -0,0 +1,41 @@
+import numpy as np
+from lexical_index import BM25Index, TermCounter, term_frequencies, tokenize
+
+TEXTS = [
+    'Section 80C of the Income Tax Act allows a deduction for tuition fees.',
+    'GST on textile products is charged at the applicable tax rate.',
+    'Stamp duty and registration fee are paid on property registration.',
+    'Court fee is payable when filing civil suits; the filing fee varies.',
+]
+
+
+def test_tokenize_drops_stop_words():
+    assert tokenize('The Section 80C of the Act') == ['section', '80c', 'act']
+
+
+def test_term_counter_fed_in_pieces_matches_tokenize():
+    text = ' '.join(TEXTS) * 20
+    for size in (1, 5, 13, 1000):
+        counter = TermCounter()
+        for start in range(0, len(text), size):
+            counter.update(text[start:start + size])
+        assert counter.result() == term_frequencies(text)
+
+
+def test_search_ranks_matching_documents_first(tmp_path):
+    index = BM25Index(str(tmp_path))
+    index.add(TEXTS)
+    rows, scores = index.search('filing fee', 2, len(index))
+    assert rows.tolist()[0] == 3
+    assert np.all(np.diff(scores) <= 0)
+
+
+def test_saved_postings_are_adopted_by_another_index(tmp_path):
+    documents = [{'content': text} for text in TEXTS]
+    writer = BM25Index(str(tmp_path), save_every=2)
+    writer.load(documents[:1])
+    writer.add_terms([term_frequencies(text) for text in TEXTS[1:]])
+    reader = BM25Index(str(tmp_path))
+    reader.load(documents)
+    for query in ('tax rate', 'registration', 'section 80c'):
+        np.testing.assert_array_equal(reader.search(query, 4, 4)[0], writer.search(query, 4, 4)[0])
@@ -0,0 +1,31 @@
+import random
+from metadata_index import CitationScanner, document_keys, legal_references, normalize_act, normalize_section
+
+
+def test_references_are_normalized():
+    acts, sections = legal_references('Under Section 80C of the Income Tax Act, 1961 and u/s 10(14); see Art. 226.')
+    assert acts == ['income tax act']
+    assert sections == ['article 226', 'section 10(14)', 'section 80c']
+    assert normalize_act('The Income Tax Act, 1961') == 'income tax act'
+    assert normalize_section('sec. 80c') == normalize_section('80C') == 'section 80c'
+
+
+def test_scanner_fed_in_pieces_matches_legal_references():
+    rng = random.Random(5)
+    words = ['Income', 'Tax', 'Act', 'of', 'Goods', 'and', 'Services', 'Section', 'sec.', 'u/s', '80C', '10(14)',
+             'Art.', '226', 'the', ',', ';', '"', '\n', '1961']
+    for _ in range(500):
+        text = ' '.join(rng.choice(words) for _ in range(rng.randint(0, 60)))
+        scanner = CitationScanner()
+        position = 0
+        while position < len(text):
+            size = rng.randint(1, 12)
+            scanner.update(text[position:position + size])
+            position += size
+        assert scanner.result() == legal_references(text), text
+
+
+def test_document_keys_use_given_references():
+    doc = {'content': 'Section 80C', 'category': 'Income_Tax'}
+    assert document_keys(doc) == ['category:income_tax', 'section:section 80c']
+    assert document_keys(doc, (['gst act'], [])) == ['category:income_tax', 'act:gst act']
@@ -0,0 +1,34 @@
+import numpy as np
+from passage_index import PassageIndex, chunk_text, iter_chunks, pool
+
+
+def test_iter_chunks_matches_chunk_text_across_pieces():
+    text = ' '.join(f'word{i}' for i in range(1000)) + '  tail\n'
+    spans = chunk_text(text, 40, 10)
+    for size in (1, 3, 17, 4096):
+        pieces = [text[start:start + size] for start in range(0, len(text), size)]
+        chunks = list(iter_chunks(pieces, 40, 10))
+        assert [(start, stop) for start, stop, _ in chunks] == spans
+        assert [chunk for _, _, chunk in chunks] == [text[start:stop] for start, stop in spans]
+
+
+def test_pool_keeps_scores_in_cosine_range():
+    scores = np.array([[0.9, 0.8, 0.7, 0.2, -0.5, 0.95]], dtype=np.float32)
+    starts = np.array([0, 3, 5])
+    np.testing.assert_allclose(pool(scores, starts, 'max'), [[0.9, 0.2, 0.95]])
+    np.testing.assert_allclose(pool(scores, starts, 'sum'), [[0.8, -0.15, 0.95]], rtol=1e-6)
+    many = np.full((1, 1000), 0.99, dtype=np.float32)
+    assert pool(many, np.array([0]), 'sum').max() <= 1.0
+
+
+def test_passages_of_uncommitted_documents_are_dropped(tmp_path):
+    index = PassageIndex(str(tmp_path), 2, 'model', max_words=5, overlap=1)
+    assert index.load(0) == 0
+    vectors = np.eye(2, dtype=np.float32)[[0, 1, 1]]
+    index.add(np.array([0, 1, 1]), [(0, 5), (0, 4), (3, 9)], vectors)
+
+    reopened = PassageIndex(str(tmp_path), 2, 'model', max_words=5, overlap=1)
+    assert reopened.load(1) == 1
+    passage_vectors, document_rows, spans = reopened.view(1)
+    assert document_rows.tolist() == [0] and spans.tolist() == [[0, 5]]
+    assert PassageIndex(str(tmp_path), 2, 'model', max_words=6, overlap=1).load(1) == 0
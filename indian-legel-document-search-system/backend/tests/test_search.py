@@ -0,0 +1,129 @@
+import json
+import threading
+
+
+def test_metrics_judge_only_the_returned_documents(app, client, monkeypatch):
+    judged = []
+    is_relevant = app.is_relevant
+
+    def counting(query_terms, doc):
+        judged.append(doc['title'])
+        return is_relevant(query_terms, doc)
+
+    monkeypatch.setattr(app, 'is_relevant', counting)
+    response = client.post('/search/compare', json={'query': 'income tax deduction', 'top_k': 2})
+    assert response.status_code == 200
+    body = response.json()
+
+    returned = {result['title'] for method in ('cosine', 'euclidean', 'mmr', 'hybrid', 'bm25')
+                for result in body[f'{method}_results']}
+    assert set(judged) == returned and len(judged) == len(returned) < len(app.index_snapshot)
+    for method in ('cosine', 'euclidean', 'mmr', 'hybrid', 'bm25'):
+        assert 0 <= body['metrics'][f'{method}_recall'] <= 1
+
+
+def test_documents_are_paginated(app, client):
+    total = len(app.index_snapshot)
+    first = client.get('/documents', params={'limit': 2})
+    assert first.status_code == 200
+    assert int(first.headers['X-Total-Count']) == total
+    rest = client.get('/documents', params={'offset': 2, 'limit': 1000}).json()
+    assert [doc['id'] for doc in first.json() + rest] == [doc['id'] for doc in app.index_snapshot.documents]
+    assert client.get('/documents', params={'limit': 0}).status_code == 422
+
+
+def test_duplicates_are_found_by_normalized_text_whatever_the_title(app):
+    original = app.add_document({'title': 'Stamp duty note', 'content': 'Stamp duty on  gift deeds is 3 percent.',
+                                 'category': 'uploaded'})
+    assert not original.get('duplicate')
+
+    again = app.add_document({'title': 'Another title', 'content': 'stamp duty on gift deeds is 3 PERCENT.',
+                              'category': 'property'})
+    assert again['duplicate'] and again['id'] == original['id']
+    stored = next(doc for doc in app.index_snapshot.documents if doc['id'] == original['id'])
+    assert stored['title'] == 'Stamp duty note' and stored['category'] == 'uploaded'
+
+    different = app.add_document({'title': 'Stamp duty note', 'content': 'Stamp duty on gift deeds is 3 percent',
+                                  'category': 'uploaded'})
+    assert not different.get('duplicate') and different['id'] != original['id']
+
+
+def test_repeats_within_a_batch_are_written_once(app):
+    docs = [{'title': title, 'content': 'Court fees for a first appeal are ad valorem.', 'category': 'uploaded'}
+            for title in ('first', 'second')]
+    written = app.write_documents(docs, *app.encode_passages(docs))
+    assert not written[0].get('duplicate') and written[1]['duplicate']
+    assert written[1]['id'] == written[0]['id']
+
+
+def test_uploads_owned_by_another_shard_are_forwarded_once_parsed(app, client, monkeypatch):
+    from caching import content_hash
+    from sharding import shard_for
+    text = next(f"Notice {i} on stamp duty" for i in range(100) if shard_for(content_hash(f"Notice {i} on stamp duty"), 2))
+    forwarded = []
+
+    def forward(owner, text_path, title):
+        with open(text_path) as f:
+            forwarded.append((owner, f.read(), title))
+        return 'remote-job'
+
+    monkeypatch.setattr(app, 'SHARD_COUNT', 2)
+    monkeypatch.setattr(app, 'SHARD_URLS', ['http://shard-0', 'http://shard-1'])
+    monkeypatch.setattr(app, 'forward_upload', forward)
+    documents = len(app.index_snapshot)
+    job_id = client.post('/upload', files={'file': ('notice.txt', text.encode())}, data={'title': 'Notice'}).json()['job_id']
+    for _ in range(200):
+        job = client.get(f'/jobs/{job_id}').json()
+        if job['status'] in ('done', 'failed', 'forwarded'):
+            break
+        threading.Event().wait(0.01)
+
+    assert job['status'] == 'forwarded' and job['shard'] == 1 and job['forwarded_job_id'] == 'remote-job'
+    assert forwarded == [(1, text, 'Notice')]
+    assert len(app.index_snapshot) == documents
+
+
+def compare(client, request):
+    response = client.post('/search/compare', json=request)
+    assert response.status_code == 200
+    body = response.json()
+    return {method: [result['document_id'] for result in body[f'{method}_results']]
+            for method in ('cosine', 'euclidean', 'mmr', 'hybrid', 'bm25')}
+
+
+def test_large_partitions_are_masked_and_answer_like_gathered_ones(app, client, monkeypatch):
+    from ann_index import ExactIndex
+    request = {'query': 'income tax deduction', 'top_k': 3, 'filters': {'categories': ['income_tax', 'gst']}}
+    allowed = {doc['id'] for doc in app.index_snapshot.documents if doc['category'] in ('income_tax', 'gst')}
+    gathered = compare(client, request)
+    assert all(set(ids) <= allowed and ids for ids in gathered.values())
+
+    monkeypatch.setattr(app, 'PARTITION_GATHER_ROWS', 0)
+    app.partition_cache.clear()
+    app.response_cache.clear()
+    partition = app.filtered_snapshot(app.SearchFilters(**request['filters']), app.index_snapshot)
+    assert partition.mask is not None and partition.embeddings is app.index_snapshot.embeddings
+    assert compare(client, dict(request, exact=True)) == gathered
+
+    class ReadyIndex(ExactIndex):
+        searches = 0
+
+        def is_ready(self, count):
+            return True
+
+        def search(self, *args, **kwargs):
+            self.searches += 1
+            return super().search(*args, **kwargs)
+
+    # Nearest neighbours of the whole index, filtered by row afterwards
+    monkeypatch.setattr(app, 'ann_index', ReadyIndex())
+    app.response_cache.clear()
+    assert compare(client, request) == gathered
+    assert app.ann_index.searches
+
+    batch = client.post('/search/batch', json={'queries': [request['query']], 'top_k': 3,
+                                               'filters': request['filters']})
+    results = [line for line in batch.iter_lines() if line]
+    assert len(results) == 1 and all(set(r['document_id'] for r in method) <= allowed
+                                     for method in json.loads(results[0])['results'].values())
+    app.partition_cache.clear()
@@ -0,0 +1,128 @@
+import multiprocessing
+import os
+import time
+import numpy as np
+import pytest
+from vector_store import DocumentFile, GrowableMatrix, IndexLock, VectorStore, fcntl, normalize_rows, top_k_indices
+
+DIM = 4
+
+
+def documents(start, stop):
+    return [{'id': f'doc_{i}', 'title': f'Title {i}', 'content': f'Content of document {i} é\n'}
+            for i in range(start, stop)]
+
+
+def vectors(start, stop):
+    return np.random.default_rng(start).normal(size=(stop - start, DIM)).astype(np.float32)
+
+
+def test_reopen_maps_committed_rows(tmp_path):
+    store = VectorStore(str(tmp_path), DIM, 'model')
+    store.add(documents(0, 3), vectors(0, 3))
+    store.add(documents(3, 5), vectors(3, 5))
+
+    reopened = VectorStore(str(tmp_path), DIM, 'model')
+    assert reopened.version == store.version == 2
+    assert list(reopened.documents) == documents(0, 5)
+    assert reopened.documents[-1] == documents(4, 5)[0]
+    np.testing.assert_allclose(reopened.embeddings.view(),
+                               normalize_rows(np.concatenate([vectors(0, 3), vectors(3, 5)])), rtol=1e-6)
+    assert not reopened.needs_reencode
+
+
+def test_refresh_adopts_rows_committed_by_another_store(tmp_path):
+    writer = VectorStore(str(tmp_path), DIM, 'model')
+    writer.add(documents(0, 2), vectors(0, 2))
+    reader = VectorStore(str(tmp_path), DIM, 'model')
+    assert not reader.changed_on_disk()
+
+    writer.add(documents(2, 4000), vectors(2, 4000))
+    assert reader.changed_on_disk()
+    assert reader.refresh()
+    assert len(reader) == 4000 and reader.version == writer.version
+    assert reader.documents[3999] == documents(3999, 4000)[0]
+    np.testing.assert_array_equal(reader.embeddings.view(), writer.embeddings.view())
+    assert not reader.refresh()
+
+
+def test_uncommitted_writes_are_dropped_on_open(tmp_path):
+    store = VectorStore(str(tmp_path), DIM, 'model')
+    store.add(documents(0, 2), vectors(0, 2))
+    # A crash after the sidecar and offsets were written but before meta.json
+    store.documents.append(documents(2, 3))
+    store.embeddings.append(normalize_rows(vectors(2, 3)))
+    store.documents.flush()
+
+    reopened = VectorStore(str(tmp_path), DIM, 'model')
+    assert list(reopened.documents) == documents(0, 2)
+    assert len(reopened.embeddings) == 2
+    reopened.add(documents(5, 6), vectors(5, 6))
+    assert list(VectorStore(str(tmp_path), DIM, 'model').documents) == documents(0, 2) + documents(5, 6)
+
+
+def test_open_reads_persisted_offsets_without_scanning(tmp_path, monkeypatch):
+    VectorStore(str(tmp_path), DIM, 'model').add(documents(0, 10), vectors(0, 10))
+
+    def scan(*args):
+        raise AssertionError("documents.jsonl was scanned")
+    monkeypatch.setattr(DocumentFile, '_scan', scan)
+    assert list(VectorStore(str(tmp_path), DIM, 'model').documents) == documents(0, 10)
+
+
+def test_missing_offsets_are_rebuilt(tmp_path):
+    VectorStore(str(tmp_path), DIM, 'model').add(documents(0, 10), vectors(0, 10))
+    (tmp_path / VectorStore.OFFSETS_FILE).unlink()
+    assert list(VectorStore(str(tmp_path), DIM, 'model').documents) == documents(0, 10)
+    assert list(VectorStore(str(tmp_path), DIM, 'model').documents) == documents(0, 10)
+
+
+def test_other_model_needs_reencode(tmp_path):
+    VectorStore(str(tmp_path), DIM, 'model').add(documents(0, 2), vectors(0, 2))
+    other = VectorStore(str(tmp_path), DIM, 'other-model')
+    assert other.needs_reencode and len(other.embeddings) == 0 and len(other.documents) == 2
+
+
+def test_growable_matrix_refresh_sees_appended_rows(tmp_path):
+    path = str(tmp_path / 'rows.f32')
+    writer = GrowableMatrix(2, path=path, capacity=2)
+    reader = GrowableMatrix(2, path=path, capacity=2)
+    writer.append(np.arange(20, dtype=np.float32).reshape(10, 2))
+    writer.flush()
+    reader.refresh(10)
+    np.testing.assert_array_equal(reader.view(), writer.view())
+    with pytest.raises(ValueError):
+        reader.view()[0, 0] = 1.0
+
+
+def test_top_k_indices_orders_best_first():
+    scores = np.array([0.1, 0.9, 0.5, 0.9, 0.3], dtype=np.float32)
+    assert top_k_indices(scores, 3).tolist() == [1, 3, 2]
+    assert top_k_indices(scores, 10).tolist() == [1, 3, 2, 4, 0]
+    assert top_k_indices(scores, 0).tolist() == []
+
+
+def test_streamed_content_is_written_like_a_string(tmp_path):
+    store = VectorStore(str(tmp_path), DIM, 'model')
+    text = 'Line one "quoted" \\ back\nसेक्शन 80C\t😀' * 500
+    pieces = [text[start:start + 7] for start in range(0, len(text), 7)]
+    store.add([{'title': 'streamed', 'content': iter(pieces)}, {'content': text}], vectors(0, 2))
+    reopened = VectorStore(str(tmp_path), DIM, 'model')
+    assert reopened.documents[0] == {'title': 'streamed', 'content': text}
+    assert reopened.documents[1] == {'content': text}
+
+
+@pytest.mark.skipif(fcntl is None or not hasattr(os, 'fork'), reason="needs flock and fork")
+def test_index_lock_is_released_when_a_child_forked_while_it_was_held(tmp_path):
+    lock = IndexLock(str(tmp_path / 'index.lock'))
+    child = multiprocessing.get_context('fork').Process(target=time.sleep, args=(30,))
+    try:
+        with lock.exclusive():
+            child.start()
+        with open(lock.path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        with lock.shared():
+            pass
+    finally:
+        child.kill()
+        child.join()
@@ -0,0 +1,413 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: the lock below only covers threads of one process
+    fcntl = None
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    """Return contiguous float32 rows scaled to unit length (zero rows are left as is)"""
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2, copy=True)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors /= norms
+    return np.ascontiguousarray(vectors)
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Return the indices of the k highest scores, best first, without a full sort"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """Row-wise ``top_k_indices`` for a (queries x documents) score matrix"""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((len(scores), 0), dtype=np.intp)
+
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+class GrowableMatrix:
+    """Append-only 2-D array backed by a pre-allocated buffer that doubles when full
+
+    When ``path`` is given the buffer is a memory-mapped file: growing extends the
+    file and remaps it, so existing rows are never copied and the pages are shared
+    through the OS page cache with every other process mapping the same file.
+    """
+
+    def __init__(self, width: int, dtype=np.float32, capacity: int = 1024,
+                 path: Optional[str] = None, count: int = 0):
+        self.width = width
+        self.dtype = np.dtype(dtype)
+        self.path = path
+
+        if path:
+            data = self._map(max(capacity, count, 1))
+        else:
+            data = np.zeros((max(capacity, count, 1), width), dtype=self.dtype)
+
+        # (buffer, row count) is swapped as one reference so readers never see
+        # a count that does not belong to the buffer they are holding
+        self._state = (data, count)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._state[1]
+
+    @property
+    def capacity(self) -> int:
+        return self._state[0].shape[0]
+
+    def _map(self, rows: int) -> np.ndarray:
+        """Make sure the backing file holds at least ``rows`` rows and map all of it"""
+        row_bytes = self.width * self.dtype.itemsize
+        with open(self.path, 'ab') as f:
+            if f.tell() < rows * row_bytes:
+                f.truncate(rows * row_bytes)
+        rows_on_disk = os.path.getsize(self.path) // row_bytes
+        return np.memmap(self.path, dtype=self.dtype, mode='r+', shape=(rows_on_disk, self.width))
+
+    def append(self, rows) -> range:
+        """Append rows and return the range of row indices they were written to"""
+        rows = np.ascontiguousarray(rows, dtype=self.dtype).reshape(-1, self.width)
+
+        with self._lock:
+            data, count = self._state
+            end = count + rows.shape[0]
+
+            if end > data.shape[0]:
+                new_capacity = max(end, data.shape[0] * 2)
+                if self.path:
+                    data = self._map(new_capacity)
+                else:
+                    grown = np.zeros((new_capacity, self.width), dtype=self.dtype)
+                    grown[:count] = data[:count]
+                    data = grown
+
+            data[count:end] = rows
+            self._state = (data, end)
+
+        return range(count, end)
+
+    def refresh(self, count: int) -> None:
+        """Adopt rows another process appended to the backing file, up to ``count``"""
+        with self._lock:
+            data = self._state[0]
+            if count > data.shape[0]:
+                data = self._map(count)
+            self._state = (data, count)
+
+    def flush(self) -> None:
+        """Write dirty pages of a file-backed matrix to disk"""
+        data = self._state[0]
+        if isinstance(data, np.memmap):
+            data.flush()
+
+    def view(self) -> np.ndarray:
+        """Return a read-only view of the rows written so far"""
+        data, count = self._state
+        rows = data[:count]
+        rows.flags.writeable = False
+        return rows
+
+
+class IndexLock:
+    """Lock over an index directory shared by every thread and process using it
+
+    Writers hold it exclusively while they append and commit; readers hold it
+    shared while they adopt what was committed. Each acquisition opens the lock
+    file anew, so ``flock`` also keeps threads of one process apart. The lock is
+    released explicitly rather than by closing the file: a process forked while it
+    is held shares the open file, which would otherwise keep it held.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._thread_lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self, operation: int):
+        if fcntl is None:
+            with self._thread_lock:
+                yield
+            return
+        with open(self.path, 'a') as f:
+            fcntl.flock(f, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def exclusive(self):
+        return self._locked(fcntl.LOCK_EX if fcntl else 0)
+
+    def shared(self):
+        return self._locked(fcntl.LOCK_SH if fcntl else 0)
+
+
+class DocumentFile(Sequence):
+    """Append-only JSON-lines file whose documents are parsed on access
+
+    The end offset of every line is kept in a memory-mapped int64 file next to it,
+    appended with each write and committed with ``meta.json`` like the embeddings,
+    so opening or refreshing never scans the text. The text stays in the file and is
+    shared through the OS page cache by every process serving the same index.
+    """
+
+    def __init__(self, path: str, committed_bytes: int, count: int, offsets_path: str):
+        self.path = path
+        # Drop anything written after the last commit (e.g. a crash mid-upload)
+        with open(path, 'ab') as f:
+            f.truncate(committed_bytes)
+        self._fd = os.open(path, os.O_RDONLY)
+        # End offset of every line; line i spans [ends[i - 1], ends[i])
+        stored = os.path.exists(offsets_path) and os.path.getsize(offsets_path) >= count * 8
+        self._ends = GrowableMatrix(1, dtype=np.int64, path=offsets_path, count=count if stored else 0)
+        self._scanned = committed_bytes
+        ends = self._ends.view()
+        if not stored or (int(ends[-1, 0]) if count else 0) != committed_bytes:
+            # Written before offsets were persisted, or torn: index the lines once
+            os.remove(offsets_path)
+            self._ends = GrowableMatrix(1, dtype=np.int64, path=offsets_path)
+            self._scan(0, committed_bytes)
+            self.flush()
+
+    def __len__(self) -> int:
+        return len(self._ends)
+
+    def _read(self, row: int, ends: np.ndarray) -> Dict:
+        start = int(ends[row - 1, 0]) if row else 0
+        return json.loads(os.pread(self._fd, int(ends[row, 0]) - start, start))
+
+    def __getitem__(self, index):
+        ends = self._ends.view()
+        if isinstance(index, slice):
+            return [self._read(row, ends) for row in range(*index.indices(len(ends)))]
+        if index < 0:
+            index += len(ends)
+        if not 0 <= index < len(ends):
+            raise IndexError('document index out of range')
+        return self._read(index, ends)
+
+    def __iter__(self) -> Iterator[Dict]:
+        ends = self._ends.view()
+        return (self._read(row, ends) for row in range(len(ends)))
+
+    def _scan(self, start: int, stop: int, chunk_size: int = 1024 * 1024) -> None:
+        while start < stop:
+            chunk = os.pread(self._fd, min(chunk_size, stop - start), start)
+            newlines = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == ord('\n'))
+            self._ends.append((newlines + start + 1).reshape(-1, 1))
+            start += len(chunk)
+
+    def extend_to(self, committed_bytes: int, count: int) -> None:
+        """Adopt the ``count`` lines another process committed, ``committed_bytes`` in all"""
+        self._ends.refresh(count)
+        self._scanned = committed_bytes
+
+    @staticmethod
+    def _write_line(f, doc: Dict) -> int:
+        content = doc.get('content')
+        if content is None or isinstance(content, str):
+            return f.write((json.dumps(doc) + '\n').encode('utf-8'))
+        # Streamed content goes last, escaped a piece at a time
+        head = json.dumps({key: value for key, value in doc.items() if key != 'content'})[:-1]
+        size = f.write((head + (', ' if len(head) > 1 else '') + '"content": "').encode('utf-8'))
+        for piece in content:
+            size += f.write(json.dumps(piece)[1:-1].encode('utf-8'))
+        return size + f.write(b'"}\n')
+
+    def append(self, documents: List[Dict]) -> int:
+        """Write and fsync documents, one line each; returns the new committed size
+
+        A ``content`` that is not a string is an iterable of text pieces, e.g. a
+        spooled upload, and is copied into the file without being joined. The
+        offsets are only flushed by ``flush``, which the commit calls.
+        """
+        # Drop a line left partial by a write that failed
+        os.truncate(self.path, self._scanned)
+        ends = []
+        with open(self.path, 'ab') as f:
+            for doc in documents:
+                ends.append((ends[-1] if ends else self._scanned) + self._write_line(f, doc))
+            f.flush()
+            os.fsync(f.fileno())
+        if ends:
+            self._ends.append(np.array(ends, dtype=np.int64).reshape(-1, 1))
+            self._scanned = ends[-1]
+        return self._scanned
+
+    def flush(self) -> None:
+        self._ends.flush()
+
+
+class VectorStore:
+    """Persistent document index stored in a directory
+
+    * ``embeddings.f32`` - unit-normalized float32 matrix, one row per document, memory-mapped
+    * ``documents.jsonl`` - one JSON document per line, in row order
+    * ``documents.i64`` - end offset of every line of ``documents.jsonl``
+    * ``meta.json`` - committed row count, byte length of the sidecar and a
+      version that every commit increments
+
+    ``meta.json`` is replaced atomically after the matrix and sidecar are flushed,
+    so it is the commit point: rows or lines beyond it are discarded on open.
+    Other processes serving the same directory notice a new ``meta.json`` and
+    ``refresh`` to it; writers in any of them must hold the directory's
+    ``IndexLock`` and be refreshed before they append.
+
+    ``compact`` is an optional quantized copy of the matrix for first-pass scans
+    (see ``quantization.QuantizedMatrix``); it is kept in step with every append.
+    """
+
+    FORMAT_VERSION = 1
+    MATRIX_FILE = 'embeddings.f32'
+    DOCUMENTS_FILE = 'documents.jsonl'
+    OFFSETS_FILE = 'documents.i64'
+    META_FILE = 'meta.json'
+
+    def __init__(self, path: str, dim: int, model_name: str, compact=None):
+        self.path = path
+        self.dim = dim
+        self.model_name = model_name
+        self.compact = compact
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+        self._meta_stat = self._stat_meta()
+        meta = self._read_meta()
+        self._documents_bytes = 0
+        count = 0
+        self.version = meta.get('version', 0) if meta else 0
+        # Bumped whenever every vector is replaced, so derived copies know to start over
+        self.generation = meta.get('generation', 0) if meta else 0
+
+        if meta and meta.get('format_version') == self.FORMAT_VERSION:
+            self._documents_bytes = meta['documents_bytes']
+            count = meta['count']
+        self.documents = DocumentFile(self._file(self.DOCUMENTS_FILE), self._documents_bytes, count,
+                                      self._file(self.OFFSETS_FILE))
+
+        # Stored vectors are only reusable if they came from the same model
+        compatible = (bool(meta) and meta.get('model_name') == model_name
+                      and meta.get('dim') == dim and meta.get('normalized', False))
+        self.needs_reencode = bool(self.documents) and not compatible
+
+        if not compatible and os.path.exists(self._file(self.MATRIX_FILE)):
+            os.remove(self._file(self.MATRIX_FILE))
+
+        self.embeddings = GrowableMatrix(
+            dim,
+            path=self._file(self.MATRIX_FILE),
+            count=len(self.documents) if compatible else 0
+        )
+        if self.compact is not None:
+            self.compact.sync(self.embeddings.view(), self.generation)
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _read_meta(self) -> Optional[Dict]:
+        try:
+            with open(self._file(self.META_FILE)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _stat_meta(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self._file(self.META_FILE))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def changed_on_disk(self) -> bool:
+        """Whether another process committed since this one last looked (one ``stat`` call)"""
+        return self._stat_meta() != self._meta_stat
+
+    def refresh(self) -> bool:
+        """Adopt documents committed by other processes; returns whether there were any"""
+        with self._lock:
+            self._meta_stat = self._stat_meta()
+            meta = self._read_meta()
+            if not meta or meta.get('version', 0) == self.version:
+                return False
+            self.documents.extend_to(meta['documents_bytes'], meta['count'])
+            if self.compact is not None:
+                self.compact.refresh()
+            self.embeddings.refresh(meta['count'])
+            self._documents_bytes = meta['documents_bytes']
+            self.version = meta['version']
+            return True
+
+    def _commit(self) -> None:
+        self.embeddings.flush()
+        self.documents.flush()
+        self.version += 1
+        meta = {
+            'format_version': self.FORMAT_VERSION,
+            'model_name': self.model_name,
+            'dim': self.dim,
+            'normalized': True,
+            'count': len(self.documents),
+            'documents_bytes': self._documents_bytes,
+            'version': self.version,
+            'generation': self.generation,
+        }
+        tmp_path = self._file(self.META_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._file(self.META_FILE))
+        self._meta_stat = self._stat_meta()
+
+    def add(self, documents: List[Dict], vectors: np.ndarray) -> range:
+        """Persist new documents with their unit-normalized vectors and return their row range"""
+        with self._lock:
+            self._documents_bytes = self.documents.append(documents)
+            vectors = normalize_rows(vectors)
+            if self.compact is not None:
+                self.compact.add(vectors)
+            rows = self.embeddings.append(vectors)
+            self._commit()
+            return rows
+
+    def rebuild(self, vectors: np.ndarray) -> None:
+        """Replace every stored vector, e.g. after the embedding model changed"""
+        with self._lock:
+            os.remove(self._file(self.MATRIX_FILE))
+            self.embeddings = GrowableMatrix(self.dim, path=self._file(self.MATRIX_FILE))
+            self.embeddings.append(normalize_rows(vectors))
+            self.needs_reencode = False
+            self.generation += 1
+            if self.compact is not None:
+                self.compact.sync(self.embeddings.view(), self.generation)
+            self._commit()
+
+    def compact_view(self, count: int):
+        """The first ``count`` rows of the quantized copy, or None without one"""
+        return self.compact.view(count) if self.compact is not None else None
@@ -5,6 +5,7 @@ import plotly.graph_objects as go
 import plotly.express as px
 from plotly.subplots import make_subplots
 import json
+import time
 
 # Configure Streamlit page
 st.set_page_config(
@@ -119,8 +120,26 @@ def upload_document(uploaded_file):
         files = {"file": (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)}
         response = requests.post(f"{API_BASE_URL}/upload", files=files)
         
-        if response.status_code == 200:
-            st.success(f"✅ Document '{uploaded_file.name}' uploaded successfully!")
+        if response.status_code == 202:
+            job_id = response.json()["job_id"]
+            st.info(f"⏳ Document '{uploaded_file.name}' queued for indexing (job {job_id})")
+            
+            # Indexing runs in the background; follow the job for a while
+            with st.spinner("Indexing document..."):
+                for _ in range(120):
+                    job = requests.get(f"{API_BASE_URL}/jobs/{job_id}").json()
+                    if job["status"] in ("done", "failed"):
+                        break
+                    time.sleep(0.5)
+            
+            if job["status"] == "done":
+                st.success(f"✅ Document '{uploaded_file.name}' uploaded successfully!")
+            elif job["status"] == "failed":
+                st.error(f"❌ Error indexing document: {job['error']}")
+            else:
+                st.info(f"⏳ Still indexing ({job['status']}); check GET /jobs/{job_id}")
+        elif response.status_code == 429:
+            st.warning("⚠️ The ingestion queue is full, please retry shortly")
         else:
             st.error(f"❌ Error uploading document: {response.text}")
     except Exception as e:
@@ -146,18 +165,19 @@ def search_and_compare(query, top_k):
         st.error(f"❌ Error connecting to backend: {str(e)}")
 
 def display_comparison_results(results):
-    """Display search results in 4-column comparison format"""
+    """Display search results in 5-column comparison format"""
     
     st.subheader(f"🔍 Search Results for: '{results['query']}'")
     
-    # Create 4 columns for comparison
-    col1, col2, col3, col4 = st.columns(4)
+    # Create 5 columns for comparison
+    col1, col2, col3, col4, col5 = st.columns(5)
     
     methods = [
         ("Cosine Similarity", "cosine_results", col1, "#1f77b4"),
         ("Euclidean Distance", "euclidean_results", col2, "#ff7f0e"), 
         ("MMR (Diversity)", "mmr_results", col3, "#2ca02c"),
-        ("Hybrid (0.6×Cosine + 0.4×Entity)", "hybrid_results", col4, "#d62728")
+        ("Hybrid (0.6×Cosine + 0.4×Entity)", "hybrid_results", col4, "#d62728"),
+        ("BM25 (Lexical)", "bm25_results", col5, "#9467bd")
     ]
     
     # Display results for each method
@@ -166,7 +186,7 @@ def display_comparison_results(results):
             st.markdown(f'<div class="method-header" style="color: {color};">{method_name}</div>', 
                        unsafe_allow_html=True)
             
-            method_results = results[result_key]
+            method_results = results.get(result_key, [])
             
             for i, result in enumerate(method_results, 1):
                 st.markdown(f"""
@@ -176,7 +196,7 @@ def display_comparison_results(results):
                         <span class="score-badge">Score: {result['score']:.3f}</span>
                     </div>
                     <h4 style="margin: 0.5rem 0; color: {color};">{result['title']}</h4>
-                    <p style="margin: 0; font-size: 0.9rem; color: #666;">{result['content'][:200]}...</p>
+                    <p style="margin: 0; font-size: 0.9rem; color: #666;">{(result.get('passage') or result['content'])[:200]}...</p>
                 </div>
                 """, unsafe_allow_html=True)
     
@@ -192,7 +212,7 @@ def display_metrics(metrics):
     """Display performance metrics with visualizations"""
     
     # Create metrics dataframe
-    methods = ['cosine', 'euclidean', 'mmr', 'hybrid']
+    methods = ['cosine', 'euclidean', 'mmr', 'hybrid', 'bm25']
     metric_types = ['precision', 'recall', 'diversity']
     
     metrics_data = []
@@ -217,7 +237,7 @@ def display_metrics(metrics):
         # Create radar chart
         fig = go.Figure()
         
-        colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728']
+        colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd']
         
         for i, method in enumerate(methods):
             values = [metrics.get(f"{method}_{metric}", 0) for metric in metric_types]
@@ -247,8 +267,8 @@ def display_detailed_analysis(results):
     """Display detailed analysis with charts"""
     
     # Score comparison chart
-    methods = ['cosine', 'euclidean', 'mmr', 'hybrid']
-    colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728']
+    methods = ['cosine', 'euclidean', 'mmr', 'hybrid', 'bm25']
+    colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd']
     
     fig = make_subplots(
         rows=2, cols=2,
@@ -260,7 +280,7 @@ def display_detailed_analysis(results):
     # Score distribution
     for i, method in enumerate(methods):
         result_key = f"{method}_results"
-        scores = [result['score'] for result in results[result_key]]
+        scores = [result['score'] for result in results.get(result_key, [])]
         
         fig.add_trace(
             go.Bar(
@@ -279,7 +299,7 @@ def display_detailed_analysis(results):
     
     for method in methods:
         result_key = f"{method}_results"
-        doc_ids = [result['document_id'] for result in results[result_key]]
+        doc_ids = [result['document_id'] for result in results.get(result_key, [])]
         method_docs[method] = set(doc_ids)
         all_docs.update(doc_ids)
     
@@ -319,11 +339,11 @@ def display_detailed_analysis(results):
     # Score trends (top 3 documents)
     for i, method in enumerate(methods):
         result_key = f"{method}_results"
-        scores = [result['score'] for result in results[result_key][:3]]
+        scores = [result['score'] for result in results.get(result_key, [])[:3]]
         
         fig.add_trace(
             go.Scatter(
-                x=[1, 2, 3],
+                x=list(range(1, len(scores) + 1)),
                 y=scores,
                 mode='lines+markers',
                 name=method.title(),
@@ -365,6 +385,7 @@ def display_detailed_analysis(results):
     - Use **Hybrid Method** for legal-specific queries with entity matching
     - Use **MMR** when you need diverse results to avoid redundancy
     - Use **Euclidean Distance** for geometric similarity in embedding space
+    - Use **BM25** for exact terms such as section numbers (e.g. "80C")
     """
     
     st.markdown(recommendations)